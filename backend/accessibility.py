@@ -0,0 +1,317 @@
+# accessibility.py - Vectorized SCM-G2SFCA accessibility engine
+import asyncio
+import math
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Optional, Dict, Any, List
+
+import asyncpg
+import numpy as np
+
+from queries import registry
+from regions import default_region, region_directory
+from snapshot import classify_accessibility
+
+# Multi-modal transport: catchment threshold, share of trips and straight-line travel speed
+TRANSPORT_MODES = {
+    "walking": {"threshold_minutes": 30.0, "weight": 0.7, "speed_kmh": 5.0},
+    "animals": {"threshold_minutes": 45.0, "weight": 0.2, "speed_kmh": 4.0},
+    "driving": {"threshold_minutes": 60.0, "weight": 0.1, "speed_kmh": 30.0},
+}
+
+# Straight-line distances understate path length; applied when no terrain matrix is available
+DETOUR_FACTOR = 1.25
+EARTH_RADIUS_KM = 6371.0088
+# Demand rows processed per block when building travel-time matrices (bounds peak memory)
+PAIR_BLOCK_CELLS = 4_000_000
+# Demand points generated per sublocation when no demand_points table is populated
+FALLBACK_POINTS_PER_SUBLOCATION = 25
+
+SUPPLY_POINTS_SQL = """
+    SELECT
+        id,
+        ST_X(ST_Transform(geom, 4326)) as lon,
+        ST_Y(ST_Transform(geom, 4326)) as lat,
+        COALESCE(capacitysc, 1) as capacity
+    FROM waterpoints
+    WHERE region_id = $1 AND geom IS NOT NULL
+    ORDER BY id
+"""
+
+DEMAND_POINTS_SQL = """
+    SELECT
+        sublocation_name,
+        population::float8 as population,
+        ST_X(ST_Transform(geom, 4326)) as lon,
+        ST_Y(ST_Transform(geom, 4326)) as lat
+    FROM demand_points
+    WHERE region_id = $1 AND geom IS NOT NULL AND population > 0
+    ORDER BY sublocation_name, id
+"""
+
+# Spread each sublocation's population evenly over deterministic points inside its boundary
+GENERATED_DEMAND_POINTS_SQL = """
+    WITH populations AS (
+        SELECT sublocation_name, MAX(total_population) as population
+        FROM sublocation_statistics
+        WHERE region_id = $1
+        GROUP BY sublocation_name
+    ),
+    shapes AS (
+        SELECT slname, ST_Transform(ST_Union(geom), 4326) as geom
+        FROM sublocations
+        WHERE region_id = $1 AND geom IS NOT NULL AND slname IS NOT NULL
+        GROUP BY slname
+    )
+    SELECT
+        s.slname as sublocation_name,
+        COALESCE(p.population, 0)::float8 / $2 as population,
+        ST_X(points.geom) as lon,
+        ST_Y(points.geom) as lat
+    FROM shapes s
+    LEFT JOIN populations p ON p.sublocation_name = s.slname
+    CROSS JOIN LATERAL ST_Dump(ST_GeneratePoints(s.geom, $2, 42)) points
+    ORDER BY s.slname
+"""
+
+registry.register("supply_points", SUPPLY_POINTS_SQL)
+registry.register("demand_points_exists", "SELECT to_regclass('demand_points') IS NOT NULL")
+registry.register("demand_points", DEMAND_POINTS_SQL)
+registry.register("generated_demand_points", GENERATED_DEMAND_POINTS_SQL)
+
+
+@dataclass
+class DemandPoints:
+    lon: np.ndarray
+    lat: np.ndarray
+    population: np.ndarray
+    sublocation: np.ndarray
+    sublocation_names: List[str]
+
+    def __len__(self) -> int:
+        return len(self.population)
+
+
+@dataclass
+class SupplyPoints:
+    ids: np.ndarray
+    lon: np.ndarray
+    lat: np.ndarray
+    capacity: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.capacity)
+
+
+@dataclass
+class CatchmentPairs:
+    """Sparse travel-time matrix for one mode: only demand/supply pairs inside the catchment"""
+    demand: np.ndarray
+    supply: np.ndarray
+    minutes: np.ndarray
+    decay: np.ndarray
+
+
+@dataclass
+class AccessibilityResult:
+    """Per-demand-point scores by mode, combined scores and sublocation rollups"""
+    by_mode: Dict[str, np.ndarray]
+    combined: np.ndarray
+    score: np.ndarray
+    reference: float
+    sublocations: List[Dict[str, Any]] = field(default_factory=list)
+    compute_ms: float = 0.0
+
+
+def gaussian_decay(minutes: np.ndarray, threshold: float) -> np.ndarray:
+    """Normalized Gaussian distance decay: 1 at zero travel time, 0 at the catchment threshold"""
+    edge = math.exp(-0.5)
+    decay = (np.exp(-0.5 * (minutes / threshold) ** 2) - edge) / (1.0 - edge)
+    return np.where(minutes <= threshold, decay, 0.0)
+
+
+def haversine_km(lon1: np.ndarray, lat1: np.ndarray, lon2: np.ndarray, lat2: np.ndarray) -> np.ndarray:
+    """Great-circle distance; inputs broadcast against each other"""
+    lon1, lat1, lon2, lat2 = (np.radians(values) for values in (lon1, lat1, lon2, lat2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def straight_line_pairs(demand: DemandPoints, supply: SupplyPoints,
+                        modes: Dict[str, Dict[str, float]] = TRANSPORT_MODES,
+                        supply_offset: int = 0,
+                        detour_factors: Optional[Dict[str, float]] = None) -> Dict[str, CatchmentPairs]:
+    """Build per-mode catchment pairs from straight-line travel times, in demand blocks.
+
+    ``detour_factors`` overrides DETOUR_FACTOR per mode, e.g. with ratios
+    calibrated against terrain travel times.
+    """
+    detour_factors = detour_factors or {}
+    collected = {mode: ([], [], []) for mode in modes}
+    if len(demand) and len(supply):
+        block = max(1, PAIR_BLOCK_CELLS // len(supply))
+        for start in range(0, len(demand), block):
+            stop = min(start + block, len(demand))
+            distance = haversine_km(demand.lon[start:stop, None], demand.lat[start:stop, None],
+                                    supply.lon[None, :], supply.lat[None, :])
+            for mode, params in modes.items():
+                minutes = distance * (detour_factors.get(mode, DETOUR_FACTOR) * 60.0 / params["speed_kmh"])
+                rows, cols = np.nonzero(minutes < params["threshold_minutes"])
+                collected[mode][0].append(rows + start)
+                collected[mode][1].append(cols + supply_offset)
+                collected[mode][2].append(minutes[rows, cols])
+
+    return {mode: make_pairs(*(np.concatenate(parts) if parts else np.empty(0) for parts in collected[mode]),
+                             threshold=modes[mode]["threshold_minutes"])
+            for mode in modes}
+
+
+def make_pairs(demand: np.ndarray, supply: np.ndarray, minutes: np.ndarray, threshold: float) -> CatchmentPairs:
+    """Wrap raw pair arrays, dropping pairs whose decay weight is zero"""
+    decay = gaussian_decay(minutes.astype(np.float64), threshold)
+    keep = decay > 0
+    return CatchmentPairs(
+        demand=demand[keep].astype(np.int32),
+        supply=supply[keep].astype(np.int32),
+        minutes=minutes[keep].astype(np.float32),
+        decay=decay[keep],
+    )
+
+
+def mode_accessibility(pairs: CatchmentPairs, capacity: np.ndarray, population: np.ndarray) -> np.ndarray:
+    """Supply-competition two-step floating catchment scores for one transport mode.
+
+    Each demand point i picks supply j with Huff probability
+    P_ij = S_j G_ij / sum_k S_k G_ik. Step one gives each supply a
+    supply-to-demand ratio R_j = S_j / sum_i P_ij D_i G_ij; step two sums
+    A_i = sum_j P_ij R_j G_ij over the catchment.
+    """
+    n_demand, n_supply = len(population), len(capacity)
+    attraction = capacity[pairs.supply] * pairs.decay
+    totals = np.bincount(pairs.demand, weights=attraction, minlength=n_demand)
+    probability = np.divide(attraction, totals[pairs.demand], out=np.zeros(len(attraction)),
+                            where=totals[pairs.demand] > 0)
+
+    load = np.bincount(pairs.supply, weights=probability * population[pairs.demand] * pairs.decay, minlength=n_supply)
+    ratio = np.divide(capacity, load, out=np.zeros(n_supply), where=load > 0)
+
+    return np.bincount(pairs.demand, weights=probability * ratio[pairs.supply] * pairs.decay, minlength=n_demand)
+
+
+class AccessibilityEngine:
+    """In-process SCM-G2SFCA engine over water points and population demand points.
+
+    Travel times are held per mode as sparse catchment matrices: terrain
+    matrices precomputed by terrain.py when available, straight-line
+    otherwise. Combined scores are the mode-weighted sum, expressed relative
+    to the baseline population-weighted mean so that 1.0 means "county
+    average" - the same scale as avg_combined_accessibility.
+    """
+
+    def __init__(self, demand: DemandPoints, supply: SupplyPoints,
+                 pairs: Optional[Dict[str, CatchmentPairs]] = None,
+                 modes: Dict[str, Dict[str, float]] = TRANSPORT_MODES,
+                 detour_factors: Optional[Dict[str, float]] = None):
+        self.demand = demand
+        self.supply = supply
+        self.modes = modes
+        self.detour_factors = detour_factors
+        self.pairs = pairs if pairs is not None else straight_line_pairs(demand, supply, modes)
+        self.reference: Optional[float] = None
+
+    def compute(self) -> AccessibilityResult:
+        started = time.perf_counter()
+        population = self.demand.population
+        by_mode = {
+            mode: mode_accessibility(self.pairs[mode], self.supply.capacity, population)
+            for mode in self.modes
+        }
+        combined = sum(self.modes[mode]["weight"] * scores for mode, scores in by_mode.items())
+
+        if self.reference is None:
+            # Baseline reference stays fixed so scenarios are comparable with it
+            total = population.sum()
+            self.reference = float((combined * population).sum() / total) if total > 0 else 1.0
+        score = combined / self.reference if self.reference > 0 else combined
+
+        result = AccessibilityResult(by_mode=by_mode, combined=combined, score=score, reference=self.reference)
+        result.sublocations = self.aggregate(score)
+        result.compute_ms = (time.perf_counter() - started) * 1000
+        return result
+
+    def aggregate(self, score: np.ndarray) -> List[Dict[str, Any]]:
+        """Population-weighted score per sublocation"""
+        names = self.demand.sublocation_names
+        population = np.bincount(self.demand.sublocation, weights=self.demand.population, minlength=len(names))
+        weighted = np.bincount(self.demand.sublocation, weights=score * self.demand.population, minlength=len(names))
+        accessibility = np.divide(weighted, population, out=np.zeros(len(names)), where=population > 0)
+        return [
+            {
+                "sublocation_name": name,
+                "population": int(round(population[index])),
+                "accessibility": round(float(accessibility[index]), 4),
+                "category": classify_accessibility(float(accessibility[index])),
+            }
+            for index, name in enumerate(names)
+        ]
+
+    def pairs_for_new_supply(self, lon: np.ndarray, lat: np.ndarray) -> Dict[str, CatchmentPairs]:
+        """Catchment pairs for hypothetical water points, indexed after the existing supply"""
+        candidates = SupplyPoints(ids=np.full(len(lon), -1, dtype=np.int64), lon=lon, lat=lat,
+                                  capacity=np.ones(len(lon)))
+        return straight_line_pairs(self.demand, candidates, self.modes, supply_offset=len(self.supply),
+                                   detour_factors=self.detour_factors)
+
+    @classmethod
+    async def load(cls, conn: asyncpg.Connection, region_id: Optional[str] = None,
+                   travel_time_dir: Optional[str] = None) -> "AccessibilityEngine":
+        """Build an engine from one region's water points and population demand points.
+
+        Precomputed terrain travel times in ``travel_time_dir/<region_id>``
+        (default: TRAVEL_TIME_DIR) are used when they were built for the same points.
+        """
+        from terrain import load_travel_times
+
+        region_id = region_id or default_region()
+        travel_time_dir = travel_time_dir or os.getenv("TRAVEL_TIME_DIR")
+        supply = await load_supply_points(conn, region_id)
+        demand = await load_demand_points(conn, region_id)
+        stored = await asyncio.to_thread(load_travel_times, region_directory(travel_time_dir, region_id), demand, supply)
+        if stored is not None:
+            pairs, factors = stored
+            return cls(demand, supply, pairs=pairs, detour_factors=factors)
+        # Travel-time matrices are built off the event loop
+        return await asyncio.to_thread(cls, demand, supply)
+
+
+async def load_supply_points(conn: asyncpg.Connection, region_id: Optional[str] = None) -> SupplyPoints:
+    """Water points with their capacity scores, ordered by id"""
+    rows = await registry.fetch(conn, "supply_points", region_id or default_region())
+    return SupplyPoints(
+        ids=np.array([row['id'] for row in rows], dtype=np.int64),
+        lon=np.array([row['lon'] for row in rows], dtype=np.float64),
+        lat=np.array([row['lat'] for row in rows], dtype=np.float64),
+        capacity=np.array([row['capacity'] for row in rows], dtype=np.float64),
+    )
+
+
+async def load_demand_points(conn: asyncpg.Connection, region_id: Optional[str] = None) -> DemandPoints:
+    """Population demand points, from demand_points or generated inside each sublocation"""
+    region_id = region_id or default_region()
+    has_table = await registry.fetchval(conn, "demand_points_exists")
+    rows = []
+    if has_table:
+        rows = await registry.fetch(conn, "demand_points", region_id)
+    if not rows:
+        rows = await registry.fetch(conn, "generated_demand_points", region_id, FALLBACK_POINTS_PER_SUBLOCATION)
+
+    names = sorted({row['sublocation_name'] for row in rows})
+    index = {name: position for position, name in enumerate(names)}
+    return DemandPoints(
+        lon=np.array([row['lon'] for row in rows], dtype=np.float64),
+        lat=np.array([row['lat'] for row in rows], dtype=np.float64),
+        population=np.array([row['population'] for row in rows], dtype=np.float64),
+        sublocation=np.array([index[row['sublocation_name']] for row in rows], dtype=np.int32),
+        sublocation_names=names,
+    )
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Prompt-size benchmark: full vs query-aware context over the queries in extended_queries.json
+
+    python benchmark_context.py            # estimated prompt tokens and context selection time
+    python benchmark_context.py --live     # also call Claude once per query in each mode (billed)
+
+With prompt caching on (PROMPT_CACHE_ENABLED), --live latencies after the first query include cache hits.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+from typing import List, Dict, Any
+
+from context_builder import ContextBuilder, estimate_tokens
+from main import HydroGPTService
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_queries(names: List[str]) -> List[str]:
+    """Every query in extended_queries.json with {area} placeholders filled from real sublocations"""
+    with open(os.path.join(BASE_DIR, "extended_queries.json")) as f:
+        extended = json.load(f)["extended_query_database"]
+
+    first, second = names[0], names[-1]
+    queries = []
+    for entries in extended.values():
+        if isinstance(entries, dict):
+            entries = [query for variants in entries.values() for query in variants]
+        for entry in entries:
+            query = entry["query"] if isinstance(entry, dict) else entry
+            queries.append(query.replace("{area1}", first).replace("{area2}", second).replace("{area}", first))
+    return queries
+
+
+def request_tokens(request: Dict[str, Any]) -> int:
+    """Estimated input tokens of a Claude request (system blocks plus messages)"""
+    text = "".join(block["text"] for block in request["system"])
+    return estimate_tokens(text + "".join(message["content"] for message in request["messages"]))
+
+
+async def call_claude(service: HydroGPTService, request: Dict[str, Any]) -> Dict[str, Any]:
+    started = time.perf_counter()
+    response = await service.claude_client.messages.create(**request)
+    return {
+        "seconds": time.perf_counter() - started,
+        "input_tokens": response.usage.input_tokens,
+        "cache_read_tokens": response.usage.cache_read_input_tokens or 0,
+        "cache_creation_tokens": response.usage.cache_creation_input_tokens or 0,
+        "output_tokens": response.usage.output_tokens,
+    }
+
+
+def summarize(label: str, values: List[float], unit: str = ""):
+    if values:
+        print(f"  {label:<28} mean {statistics.mean(values):>9.1f}{unit}  p50 {statistics.median(values):>9.1f}{unit}  total {sum(values):>10.1f}{unit}")
+
+
+async def benchmark(live: bool):
+    print("📏 HydroGPT context benchmark")
+    print("=" * 40)
+
+    service = HydroGPTService()
+    await service.init_db()
+    if not service.db_pool or service.snapshots.snapshot is None:
+        print("❌ A database with sublocation statistics is required")
+        return
+    if live:
+        await service.init_claude()
+        if not service.claude_client:
+            return
+
+    snapshot = await service.snapshots.get()
+    builders = {"full": ContextBuilder(mode="full"), "query": ContextBuilder(mode="query")}
+    queries = load_queries([area["sublocation_name"] for area in snapshot.sublocations])
+    results = {mode: [] for mode in builders}
+
+    print(f"\n{len(queries)} queries, {len(snapshot.sublocations)} sublocations, snapshot {snapshot.version}\n")
+    print(f"{'full':>7} {'query':>7} {'rows':>5} {'select µs':>10}  routed  query")
+    for query in queries:
+        routed = bool(service.intent_router and service.intent_router.route(query, snapshot))
+        line = {}
+        for mode, builder in builders.items():
+            started = time.perf_counter()
+            selection = builder.select(query, snapshot)
+            elapsed = time.perf_counter() - started
+            request = service.build_request(query, selection)
+            result = {"prompt_tokens": request_tokens(request), "rows": len(selection.rows), "select_us": elapsed * 1e6}
+            if live:
+                result.update(await call_claude(service, request))
+            results[mode].append(result)
+            line[mode] = result
+        print(f"{line['full']['prompt_tokens']:>7} {line['query']['prompt_tokens']:>7} {line['query']['rows']:>5} "
+              f"{line['query']['select_us']:>10.1f}  {'yes' if routed else 'no':<6}  {query}")
+
+    for mode, rows in results.items():
+        print(f"\n{mode} context:")
+        summarize("estimated prompt tokens", [row["prompt_tokens"] for row in rows])
+        summarize("context selection", [row["select_us"] for row in rows], "µs")
+        if live:
+            summarize("input tokens (API, uncached)", [row["input_tokens"] for row in rows])
+            summarize("cache read tokens", [row["cache_read_tokens"] for row in rows])
+            summarize("cache write tokens", [row["cache_creation_tokens"] for row in rows])
+            summarize("output tokens (API)", [row["output_tokens"] for row in rows])
+            summarize("latency", [row["seconds"] * 1000 for row in rows], "ms")
+
+    full = sum(row["prompt_tokens"] for row in results["full"])
+    selected = sum(row["prompt_tokens"] for row in results["query"])
+    print(f"\n✅ Estimated prompt tokens reduced by {100.0 * (full - selected) / full:.1f}% ({full:,} -> {selected:,})")
+    await service.close()
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Compare full and query-aware LLM context sizes")
+    parser.add_argument("--live", action="store_true", help="Call Claude for every query in both modes")
+    args = parser.parse_args()
+    asyncio.run(benchmark(args.live))
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Load benchmark for /api/query, /api/default-map-data and /api/water-points
+
+    # Against a running backend (point it at fake_anthropic.py to avoid billed calls)
+    python benchmark_load.py --base-url http://localhost:8000 --concurrency 1,8,32
+
+    # Self-contained: applies database/init.sql to DATABASE_URL, starts the fake Anthropic
+    # server and a backend on free ports, runs the load and stops both
+    python benchmark_load.py --serve --init-db --llm-latency-ms 800 --output results.json
+
+    # Same, at 10x today's size (replaces the data with generate_data.py output)
+    python benchmark_load.py --serve --init-db --generate-scale 10
+
+    # Synthetic county in its own region, leaving the real data untouched
+    python benchmark_load.py --serve --generate-scale 10 --region synthetic_10x
+
+Each endpoint is driven at each concurrency level by that many workers sharing a fixed,
+seeded request list, so two runs against the same data send the same requests. Results
+(throughput, latency percentiles, status counts) are printed as JSON.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from typing import List, Dict, Any, Optional, Tuple
+
+import asyncpg
+import httpx
+
+from benchmark_context import load_queries
+from generate_data import BASE_SUBLOCATIONS, WATER_POINTS_PER_SUBLOCATION, generate, load
+from regions import default_region
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+INIT_SQL = os.path.join(BASE_DIR, "..", "database", "init.sql")
+ENDPOINTS = ("query", "default-map-data", "water-points")
+# Mbeere South (minLon, minLat, maxLon, maxLat); viewports are drawn inside it
+DEFAULT_EXTENT = (37.35, -0.95, 37.95, -0.45)
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def summarize(latencies: List[float], statuses: Dict[str, int], elapsed: float) -> Dict[str, Any]:
+    values = sorted(latency * 1000 for latency in latencies)
+    return {
+        "requests": len(values),
+        "errors": sum(count for status, count in statuses.items() if not status.startswith("2")),
+        "statuses": statuses,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(len(values) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "mean": round(sum(values) / len(values), 2) if values else 0.0,
+            "p50": round(percentile(values, 0.50), 2),
+            "p90": round(percentile(values, 0.90), 2),
+            "p95": round(percentile(values, 0.95), 2),
+            "p99": round(percentile(values, 0.99), 2),
+            "max": round(values[-1], 2) if values else 0.0,
+        },
+    }
+
+
+def viewport(rng: random.Random, extent: Tuple[float, float, float, float]) -> Tuple[str, int]:
+    """Random bbox inside the study area at a zoom that matches its size"""
+    min_lon, min_lat, max_lon, max_lat = extent
+    zoom = rng.choice((9, 10, 11, 12, 13, 14))
+    span = 360.0 / 2 ** zoom * 2
+    lon = rng.uniform(min_lon, max(min_lon, max_lon - span))
+    lat = rng.uniform(min_lat, max(min_lat, max_lat - span))
+    return f"{lon:.5f},{lat:.5f},{lon + span:.5f},{lat + span:.5f}", zoom
+
+
+def build_requests(endpoint: str, count: int, rng: random.Random, queries: List[str],
+                   extent: Tuple[float, float, float, float],
+                   region: Optional[str] = None) -> List[Tuple[str, str, Optional[Dict[str, Any]]]]:
+    """(method, path, json body) for ``count`` requests against one endpoint"""
+    region = region or default_region()
+    requests = []
+    for index in range(count):
+        if endpoint == "query":
+            requests.append(("POST", "/api/query", {"query": queries[index % len(queries)], "region": region}))
+        elif endpoint == "default-map-data":
+            requests.append(("GET", f"/api/default-map-data?region={region}", None))
+        elif index % 4 == 0:
+            # Unfiltered requests hit the per-version payload cache; the rest are viewport queries
+            requests.append(("GET", f"/api/water-points?region={region}", None))
+        else:
+            bbox, zoom = viewport(rng, extent)
+            requests.append(("GET", f"/api/water-points?region={region}&bbox={bbox}&zoom={zoom}", None))
+    return requests
+
+
+async def run_level(client: httpx.AsyncClient, requests: List[Tuple[str, str, Optional[Dict[str, Any]]]],
+                    concurrency: int) -> Dict[str, Any]:
+    pending = list(reversed(requests))
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+
+    async def worker():
+        while pending:
+            method, path, body = pending.pop()
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=body)
+                # Endpoints report some failures as {"error": ...} with a 200
+                failed = response.status_code == 200 and response.content[:9] == b'{"error":'
+                status = "error_body" if failed else str(response.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, statuses, time.perf_counter() - started)
+
+
+async def sublocation_names(client: httpx.AsyncClient, region: Optional[str] = None) -> List[str]:
+    response = await client.get("/api/default-map-data", params={"region": region or default_region()})
+    features = response.json().get("features") or []
+    names = [feature["properties"].get("name") for feature in features]
+    return [name for name in names if name] or ["MAKIMA", "KARABA"]
+
+
+async def init_db(database_url: str):
+    """Apply database/init.sql (idempotent) so a fresh PostGIS has the schema and sample rows"""
+    with open(INIT_SQL) as f:
+        script = f.read()
+    conn = await asyncpg.connect(database_url)
+    try:
+        await conn.execute(script)
+    finally:
+        await conn.close()
+    print(f"✅ Applied {os.path.relpath(INIT_SQL)}", file=sys.stderr)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def wait_ready(url: str, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(url)).status_code < 500:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.25)
+    raise RuntimeError(f"{url} did not become ready within {timeout:.0f}s")
+
+
+async def start_servers(args) -> Tuple[str, List[subprocess.Popen]]:
+    """Fake Anthropic server plus a backend that talks to it; returns the backend URL"""
+    llm_port, api_port = free_port(), free_port()
+    fake = subprocess.Popen(
+        [sys.executable, "fake_anthropic.py", "--port", str(llm_port), "--latency-ms", str(args.llm_latency_ms),
+         "--tokens-per-second", str(args.llm_tokens_per_second), "--output-tokens", str(args.llm_output_tokens)],
+        cwd=BASE_DIR
+    )
+    env = dict(os.environ, ANTHROPIC_BASE_URL=f"http://127.0.0.1:{llm_port}", ANTHROPIC_API_KEY="fake")
+    if args.no_response_cache:
+        env["RESPONSE_CACHE_ENABLED"] = "false"
+    backend = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(api_port),
+         "--workers", str(args.workers), "--log-level", "warning"],
+        cwd=BASE_DIR, env=env
+    )
+    processes = [fake, backend]
+    try:
+        await wait_ready(f"http://127.0.0.1:{llm_port}/stats")
+        await wait_ready(f"http://127.0.0.1:{api_port}/health")
+    except Exception:
+        stop_servers(processes)
+        raise
+    return f"http://127.0.0.1:{api_port}", processes
+
+
+def stop_servers(processes: List[subprocess.Popen]):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+async def benchmark(args) -> Dict[str, Any]:
+    if args.init_db:
+        await init_db(os.environ["DATABASE_URL"])
+    extent = tuple(float(value) for value in args.extent.split(",")) if args.extent else DEFAULT_EXTENT
+    if args.generate_scale:
+        sublocations = BASE_SUBLOCATIONS * args.generate_scale
+        data = generate(sublocations, sublocations * WATER_POINTS_PER_SUBLOCATION, 0, 40, args.seed)
+        conn = await asyncpg.connect(os.environ["DATABASE_URL"])
+        try:
+            await load(conn, data, replace=True, region_id=args.region)
+        finally:
+            await conn.close()
+        extent = extent if args.extent else data["extent"]
+        print(f"✅ Loaded {sublocations:,} synthetic sublocations into region '{args.region}'", file=sys.stderr)
+
+    processes: List[subprocess.Popen] = []
+    base_url = args.base_url
+    if args.serve:
+        base_url, processes = await start_servers(args)
+
+    levels = [int(level) for level in args.concurrency.split(",")]
+    endpoints = args.endpoints.split(",")
+    results: Dict[str, Any] = {
+        "base_url": base_url,
+        "requests_per_level": args.requests,
+        "seed": args.seed,
+        "generate_scale": args.generate_scale,
+        "region": args.region,
+        "llm": {"latency_ms": args.llm_latency_ms, "tokens_per_second": args.llm_tokens_per_second} if args.serve else None,
+        "endpoints": {},
+    }
+
+    limits = httpx.Limits(max_connections=max(levels), max_keepalive_connections=max(levels))
+    try:
+        async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+            queries = load_queries(await sublocation_names(client, args.region))
+            for endpoint in endpoints:
+                results["endpoints"][endpoint] = {}
+                for concurrency in levels:
+                    # Same seed per level: every level replays the same request sequence
+                    rng = random.Random(args.seed)
+                    requests = build_requests(endpoint, args.requests, rng, queries, extent, args.region)
+                    if args.warmup:
+                        await run_level(client, requests[:args.warmup], min(concurrency, args.warmup))
+                    result = await run_level(client, requests, concurrency)
+                    results["endpoints"][endpoint][str(concurrency)] = result
+                    print(f"📊 {endpoint:<17} c={concurrency:<4} {result['throughput_rps']:>9.1f} req/s  "
+                          f"p50 {result['latency_ms']['p50']:>8.1f}ms  p95 {result['latency_ms']['p95']:>8.1f}ms  "
+                          f"errors {result['errors']}", file=sys.stderr)
+            results["server_metrics"] = (await client.get("/")).json()
+    finally:
+        stop_servers(processes)
+    return results
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Throughput and latency percentiles for the HydroGPT API")
+    parser.add_argument("--base-url", default="http://localhost:8000", help="Backend to load (ignored with --serve)")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS), help=f"Comma-separated subset of {', '.join(ENDPOINTS)}")
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per endpoint and concurrency level")
+    parser.add_argument("--warmup", type=int, default=10, help="Unmeasured requests before each level")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--extent", default=None, help="minLon,minLat,maxLon,maxLat for water point viewports")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--output", default=None, help="Write the JSON report here instead of stdout")
+    parser.add_argument("--init-db", action="store_true", help="Apply database/init.sql to DATABASE_URL first")
+    parser.add_argument("--generate-scale", type=int, default=0,
+                        help="Replace --region's data with a synthetic county this many times today's size")
+    parser.add_argument("--region", default=default_region(), help="Region every request is sent for")
+    parser.add_argument("--serve", action="store_true", help="Start the fake Anthropic server and a backend")
+    parser.add_argument("--workers", type=int, default=1, help="Backend worker processes with --serve")
+    parser.add_argument("--llm-latency-ms", type=float, default=800, help="Fake Anthropic time to first token")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=0, help="Fake Anthropic output pacing")
+    parser.add_argument("--llm-output-tokens", type=int, default=200, help="Fake Anthropic answer length (words)")
+    parser.add_argument("--no-response-cache", action="store_true", help="Measure every query against the LLM")
+    args = parser.parse_args()
+
+    report = json.dumps(asyncio.run(benchmark(args)), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+        print(f"✅ Report written to {args.output}", file=sys.stderr)
+    else:
+        print(report)
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Siting optimizer benchmark on a synthetic county (generate_data.py), without a database
+
+    python benchmark_optimizer.py                           # 5,000 and 20,000 demand points, 1,000 candidates
+    python benchmark_optimizer.py --demand-points 20000 --exact
+
+Reports how many candidates the first pass reached within the time budget and how long the
+search took. --exact repeats each run with exact first-pass probes (every mode recomputed in
+full) for comparison; it can take minutes at 20,000 demand points.
+"""
+import argparse
+import math
+import time
+from typing import Dict, Any
+
+import numpy as np
+
+import scenarios
+from accessibility import AccessibilityEngine, DemandPoints, SupplyPoints
+from generate_data import generate
+from optimizer import CandidateSites, SitingOptimizer
+from scenarios import ScenarioEvaluator
+
+
+def point_coordinates(rows, column: int) -> np.ndarray:
+    """(lon, lat) rows from the generator's 'POINT(lon lat)' WKT column"""
+    return np.array([row[column][6:-1].split() for row in rows], dtype=np.float64).reshape(-1, 2)
+
+
+def build_engine(sublocations: int, water_points: int, demand_points: int, seed: int) -> AccessibilityEngine:
+    data = generate(sublocations, water_points, math.ceil(demand_points / sublocations), 8, seed)
+    demand_xy = point_coordinates(data["demand_points"], 2)
+    names = [row[0] for row in data["sublocations"]]
+    index = {name: position for position, name in enumerate(names)}
+    demand = DemandPoints(
+        lon=demand_xy[:, 0], lat=demand_xy[:, 1],
+        population=np.array([row[1] for row in data["demand_points"]], dtype=np.float64),
+        sublocation=np.array([index[row[0]] for row in data["demand_points"]], dtype=np.int64),
+        sublocation_names=names,
+    )
+    supply_xy = point_coordinates(data["waterpoints"], 4)
+    supply = SupplyPoints(
+        ids=np.arange(len(supply_xy)), lon=supply_xy[:, 0], lat=supply_xy[:, 1],
+        capacity=np.array([row[2] for row in data["waterpoints"]], dtype=np.float64),
+    )
+    return AccessibilityEngine(demand, supply)
+
+
+def grid(engine: AccessibilityEngine, count: int) -> np.ndarray:
+    """``count`` candidate sites thinned evenly from a square grid over the demand extent"""
+    demand = engine.demand
+    side = math.ceil(math.sqrt(count))
+    lon, lat = np.meshgrid(np.linspace(demand.lon.min(), demand.lon.max(), side),
+                           np.linspace(demand.lat.min(), demand.lat.max(), side))
+    keep = np.linspace(0, side * side - 1, count).astype(np.int64)
+    return np.column_stack([lon.ravel()[keep], lat.ravel()[keep]])
+
+
+def run(evaluator: ScenarioEvaluator, candidates: CandidateSites, args) -> Dict[str, Any]:
+    result = SitingOptimizer(evaluator, candidates, args.capacity).run(args.sites, args.time_budget)
+    return {
+        "evaluated": f"{result['candidates_evaluated']}/{result['candidates']}",
+        "complete": result["complete"],
+        "probes": result["evaluations"],
+        "elapsed_ms": result["elapsed_ms"],
+        "gain": round(sum(site["marginal_gain"] for site in result["sites"]), 1),
+    }
+
+
+def main(args):
+    for demand_points in args.demand_points:
+        started = time.perf_counter()
+        evaluator = ScenarioEvaluator(build_engine(args.sublocations, args.water_points, demand_points, args.seed))
+        sites = grid(evaluator.engine, args.candidates)
+        candidates = CandidateSites.build(evaluator.engine, sites[:, 0], sites[:, 1])
+        print(f"\n📊 {len(evaluator.engine.demand):,} demand points, {len(evaluator.engine.supply):,} water points, "
+              f"{len(candidates):,} candidates (setup {time.perf_counter() - started:.1f}s)")
+        print(f"   first pass over catchments: {run(evaluator, candidates, args)}")
+        if args.exact:
+            share = scenarios.CATCHMENT_ONLY_PAIR_SHARE
+            scenarios.CATCHMENT_ONLY_PAIR_SHARE = float("inf")
+            try:
+                print(f"   exact first pass:           {run(evaluator, candidates, args)}")
+            finally:
+                scenarios.CATCHMENT_ONLY_PAIR_SHARE = share
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the siting optimizer at county scale")
+    parser.add_argument("--demand-points", type=int, nargs="+", default=[5000, 20000])
+    parser.add_argument("--sublocations", type=int, default=19)
+    parser.add_argument("--water-points", type=int, default=800)
+    parser.add_argument("--candidates", type=int, default=1000)
+    parser.add_argument("--sites", type=int, default=10)
+    parser.add_argument("--capacity", type=int, default=3)
+    parser.add_argument("--time-budget", type=float, default=5.0, help="Seconds, as time_budget_seconds")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--exact", action="store_true", help="Also run with exact first-pass probes")
+    main(parser.parse_args())
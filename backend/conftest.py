@@ -0,0 +1,52 @@
+"""
+Shared test builders: data snapshots and synthetic accessibility engines (no database needed)
+"""
+from datetime import datetime
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from accessibility import AccessibilityEngine, DemandPoints, SupplyPoints
+from snapshot import DataSnapshot, render_context, summarize
+
+# About 0.45 x 0.45 degrees, the extent of Mbeere South
+STUDY_AREA = SimpleNamespace(lon=37.6, lat=-0.85, span=0.45)
+
+
+@pytest.fixture(scope="session")
+def make_snapshot():
+    """DataSnapshot built from sublocation_statistics-shaped rows, as SnapshotManager would"""
+    def make(rows, region_id="mbeere_south", region_name="Mbeere South Subcounty"):
+        stats, categories = summarize(rows)
+        return DataSnapshot(
+            version="test", region_id=region_id, region_name=region_name, fingerprint="test",
+            sublocations=rows, stats=stats, categories=categories,
+            context_text=render_context(stats, categories, rows, region_name), built_at=datetime.now(),
+        )
+    return make
+
+
+@pytest.fixture(scope="session")
+def study_area():
+    return STUDY_AREA
+
+
+@pytest.fixture(scope="session")
+def make_engine():
+    """Engine over random demand and water points spread across the study area"""
+    def make(n_demand=3000, n_supply=150, seed=7):
+        rng = np.random.default_rng(seed)
+        lon, lat, span = STUDY_AREA.lon, STUDY_AREA.lat, STUDY_AREA.span
+        names = [f"SUBLOCATION {index}" for index in range(12)]
+        demand = DemandPoints(
+            lon=lon + rng.random(n_demand) * span, lat=lat + rng.random(n_demand) * span,
+            population=10 + rng.random(n_demand) * 90, sublocation=rng.integers(0, len(names), n_demand),
+            sublocation_names=names,
+        )
+        supply = SupplyPoints(
+            ids=np.arange(1000, 1000 + n_supply), lon=lon + rng.random(n_supply) * span,
+            lat=lat + rng.random(n_supply) * span, capacity=rng.integers(1, 4, n_supply).astype(np.float64),
+        )
+        return AccessibilityEngine(demand, supply)
+    return make
@@ -0,0 +1,204 @@
+# context_builder.py - Query-aware LLM context: overview statistics plus only the rows a query needs
+#
+# The full context lists every sublocation twice over (detail rows, worst 3, best 3). Most queries
+# name one or two places or a band ("very weak areas"), so the builder keeps the overview and
+# category distribution, adds the matching rows, and lists the remaining names without details.
+#
+# The overview and name list depend only on the data version (``shared``) and are sent in a
+# cacheable system block; the per-query rows (``detail``) travel with the user message.
+import math
+import os
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional, Tuple
+
+from intent_router import normalize_query, resolve_sublocations
+from metrics import MetricsRegistry, TOKEN_BUCKETS, metrics
+from scenarios import POOR_CATEGORIES
+from snapshot import DataSnapshot, ACCESSIBILITY_CATEGORIES, render_overview, render_rows
+
+# Rough Claude tokenizer ratio for English prose mixed with numbers
+CHARS_PER_TOKEN = 4.0
+
+# Terms that need every row (rankings, distributions, open comparisons)
+GLOBAL_TERMS = {
+    "all", "every", "each", "rank", "ranking", "ranked", "order", "sort", "leaderboard", "list",
+    "distribution", "table", "spatial", "cluster", "clustering", "pattern", "patterns",
+}
+# Relative to a named place ("areas better than Karaba"): the other rows are needed to answer
+RELATIVE_TERMS = {
+    "better", "worse", "than", "similar", "nearby", "neighbours", "neighbors", "neighbouring", "neighboring", "around",
+}
+COMPARISON_TERMS = {"compare", "comparison", "versus", "vs"}
+POOR_TERMS = {
+    "poor", "worst", "bottom", "lowest", "critical", "emergency", "urgent", "immediate", "priority",
+    "intervention", "vulnerable", "vulnerability", "stress", "drought", "underserved",
+}
+BEST_TERMS = {"best", "top", "highest", "excellent"}
+# Overview statistics alone answer these
+SUMMARY_TERMS = {"statistics", "stats", "summary", "overview", "average", "total", "numbers", "overall"}
+RANKED_ROWS = 3
+
+TOKEN_METRICS = ("llm_context_tokens", "llm_input_tokens", "llm_output_tokens",
+                 "llm_cache_read_tokens", "llm_cache_creation_tokens")
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+@dataclass
+class ContextSelection:
+    """Context for one query: version-scoped ``shared`` text, per-query ``detail`` and its estimated size"""
+    shared: str
+    detail: str = ""
+    version: Optional[str] = None
+    rows: List[str] = field(default_factory=list)
+    reasons: List[str] = field(default_factory=list)
+    full_tokens: int = 0
+
+    @classmethod
+    def plain(cls, text: str) -> "ContextSelection":
+        """Context without snapshot data (database unavailable or failing)"""
+        return cls(shared=text, full_tokens=estimate_tokens(text))
+
+    @property
+    def text(self) -> str:
+        return self.shared + self.detail
+
+    @property
+    def tokens(self) -> int:
+        return estimate_tokens(self.text)
+
+    def usage(self, response_usage: Any = None) -> Dict[str, Any]:
+        """Token counts reported with a response; ``response_usage`` is the Anthropic usage object"""
+        usage = {
+            "context_rows": len(self.rows),
+            "context_reasons": self.reasons,
+            "context_tokens": self.tokens,
+            "context_tokens_full": self.full_tokens,
+        }
+        if response_usage is not None:
+            usage.update({
+                "input_tokens": response_usage.input_tokens,
+                "output_tokens": response_usage.output_tokens,
+                # None when the request had no cache breakpoints
+                "cache_read_input_tokens": response_usage.cache_read_input_tokens or 0,
+                "cache_creation_input_tokens": response_usage.cache_creation_input_tokens or 0,
+            })
+        return usage
+
+
+class ContextBuilder:
+    """Chooses the sublocation rows to send with a query.
+
+    Signals, from the normalized query: sublocation mentions (misspellings
+    resolved as in the intent router), category names, poor/best-access
+    vocabulary and terms that need the whole table. Queries with no signal
+    get the worst and best three, which is what the full context highlights.
+    """
+
+    def __init__(self, mode: str = "query", registry: MetricsRegistry = metrics):
+        self.mode = mode
+        self.metrics = registry
+        # One entry per region: a region's versions replace each other
+        self._shared: Dict[str, Tuple[str, str]] = {}
+        for name in TOKEN_METRICS:
+            registry.define(name, TOKEN_BUCKETS)
+
+    @classmethod
+    def from_env(cls) -> "ContextBuilder":
+        """CONTEXT_SELECTION=full restores the previous behaviour of sending every row"""
+        return cls(mode=os.getenv("CONTEXT_SELECTION", "query").lower())
+
+    def select(self, query: str, snapshot: DataSnapshot, focus: List[str] = ()) -> ContextSelection:
+        """``focus``: sublocations a conversation is about, used when the query names none"""
+        areas = snapshot.sublocations
+        full_tokens = estimate_tokens(snapshot.context_text)
+        names = [area["sublocation_name"] for area in areas]
+        if self.mode == "full":
+            return ContextSelection(shared=snapshot.context_text, version=snapshot.version, rows=names,
+                                    reasons=["full"], full_tokens=full_tokens)
+
+        shared = self.shared_context(snapshot)
+        locations, shape = resolve_sublocations(normalize_query(query), names)
+        words = set(shape.split())
+        reasons: List[str] = []
+        focused = [name for name in focus if name in names][:RANKED_ROWS]
+        if not locations and focused:
+            locations = focused
+            reasons.append("conversation_focus")
+
+        if words & GLOBAL_TERMS or (not locations and words & COMPARISON_TERMS) or (locations and words & RELATIVE_TERMS):
+            return ContextSelection(shared=shared, detail=f"\nDETAILED SUBLOCATION DATA (worst first):\n{render_rows(areas)}",
+                                    version=snapshot.version, rows=names, reasons=["all_rows"], full_tokens=full_tokens)
+
+        selected = set(locations)
+        if locations and not reasons:
+            reasons.append("mentioned")
+
+        # Longest labels first so "very weak" is not also read as "weak"
+        remaining = f" {shape} "
+        for category in sorted((label for _, label in ACCESSIBILITY_CATEGORIES), key=len, reverse=True):
+            phrase = f" {category.lower()} "
+            if phrase in remaining:
+                remaining = remaining.replace(phrase, " ")
+                selected.update(area["sublocation_name"] for area in areas if area["accessibility_category"] == category)
+                reasons.append(f"category:{category}")
+
+        scored = [area for area in areas if area["avg_combined_accessibility"] is not None]
+        if words & POOR_TERMS:
+            poor = [area["sublocation_name"] for area in scored if area["accessibility_category"] in POOR_CATEGORIES]
+            selected.update(poor or [area["sublocation_name"] for area in scored[:RANKED_ROWS]])
+            reasons.append("poor_access")
+        if words & BEST_TERMS:
+            selected.update(area["sublocation_name"] for area in scored[-RANKED_ROWS:])
+            reasons.append("best_access")
+
+        if not reasons and not words & SUMMARY_TERMS:
+            selected.update(area["sublocation_name"] for area in scored[:RANKED_ROWS] + scored[-RANKED_ROWS:])
+            reasons.append("default_extremes")
+        elif not reasons:
+            reasons.append("summary")
+
+        # Snapshot order (worst score first) keeps the rows readable as a ranking
+        rows = [area for area in areas if area["sublocation_name"] in selected]
+        detail = ""
+        if rows:
+            detail = f"\nRELEVANT SUBLOCATION DATA ({len(rows)} of {len(areas)}, worst first; other sublocations omitted):\n"
+            detail += render_rows(rows)
+        return ContextSelection(shared=shared, detail=detail, version=snapshot.version,
+                                rows=[area["sublocation_name"] for area in rows], reasons=reasons, full_tokens=full_tokens)
+
+    def shared_context(self, snapshot: DataSnapshot) -> str:
+        """Overview and sublocation names; identical for every query against one data version"""
+        version, text = self._shared.get(snapshot.region_id, (None, ""))
+        if version != snapshot.version:
+            names = sorted(area["sublocation_name"] for area in snapshot.sublocations)
+            text = render_overview(snapshot.stats, snapshot.categories, snapshot.region_name)
+            text += f"\nSUBLOCATIONS: {', '.join(names)}\n"
+            self._shared[snapshot.region_id] = (snapshot.version, text)
+        return text
+
+    def record(self, selection: ContextSelection, response_usage: Any = None, model: str = "unknown") -> Dict[str, Any]:
+        """Observe token counts for one LLM call and return them for the response body"""
+        self.metrics.observe("llm_context_tokens", selection.tokens, mode=self.mode)
+        if response_usage is not None:
+            for kind, tokens in (("input", response_usage.input_tokens), ("output", response_usage.output_tokens),
+                                 ("cache_read", response_usage.cache_read_input_tokens or 0),
+                                 ("cache_creation", response_usage.cache_creation_input_tokens or 0)):
+                self.metrics.increment("llm_tokens_total", tokens, model=model, kind=kind)
+            self.metrics.observe("llm_input_tokens", response_usage.input_tokens, mode=self.mode)
+            self.metrics.observe("llm_output_tokens", response_usage.output_tokens, mode=self.mode)
+            self.metrics.observe("llm_cache_read_tokens", response_usage.cache_read_input_tokens or 0, mode=self.mode)
+            self.metrics.observe("llm_cache_creation_tokens", response_usage.cache_creation_input_tokens or 0, mode=self.mode)
+        return selection.usage(response_usage)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "context_tokens": self.metrics.snapshot("llm_context_tokens"),
+            "input_tokens": self.metrics.snapshot("llm_input_tokens"),
+            "output_tokens": self.metrics.snapshot("llm_output_tokens"),
+            "cache_read_tokens": self.metrics.snapshot("llm_cache_read_tokens"),
+            "cache_creation_tokens": self.metrics.snapshot("llm_cache_creation_tokens"),
+        }
@@ -0,0 +1,303 @@
+# conversation.py - Per-session conversation memory with a token budget and a rolling summary
+#
+# Recent turns are replayed to Claude verbatim until they exceed the history budget; older turns
+# are folded into one-line summaries (themselves bounded), and the sublocations the conversation
+# is about are kept as structured focus so "and its population?" resolves without the transcript.
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field, asdict
+from typing import Optional, Dict, Any, List
+
+import asyncpg
+
+from context_builder import CHARS_PER_TOKEN, estimate_tokens
+from intent_router import normalize_query, resolve_sublocations
+from queries import registry
+
+# Words that point back at something said earlier when no sublocation is named
+REFERRING_TERMS = {
+    "it", "its", "there", "that", "this", "those", "these", "them", "they", "their", "same",
+    "neighbours", "neighbors", "previous", "earlier", "above", "else",
+}
+FOLLOW_UP_OPENERS = ("and ", "what about ", "how about ", "same for ", "also ")
+MAX_FOCUS = 5
+
+CONVERSATION_LOAD_SQL = """
+    SELECT state FROM conversations
+    WHERE session_id = $1 AND updated_at > now() - make_interval(secs => $2)
+"""
+CONVERSATION_SAVE_SQL = """
+    INSERT INTO conversations (session_id, state, updated_at)
+    VALUES ($1, $2::jsonb, now())
+    ON CONFLICT (session_id) DO UPDATE SET state = EXCLUDED.state, updated_at = EXCLUDED.updated_at
+"""
+CONVERSATION_DELETE_SQL = "DELETE FROM conversations WHERE session_id = $1"
+registry.register("conversation_load", CONVERSATION_LOAD_SQL)
+registry.register("conversation_save", CONVERSATION_SAVE_SQL)
+registry.register("conversation_delete", CONVERSATION_DELETE_SQL)
+
+
+def mentioned_sublocations(text: str, names: List[str]) -> List[str]:
+    """Exact sublocation mentions in free text (answers), in order of first appearance"""
+    lookup = {name.lower(): name for name in names}
+    found: List[str] = []
+    for token in normalize_query(text).split():
+        name = lookup.get(token)
+        if name is not None and name not in found:
+            found.append(name)
+    return found
+
+
+def first_sentence(text: str, limit: int = 200) -> str:
+    sentence = re.split(r"(?<=[.!?])\s", text.strip(), maxsplit=1)[0]
+    return sentence if len(sentence) <= limit else sentence[:limit - 3].rstrip() + "..."
+
+
+@dataclass
+class Turn:
+    query: str
+    answer: str
+    sublocations: List[str] = field(default_factory=list)
+
+    @property
+    def tokens(self) -> int:
+        return estimate_tokens(self.query) + estimate_tokens(self.answer)
+
+    def summarize(self) -> str:
+        line = f'Asked "{first_sentence(self.query, 120)}" - {first_sentence(self.answer)}'
+        if self.sublocations:
+            line += f" [{', '.join(self.sublocations)}]"
+        return line
+
+
+@dataclass
+class Conversation:
+    """One session's recent turns, rolling summary of older turns and sublocations in focus"""
+    session_id: str
+    turns: List[Turn] = field(default_factory=list)
+    summary: List[str] = field(default_factory=list)
+    focus: List[str] = field(default_factory=list)
+    updated_at: float = 0.0
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Conversation":
+        return cls(
+            session_id=data["session_id"],
+            turns=[Turn(**turn) for turn in data.get("turns", [])],
+            summary=data.get("summary", []),
+            focus=data.get("focus", []),
+            updated_at=data.get("updated_at", 0.0),
+        )
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self))
+
+    @property
+    def empty(self) -> bool:
+        return not (self.turns or self.summary or self.focus)
+
+    def follows_up(self, query: str, names: List[str]) -> bool:
+        """True when the query only makes sense with the conversation so far"""
+        if self.empty:
+            return False
+        normalized = normalize_query(query)
+        if f"{normalized} ".startswith(FOLLOW_UP_OPENERS):
+            return True
+        mentioned, _ = resolve_sublocations(normalized, names)
+        return not mentioned and bool(set(normalized.split()) & REFERRING_TERMS)
+
+    def record(self, query: str, answer: str, names: List[str], max_tokens: int, summary_max_tokens: int):
+        """Append a turn, move the sublocations it is about to the front of the focus, then compact"""
+        mentioned, _ = resolve_sublocations(normalize_query(query), names)
+        about = mentioned or mentioned_sublocations(answer, names)[:3]
+        if about:
+            self.focus = list(dict.fromkeys(about + self.focus))[:MAX_FOCUS]
+
+        # A single oversized answer still fits: keep at most half the budget of it
+        answer_chars = int(max_tokens * CHARS_PER_TOKEN / 2)
+        self.turns.append(Turn(query=query, answer=answer[:answer_chars], sublocations=about))
+        self.updated_at = time.time()
+
+        while len(self.turns) > 1 and sum(turn.tokens for turn in self.turns) > max_tokens:
+            self.summary.append(self.turns.pop(0).summarize())
+        while len(self.summary) > 1 and estimate_tokens("\n".join(self.summary)) > summary_max_tokens:
+            self.summary.pop(0)
+
+    def messages(self) -> List[Dict[str, str]]:
+        """Recent turns as alternating user/assistant messages"""
+        messages = []
+        for turn in self.turns:
+            # The API rejects empty assistant turns
+            if not turn.answer.strip():
+                continue
+            messages.append({"role": "user", "content": turn.query})
+            messages.append({"role": "assistant", "content": turn.answer})
+        return messages
+
+    def preamble(self) -> str:
+        """Summary of compacted turns and the sublocations in focus, for the current user message"""
+        text = ""
+        if self.summary:
+            text += "EARLIER IN THIS CONVERSATION:\n" + "".join(f"- {line}\n" for line in self.summary)
+        if self.focus:
+            text += f"SUBLOCATIONS IN FOCUS (most recent first): {', '.join(self.focus)}\n"
+        return text
+
+
+class SQLiteConversations:
+    """Conversation persistence in a local SQLite file (single host)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS conversations ("
+            "session_id TEXT PRIMARY KEY, state TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._db.commit()
+        self._lock = asyncio.Lock()
+
+    async def load(self, session_id: str, ttl_seconds: float) -> Optional[str]:
+        async with self._lock:
+            row = await asyncio.to_thread(
+                lambda: self._db.execute(
+                    "SELECT state FROM conversations WHERE session_id = ? AND updated_at > ?",
+                    (session_id, time.time() - ttl_seconds),
+                ).fetchone()
+            )
+        return row[0] if row else None
+
+    async def save(self, session_id: str, state: str):
+        async with self._lock:
+            await asyncio.to_thread(self._write, session_id, state)
+
+    async def delete(self, session_id: str):
+        async with self._lock:
+            await asyncio.to_thread(self._delete, session_id)
+
+    def _write(self, session_id: str, state: str):
+        self._db.execute(
+            "INSERT OR REPLACE INTO conversations (session_id, state, updated_at) VALUES (?, ?, ?)",
+            (session_id, state, time.time()),
+        )
+        self._db.commit()
+
+    def _delete(self, session_id: str):
+        self._db.execute("DELETE FROM conversations WHERE session_id = ?", (session_id,))
+        self._db.commit()
+
+
+class PostgresConversations:
+    """Conversation persistence in the application database (shared by every worker)"""
+
+    def __init__(self, pool: asyncpg.Pool):
+        self.path = "postgres"
+        self.pool = pool
+
+    async def load(self, session_id: str, ttl_seconds: float) -> Optional[str]:
+        async with registry.acquire(self.pool) as conn:
+            return await registry.fetchval(conn, "conversation_load", session_id, ttl_seconds)
+
+    async def save(self, session_id: str, state: str):
+        async with registry.acquire(self.pool) as conn:
+            await registry.execute(conn, "conversation_save", session_id, state)
+
+    async def delete(self, session_id: str):
+        async with registry.acquire(self.pool) as conn:
+            await registry.execute(conn, "conversation_delete", session_id)
+
+
+class ConversationStore:
+    """In-memory LRU of conversations with an optional SQLite or Postgres tier.
+
+    Memory holds the most recently used sessions; with a backend configured,
+    every turn is written through and memory misses are loaded from it, so
+    sessions survive restarts (and, with Postgres, move between workers).
+    """
+
+    def __init__(self, max_tokens: int = 1500, summary_max_tokens: int = 400, ttl_seconds: float = 86400,
+                 max_sessions: int = 10000, backend: str = "memory", sqlite_path: Optional[str] = None):
+        self.max_tokens = max_tokens
+        self.summary_max_tokens = summary_max_tokens
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self.backend_name = backend
+        self._sessions: "OrderedDict[str, Conversation]" = OrderedDict()
+        self.backend = SQLiteConversations(sqlite_path) if backend == "sqlite" and sqlite_path else None
+        self.compactions = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["ConversationStore"]:
+        if os.getenv("CONVERSATION_MEMORY_ENABLED", "true").lower() not in ("1", "true", "yes"):
+            return None
+        return cls(
+            max_tokens=int(os.getenv("CONVERSATION_MAX_TOKENS", "1500")),
+            summary_max_tokens=int(os.getenv("CONVERSATION_SUMMARY_MAX_TOKENS", "400")),
+            ttl_seconds=float(os.getenv("CONVERSATION_TTL_SECONDS", "86400")),
+            max_sessions=int(os.getenv("CONVERSATION_MAX_SESSIONS", "10000")),
+            backend=os.getenv("CONVERSATION_STORE", "memory").lower(),
+            sqlite_path=os.getenv("CONVERSATION_SQLITE_PATH") or None,
+        )
+
+    def use_pool(self, pool: asyncpg.Pool):
+        """Attach the database once it is connected, when CONVERSATION_STORE=postgres"""
+        if self.backend_name == "postgres":
+            self.backend = PostgresConversations(pool)
+
+    async def get(self, session_id: str) -> Conversation:
+        conversation = self._sessions.get(session_id)
+        if conversation is not None and time.time() - conversation.updated_at < self.ttl_seconds:
+            self._sessions.move_to_end(session_id)
+            return conversation
+
+        conversation = None
+        if self.backend is not None:
+            try:
+                state = await self.backend.load(session_id, self.ttl_seconds)
+                if state:
+                    conversation = Conversation.from_dict(json.loads(state))
+            except Exception as e:
+                print(f"⚠️  Conversation load failed for {session_id}: {e}")
+        conversation = conversation or Conversation(session_id=session_id)
+        self._remember(conversation)
+        return conversation
+
+    async def record(self, conversation: Conversation, query: str, response: Dict[str, Any], names: List[str]):
+        """Add an answered turn; errors and empty answers are left out of the conversation"""
+        answer = response.get("text_response") or ""
+        if response.get("error") or not answer.strip():
+            return
+        turns = len(conversation.turns)
+        conversation.record(query, answer, names, self.max_tokens, self.summary_max_tokens)
+        self.compactions += turns + 1 - len(conversation.turns)
+        self._remember(conversation)
+        if self.backend is not None:
+            try:
+                await self.backend.save(conversation.session_id, conversation.to_json())
+            except Exception as e:
+                print(f"⚠️  Conversation save failed for {conversation.session_id}: {e}")
+
+    async def clear(self, session_id: str):
+        self._sessions.pop(session_id, None)
+        if self.backend is not None:
+            await self.backend.delete(session_id)
+
+    def _remember(self, conversation: Conversation):
+        self._sessions[conversation.session_id] = conversation
+        self._sessions.move_to_end(conversation.session_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sessions": len(self._sessions),
+            "max_tokens": self.max_tokens,
+            "summary_max_tokens": self.summary_max_tokens,
+            "compactions": self.compactions,
+            "backend": self.backend.path if self.backend is not None else "memory",
+        }
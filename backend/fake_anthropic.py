@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Deterministic stand-in for the Anthropic Messages API, for load tests without billed calls
+
+    python fake_anthropic.py --port 8765 --latency-ms 800 --tokens-per-second 60
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8765 ANTHROPIC_API_KEY=fake uvicorn main:app
+
+The answer depends only on the user query, so repeated runs produce identical responses.
+Latency is applied before the first token; streamed answers are then paced at --tokens-per-second.
+Cacheable system blocks are reported as cache writes the first time and cache reads afterwards.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+from typing import Dict, Any, List, AsyncIterator
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+CHARS_PER_TOKEN = 4.0
+FILLER = ("Access", "varies", "across", "sublocations", "with", "distance", "to", "high", "capacity",
+          "sources", "and", "population", "pressure", "on", "each", "point", "shaping", "the", "score.")
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def block_text(content: Any) -> str:
+    if isinstance(content, str):
+        return content
+    return "".join(block.get("text", "") for block in content)
+
+
+class FakeAnthropic:
+    def __init__(self, latency_ms: float = 800, tokens_per_second: float = 0, output_tokens: int = 200,
+                 model: str = "claude-fake"):
+        self.latency = latency_ms / 1000
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+        self.model = model
+        self.cached_prefixes = set()
+        self.calls = 0
+
+    def answer(self, query: str) -> str:
+        """JSON answer in the shape HydroGPT asks Claude for, chosen by a hash of the query"""
+        digest = int(hashlib.sha1(query.encode()).hexdigest(), 16)
+        words = [FILLER[(digest >> shift) % len(FILLER)] for shift in range(self.output_tokens)]
+        response = {
+            "text_response": f"Synthetic answer {digest % 1000} to \"{query[:80]}\". " + " ".join(words),
+            "map_instructions": {"action": "highlight_sublocations", "style": "accessibility"} if digest % 2 else None,
+            "chart_instructions": {"type": "bar", "metric": "accessibility_score"} if digest % 3 == 0 else None,
+        }
+        return json.dumps(response)
+
+    def usage(self, body: Dict[str, Any], text: str) -> Dict[str, int]:
+        system = body.get("system") or []
+        if isinstance(system, str):
+            system = [{"type": "text", "text": system}]
+        cacheable = "".join(block["text"] for block in system if block.get("cache_control"))
+        uncached = "".join(block["text"] for block in system if not block.get("cache_control"))
+        uncached += "".join(block_text(message["content"]) for message in body.get("messages", []))
+
+        cache_read = cache_creation = 0
+        if cacheable:
+            key = hashlib.sha1(cacheable.encode()).hexdigest()
+            if key in self.cached_prefixes:
+                cache_read = estimate_tokens(cacheable)
+            else:
+                self.cached_prefixes.add(key)
+                cache_creation = estimate_tokens(cacheable)
+        return {
+            "input_tokens": estimate_tokens(uncached),
+            "output_tokens": estimate_tokens(text),
+            "cache_read_input_tokens": cache_read,
+            "cache_creation_input_tokens": cache_creation,
+        }
+
+    def message(self, body: Dict[str, Any], text: str) -> Dict[str, Any]:
+        self.calls += 1
+        return {
+            "id": f"msg_fake_{self.calls:08d}",
+            "type": "message",
+            "role": "assistant",
+            "model": body.get("model", self.model),
+            "content": [{"type": "text", "text": text}],
+            "stop_reason": "end_turn",
+            "stop_sequence": None,
+            "usage": self.usage(body, text),
+        }
+
+    async def stream(self, message: Dict[str, Any]) -> AsyncIterator[str]:
+        def event(name: str, data: Dict[str, Any]) -> str:
+            return f"event: {name}\ndata: {json.dumps(data)}\n\n"
+
+        text = message["content"][0]["text"]
+        start = dict(message, content=[], stop_reason=None, usage=dict(message["usage"], output_tokens=1))
+        yield event("message_start", {"type": "message_start", "message": start})
+        yield event("content_block_start", {"type": "content_block_start", "index": 0,
+                                            "content_block": {"type": "text", "text": ""}})
+        chunk_chars = int(CHARS_PER_TOKEN * 4)
+        for offset in range(0, len(text), chunk_chars):
+            if self.tokens_per_second:
+                await asyncio.sleep(chunk_chars / CHARS_PER_TOKEN / self.tokens_per_second)
+            yield event("content_block_delta", {"type": "content_block_delta", "index": 0,
+                                                "delta": {"type": "text_delta", "text": text[offset:offset + chunk_chars]}})
+        yield event("content_block_stop", {"type": "content_block_stop", "index": 0})
+        yield event("message_delta", {"type": "message_delta", "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                                      "usage": {"output_tokens": message["usage"]["output_tokens"]}})
+        yield event("message_stop", {"type": "message_stop"})
+
+
+def create_app(fake: FakeAnthropic) -> FastAPI:
+    app = FastAPI(title="Fake Anthropic API")
+
+    @app.post("/v1/messages")
+    async def messages(request: Request):
+        body = await request.json()
+        messages: List[Dict[str, Any]] = body.get("messages", [])
+        query = block_text(messages[-1]["content"]) if messages else ""
+        # HydroGPT puts the question after "USER QUERY:" in the last user message
+        query = query.split("USER QUERY:", 1)[-1].strip().split("\n", 1)[0]
+        message = fake.message(body, fake.answer(query))
+        await asyncio.sleep(fake.latency)
+        if body.get("stream"):
+            return StreamingResponse(fake.stream(message), media_type="text/event-stream")
+        if fake.tokens_per_second:
+            await asyncio.sleep(message["usage"]["output_tokens"] / fake.tokens_per_second)
+        return JSONResponse(message)
+
+    @app.get("/stats")
+    async def stats():
+        return {"calls": fake.calls, "cached_prefixes": len(fake.cached_prefixes)}
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Deterministic fake Anthropic Messages API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=800, help="Delay before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=0, help="Output pacing (0 = all at once)")
+    parser.add_argument("--output-tokens", type=int, default=200, help="Filler words per answer")
+    args = parser.parse_args()
+    fake = FakeAnthropic(args.latency_ms, args.tokens_per_second, args.output_tokens)
+    uvicorn.run(create_app(fake), host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+Synthetic county-scale data for scale testing: sublocations, waterpoints, sublocation_statistics
+
+    python generate_data.py --scale 10 --replace            # 190 sublocations, ~11k water points
+    python generate_data.py --sublocations 2000 --water-points 120000 --demand-points 40 --replace
+    python generate_data.py --scale 5 --region synthetic_5x --replace   # alongside the real data
+
+Sublocations tile a lattice around Mbeere South: lattice nodes are jittered and every shared
+border is a seeded fractal line, so neighbours share identical edges and polygons have as many
+vertices as real boundaries (--vertices-per-edge). Water points cluster around a few centres per
+sublocation, with source-dependent capacity and a realistic status mix. Statistics carry a
+population and a supply-per-capita accessibility score in the range of the real data.
+
+The same --seed always produces the same data. Rows are written to --region (default
+DEFAULT_REGION), which is added to the regions table; --replace first deletes that region's rows.
+"""
+import argparse
+import asyncio
+import math
+import os
+import time
+from typing import List, Dict, Any, Optional, Tuple
+
+import asyncpg
+import numpy as np
+
+from regions import default_region
+
+# Today's study area: 19 sublocations with roughly 60 water points each
+BASE_SUBLOCATIONS = 19
+WATER_POINTS_PER_SUBLOCATION = 60
+ORIGIN = (37.35, -0.95)
+CELL_DEGREES = 0.11
+
+# source: (share of points, P(capacity 1, 2, 3))
+SOURCES = {
+    "Borehole": (0.30, (0.25, 0.45, 0.30)),
+    "Shallow well": (0.22, (0.70, 0.25, 0.05)),
+    "Spring": (0.12, (0.55, 0.35, 0.10)),
+    "Earth dam": (0.10, (0.30, 0.40, 0.30)),
+    "Water pan": (0.10, (0.65, 0.30, 0.05)),
+    "Piped scheme": (0.08, (0.10, 0.40, 0.50)),
+    "River intake": (0.05, (0.40, 0.40, 0.20)),
+    "Rock catchment": (0.03, (0.80, 0.20, 0.00)),
+}
+STATUSES = {"Functional": 0.68, "Partially functional": 0.12, "Non-functional": 0.15, "Abandoned": 0.05}
+SYLLABLES = ("ka", "ri", "mbe", "nya", "ki", "ma", "ga", "thi", "ru", "nde", "mu", "gu", "ta", "ngo", "we", "ia")
+
+
+def sublocation_names(count: int, rng: np.random.Generator) -> List[str]:
+    """Pronounceable upper-case names, numbered when the syllables run out"""
+    names: List[str] = []
+    used = set()
+    for index in range(count):
+        length = 2 + int(rng.integers(0, 2))
+        name = "".join(SYLLABLES[int(i)] for i in rng.integers(0, len(SYLLABLES), length)).upper()
+        if name in used:
+            name = f"{name}{index}"
+        used.add(name)
+        names.append(name)
+    return names
+
+
+class Lattice:
+    """Jittered lattice whose cells are the sublocations; borders are shared fractal lines"""
+
+    def __init__(self, cells: int, vertices_per_edge: int, seed: int):
+        self.cols = math.ceil(math.sqrt(cells * 1.2))
+        self.rows = math.ceil(cells / self.cols)
+        self.vertices_per_edge = vertices_per_edge
+        self.seed = seed
+        rng = np.random.default_rng([seed, 0])
+        self.jitter = rng.uniform(-0.2, 0.2, (self.rows + 1, self.cols + 1, 2)) * CELL_DEGREES
+
+    def node(self, row: int, col: int) -> np.ndarray:
+        return np.array([ORIGIN[0] + col * CELL_DEGREES, ORIGIN[1] + row * CELL_DEGREES]) + self.jitter[row, col]
+
+    def edge(self, a: Tuple[int, int], b: Tuple[int, int]) -> np.ndarray:
+        """Vertices from node a to node b (excluding b); identical, reversed, for the neighbour"""
+        start, end = min(a, b), max(a, b)
+        rng = np.random.default_rng([self.seed, *start, *end])
+        p, q = self.node(*start), self.node(*end)
+        t = np.linspace(0.0, 1.0, self.vertices_per_edge + 1)
+        normal = np.array([p[1] - q[1], q[0] - p[0]])
+        # Sum of sine harmonics vanishing at both nodes: a river- or ridge-like border
+        harmonics = np.arange(1, 9)
+        amplitudes = rng.normal(0.0, 0.05, harmonics.size) / harmonics
+        offset = np.sin(np.pi * np.outer(t, harmonics)) @ amplitudes
+        points = p + np.outer(t, q - p) + np.outer(offset, normal)
+        if (start, end) != (a, b):
+            points = points[::-1]
+        return points[:-1]
+
+    def ring(self, index: int) -> np.ndarray:
+        row, col = divmod(index, self.cols)
+        corners = [(row, col), (row, col + 1), (row + 1, col + 1), (row + 1, col)]
+        ring = np.concatenate([self.edge(corners[i], corners[(i + 1) % 4]) for i in range(4)])
+        return np.vstack([ring, ring[:1]])
+
+    @property
+    def extent(self) -> Tuple[float, float, float, float]:
+        return (ORIGIN[0] - CELL_DEGREES, ORIGIN[1] - CELL_DEGREES,
+                ORIGIN[0] + (self.cols + 1) * CELL_DEGREES, ORIGIN[1] + (self.rows + 1) * CELL_DEGREES)
+
+
+def contains(ring: np.ndarray, points: np.ndarray) -> np.ndarray:
+    """Even-odd point-in-polygon test for many points against one closed ring"""
+    x, y = points[:, :1], points[:, 1:]
+    xi, yi = ring[:-1, 0], ring[:-1, 1]
+    xj, yj = ring[1:, 0], ring[1:, 1]
+    crosses = ((yi > y) != (yj > y)) & (x < (xj - xi) * (y - yi) / np.where(yj == yi, 1e-12, yj - yi) + xi)
+    return crosses.sum(axis=1) % 2 == 1
+
+
+def sample_inside(ring: np.ndarray, count: int, rng: np.random.Generator, centres: int = 0) -> np.ndarray:
+    """``count`` points inside the ring; with ``centres``, 70% cluster around settlement centres"""
+    low, high = ring.min(axis=0), ring.max(axis=0)
+    hubs = sample_inside(ring, centres, rng) if centres else None
+    found: List[np.ndarray] = []
+    total = 0
+    while total < count:
+        batch = max(2 * (count - total), 16)
+        candidates = rng.uniform(low, high, (batch, 2))
+        if hubs is not None:
+            clustered = rng.random(batch) < 0.7
+            picks = hubs[rng.integers(0, len(hubs), batch)]
+            candidates[clustered] = picks[clustered] + rng.normal(0.0, CELL_DEGREES * 0.08, (int(clustered.sum()), 2))
+        inside = candidates[contains(ring, candidates)]
+        found.append(inside)
+        total += len(inside)
+    return np.concatenate(found)[:count]
+
+
+def ring_wkt(ring: np.ndarray) -> str:
+    return "MULTIPOLYGON(((" + ",".join(f"{lon:.6f} {lat:.6f}" for lon, lat in ring) + ")))"
+
+
+def generate(sublocations: int, water_points: int, demand_points: int, vertices_per_edge: int,
+             seed: int) -> Dict[str, Any]:
+    """Rows for every table, as tuples ready for COPY"""
+    rng = np.random.default_rng(seed)
+    lattice = Lattice(sublocations, vertices_per_edge, seed)
+    names = sublocation_names(sublocations, rng)
+
+    populations = np.round(rng.lognormal(math.log(3200), 0.45, sublocations)).astype(int)
+    # More people, more water points - but unevenly, which is what makes access vary
+    weights = populations ** 0.8 * rng.lognormal(0.0, 0.5, sublocations)
+    counts = rng.multinomial(water_points, weights / weights.sum())
+
+    source_names = list(SOURCES)
+    source_shares = np.array([share for share, _ in SOURCES.values()])
+    status_names = list(STATUSES)
+    status_shares = np.array(list(STATUSES.values()))
+
+    shapes, points, statistics, demand = [], [], [], []
+    for index, name in enumerate(names):
+        ring = lattice.ring(index)
+        shapes.append((name, f"LOCATION {index // 6 + 1}", ring_wkt(ring)))
+
+        count = int(counts[index])
+        located = sample_inside(ring, count, rng, centres=1 + count // 15) if count else np.empty((0, 2))
+        sources = rng.choice(len(source_names), count, p=source_shares / source_shares.sum())
+        capacities = np.empty(count, dtype=int)
+        for source_index, source in enumerate(source_names):
+            chosen = sources == source_index
+            capacities[chosen] = rng.choice(3, int(chosen.sum()), p=SOURCES[source][1]) + 1
+        statuses = rng.choice(len(status_names), count, p=status_shares / status_shares.sum())
+        for (lon, lat), source, capacity, status in zip(located, sources, capacities, statuses):
+            points.append((f"{source_names[source]} {len(points) + 1}", source_names[source], int(capacity),
+                           status_names[status], f"POINT({lon:.6f} {lat:.6f})"))
+
+        working = statuses != status_names.index("Abandoned")
+        statistics.append({
+            "name": name,
+            "population": int(populations[index]),
+            "supply": float(capacities[working].sum()),
+            "counts": [int((capacities == level).sum()) for level in (3, 2, 1)],
+            "total": count,
+        })
+
+        if demand_points:
+            settlement = sample_inside(ring, demand_points, rng, centres=3)
+            shares = rng.dirichlet(np.ones(demand_points))
+            demand.extend((name, float(populations[index] * share), f"POINT({lon:.6f} {lat:.6f})")
+                          for (lon, lat), share in zip(settlement, shares))
+
+    # Supply per capita relative to the median maps onto the real score range (~0.6-2.0)
+    per_capita = np.array([row["supply"] / row["population"] for row in statistics])
+    ratio = per_capita / max(float(np.median(per_capita)), 1e-9)
+    scores = np.clip(1.25 * np.power(np.maximum(ratio, 1e-3), 0.35), 0.5, 2.5)
+    stats_rows = [
+        (row["name"], round(float(score), 3), row["population"], row["total"], *row["counts"])
+        for row, score in zip(statistics, scores)
+    ]
+    return {"sublocations": shapes, "waterpoints": points, "statistics": stats_rows,
+            "demand_points": demand, "extent": lattice.extent}
+
+
+async def load(conn: asyncpg.Connection, data: Dict[str, Any], replace: bool, region_id: Optional[str] = None):
+    """Bulk load one region through COPY into temporary text tables, then one INSERT ... SELECT per table.
+
+    The map rollup is refreshed once, as the last statement of the load's transaction.
+    """
+    region_id = region_id or default_region()
+    async with conn.transaction():
+        await conn.execute("""
+            INSERT INTO regions (region_id, name) VALUES ($1, $2) ON CONFLICT (region_id) DO NOTHING
+        """, region_id, f"Synthetic {region_id}")
+        if replace:
+            for table in ("sublocations", "waterpoints", "sublocation_statistics", "demand_points"):
+                await conn.execute(f"DELETE FROM {table} WHERE region_id = $1", region_id)
+        await conn.execute("""
+            CREATE TEMP TABLE staging_sublocations (slname text, locname text, wkt text) ON COMMIT DROP;
+            CREATE TEMP TABLE staging_waterpoints (source text, water_sour text, capacitysc int, status text, wkt text) ON COMMIT DROP;
+            CREATE TEMP TABLE staging_demand_points (sublocation_name text, population float8, wkt text) ON COMMIT DROP;
+        """)
+        await conn.copy_records_to_table("staging_sublocations", records=data["sublocations"])
+        await conn.copy_records_to_table("staging_waterpoints", records=data["waterpoints"])
+        await conn.copy_records_to_table("staging_demand_points", records=data["demand_points"])
+
+        await conn.execute("""
+            INSERT INTO sublocations (region_id, slname, locname, geom)
+            SELECT $1, slname, locname, ST_GeomFromText(wkt, 4326) FROM staging_sublocations
+        """, region_id)
+        await conn.execute("""
+            INSERT INTO waterpoints (region_id, source, water_sour, capacitysc, status, geom)
+            SELECT $1, source, water_sour, capacitysc, status, ST_GeomFromText(wkt, 4326) FROM staging_waterpoints
+        """, region_id)
+        await conn.execute("""
+            INSERT INTO demand_points (region_id, sublocation_name, population, geom)
+            SELECT $1, sublocation_name, population, ST_GeomFromText(wkt, 4326) FROM staging_demand_points
+        """, region_id)
+        await conn.copy_records_to_table(
+            "sublocation_statistics", records=[(region_id, *row) for row in data["statistics"]],
+            columns=["region_id", "sublocation_name", "avg_combined_accessibility", "total_population", "water_points_count",
+                     "high_capacity_water_points", "medium_capacity_water_points", "low_capacity_water_points"]
+        )
+        # One rollup rebuild for the whole load, committed together with the rows (database/init.sql)
+        if await conn.fetchval("SELECT to_regclass('sublocation_rollup') IS NOT NULL"):
+            await conn.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY sublocation_rollup")
+
+
+async def main(args):
+    sublocations = args.sublocations or BASE_SUBLOCATIONS * args.scale
+    water_points = args.water_points if args.water_points is not None else sublocations * WATER_POINTS_PER_SUBLOCATION
+
+    print(f"🧪 Generating {sublocations:,} sublocations and {water_points:,} water points (seed {args.seed})")
+    started = time.perf_counter()
+    data = generate(sublocations, water_points, args.demand_points, args.vertices_per_edge, args.seed)
+    vertices = sum(shape[2].count(",") + 1 for shape in data["sublocations"])
+    print(f"✅ Generated in {time.perf_counter() - started:.1f}s "
+          f"({vertices / sublocations:.0f} vertices per sublocation, {len(data['demand_points']):,} demand points)")
+
+    database_url = os.getenv("DATABASE_URL")
+    if not database_url:
+        print("❌ DATABASE_URL environment variable not set")
+        return
+    started = time.perf_counter()
+    conn = await asyncpg.connect(database_url)
+    try:
+        await load(conn, data, args.replace, args.region)
+    finally:
+        await conn.close()
+    print(f"✅ Loaded into region '{args.region}' in {time.perf_counter() - started:.1f}s")
+    print(f"📐 Extent (for benchmark_load.py --extent): {','.join(f'{value:.4f}' for value in data['extent'])}")
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Populate the database with a synthetic county")
+    parser.add_argument("--scale", type=int, default=10, help=f"Multiple of today's {BASE_SUBLOCATIONS} sublocations")
+    parser.add_argument("--sublocations", type=int, default=None, help="Overrides --scale")
+    parser.add_argument("--water-points", type=int, default=None,
+                        help=f"Total water points (default {WATER_POINTS_PER_SUBLOCATION} per sublocation)")
+    parser.add_argument("--demand-points", type=int, default=0,
+                        help="Demand points per sublocation (0 = let the engine generate them)")
+    parser.add_argument("--vertices-per-edge", type=int, default=40, help="Boundary detail; 4 edges per sublocation")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--region", default=default_region(), help="region_id the rows are written to")
+    parser.add_argument("--replace", action="store_true", help="Delete the region's rows before loading")
+    asyncio.run(main(parser.parse_args()))
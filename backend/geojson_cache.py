@@ -0,0 +1,119 @@
+# geojson_cache.py - Pre-serialized, pre-compressed JSON payloads served with strong ETags
+import asyncio
+import gzip
+import hashlib
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from fastapi import Request, Response
+
+from singleflight import SingleFlight
+
+try:
+    import brotli
+except ImportError:  # brotli is optional - gzip and identity are always available
+    brotli = None
+
+
+class EncodedPayload:
+    """A response body serialized once, with gzip/brotli variants and strong ETags"""
+
+    def __init__(self, body: bytes, media_type: str = "application/json"):
+        self.media_type = media_type
+        self.base_etag = hashlib.sha1(body).hexdigest()[:20]
+        self.variants: Dict[str, bytes] = {"identity": body, "gzip": gzip.compress(body, compresslevel=9)}
+        if brotli is not None:
+            self.variants["br"] = brotli.compress(body, quality=11)
+
+    def etag(self, encoding: str) -> str:
+        # Each encoding is a different byte sequence, so it gets its own strong validator
+        return f'"{self.base_etag}"' if encoding == "identity" else f'"{self.base_etag}-{encoding}"'
+
+    def negotiate(self, accept_encoding: str) -> str:
+        accepted = {part.split(";")[0].strip().lower() for part in accept_encoding.split(",")}
+        for encoding in ("br", "gzip"):
+            if encoding in self.variants and encoding in accepted:
+                return encoding
+        return "identity"
+
+    def matches(self, if_none_match: str) -> bool:
+        """True when If-None-Match names any representation of this payload"""
+        return etag_matches(if_none_match, [self.etag(encoding) for encoding in self.variants])
+
+    def response(self, request: Request, cache_control: str = "no-cache") -> Response:
+        encoding = self.negotiate(request.headers.get("accept-encoding", ""))
+        headers = {
+            "ETag": self.etag(encoding),
+            "Vary": "Accept-Encoding",
+            "Cache-Control": cache_control,
+        }
+        if self.matches(request.headers.get("if-none-match", "")):
+            return Response(status_code=304, headers=headers)
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(content=self.variants[encoding], media_type=self.media_type, headers=headers)
+
+    @property
+    def size(self) -> Dict[str, int]:
+        return {encoding: len(body) for encoding, body in self.variants.items()}
+
+
+def etag_matches(if_none_match: str, etags: List[str]) -> bool:
+    """True when an If-None-Match header names any of ``etags`` (or is ``*``)"""
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or any(etag in tags for etag in etags)
+
+
+class PayloadCache:
+    """Keeps the materialized payload for the most recent data versions of each scope.
+
+    ``scope`` separates independent datasets (regions), so one region's new
+    versions never evict another's. ``get`` builds a payload at most once per key: concurrent first requests
+    wait for the same build instead of each hitting the database, while
+    builds for different keys proceed independently.
+    """
+
+    def __init__(self, name: str = "payload", max_versions: int = 2):
+        self.max_versions = max_versions
+        self._payloads: Dict[str, "OrderedDict[str, EncodedPayload]"] = {}
+        self.flights = SingleFlight(name)
+        self.builds = 0
+
+    async def get(self, key: str, build: Callable[[], Awaitable[bytes]], scope: str = "") -> EncodedPayload:
+        payload = self._payloads.get(scope, {}).get(key)
+        if payload is not None:
+            return payload
+
+        return await self.flights.run(key, lambda: self._build(key, build, scope))
+
+    async def _build(self, key: str, build: Callable[[], Awaitable[bytes]], scope: str) -> EncodedPayload:
+        # gzip -9 and brotli -11 of a county-scale FeatureCollection take seconds; keep them off the event loop
+        payload = await asyncio.to_thread(EncodedPayload, await build())
+        self.builds += 1
+        versions = self._payloads.setdefault(scope, OrderedDict())
+        versions[key] = payload
+        while len(versions) > self.max_versions:
+            versions.popitem(last=False)
+        return payload
+
+    def invalidate(self, scope: str = ""):
+        """Drop every cached version of ``scope``, e.g. after a manual rebuild of its source"""
+        self._payloads.pop(scope, None)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "builds": self.builds,
+            "coalescing": self.flights.stats(),
+            "versions": [key for versions in self._payloads.values() for key in versions],
+            "sizes": [payload.size for versions in self._payloads.values() for payload in versions.values()],
+        }
+
+
+def feature_collection(features: List[bytes]) -> bytes:
+    """Assemble a FeatureCollection from already-serialized Feature objects"""
+    return b'{"type":"FeatureCollection","features":[' + b",".join(features) + b"]}"
+
+
+def feature(properties_json: str, geometry_json: Optional[str]) -> bytes:
+    """Serialize one Feature, embedding PostGIS's GeoJSON geometry text verbatim"""
+    return f'{{"type":"Feature","properties":{properties_json},"geometry":{geometry_json or "null"}}}'.encode()
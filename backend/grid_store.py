@@ -0,0 +1,155 @@
+# grid_store.py - Columnar on-disk store of per-demand-point accessibility, memory-mapped for reads
+#
+# Layout: <directory>/<version>/<column>.npy + manifest.json, with <directory>/CURRENT naming the
+# latest version. Every uvicorn worker memory-maps the same files, so the OS page cache holds one
+# copy however many workers are running.
+import json
+import os
+import shutil
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+
+from accessibility import AccessibilityEngine, AccessibilityResult
+from snapshot import ACCESSIBILITY_CATEGORIES, classify_accessibility
+
+MANIFEST = "manifest.json"
+CURRENT = "CURRENT"
+
+
+class GridStore:
+    """Read-only columns of per-demand-point results with small aggregation helpers"""
+
+    def __init__(self, version: str, columns: Dict[str, np.ndarray], manifest: Dict[str, Any]):
+        self.version = version
+        self.columns = columns
+        self.manifest = manifest
+
+    @property
+    def metrics(self) -> List[str]:
+        return ["score", "combined"] + self.manifest["modes"]
+
+    @property
+    def sublocation_names(self) -> List[str]:
+        return self.manifest["sublocation_names"]
+
+    def __len__(self) -> int:
+        return self.manifest["rows"]
+
+    @classmethod
+    def from_result(cls, version: str, engine: AccessibilityEngine, result: AccessibilityResult) -> "GridStore":
+        """In-memory store over an engine run (used directly when no store directory is configured)"""
+        demand = engine.demand
+        columns = {
+            "lon": demand.lon,
+            "lat": demand.lat,
+            "population": demand.population,
+            "sublocation": demand.sublocation,
+            "score": result.score,
+            "combined": result.combined,
+        }
+        columns.update({mode: scores for mode, scores in result.by_mode.items()})
+        manifest = {
+            "version": version,
+            "rows": len(demand),
+            "modes": list(result.by_mode),
+            "sublocation_names": demand.sublocation_names,
+            "reference": result.reference,
+            "columns": {name: str(values.dtype) for name, values in columns.items()},
+            "created_at": datetime.now().isoformat(),
+        }
+        return cls(version, columns, manifest)
+
+    def write(self, directory: str):
+        """Persist under <directory>/<version> and point CURRENT at it; safe with concurrent writers"""
+        target = os.path.join(directory, self.version)
+        if not os.path.exists(os.path.join(target, MANIFEST)):
+            staging = f"{target}.{os.getpid()}.tmp"
+            os.makedirs(staging, exist_ok=True)
+            for name, values in self.columns.items():
+                np.save(os.path.join(staging, f"{name}.npy"), np.ascontiguousarray(values))
+            with open(os.path.join(staging, MANIFEST), "w") as f:
+                json.dump(self.manifest, f, indent=2)
+            try:
+                os.rename(staging, target)
+            except OSError:
+                # Another worker published this version first
+                shutil.rmtree(staging, ignore_errors=True)
+
+        pointer = os.path.join(directory, f"{CURRENT}.{os.getpid()}.tmp")
+        with open(pointer, "w") as f:
+            f.write(self.version)
+        os.replace(pointer, os.path.join(directory, CURRENT))
+        self.prune(directory)
+
+    def prune(self, directory: str, keep: int = 2):
+        """Remove all but the newest ``keep`` versions (mapped files stay readable until unmapped)"""
+        # Only published versions: the default region's directory may also hold other regions' stores
+        versions = [
+            entry for entry in os.scandir(directory)
+            if entry.is_dir() and not entry.name.endswith(".tmp") and entry.name != self.version
+            and os.path.exists(os.path.join(entry.path, MANIFEST))
+        ]
+        versions.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+        for entry in versions[keep - 1:]:
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+    @classmethod
+    def open(cls, directory: Optional[str]) -> Optional["GridStore"]:
+        """Memory-map the version named by CURRENT, or None when nothing has been written"""
+        if not directory:
+            return None
+        try:
+            with open(os.path.join(directory, CURRENT)) as f:
+                version = f.read().strip()
+            with open(os.path.join(directory, version, MANIFEST)) as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return None
+
+        columns = {
+            name: np.load(os.path.join(directory, version, f"{name}.npy"), mmap_mode="r")
+            for name in manifest["columns"]
+        }
+        return cls(version, columns, manifest)
+
+    def aggregate(self, metric: str = "score", by: str = "sublocation") -> List[Dict[str, Any]]:
+        """Population-weighted mean of ``metric`` per sublocation, or population per category"""
+        population = self.columns["population"]
+        values = self.columns[metric]
+
+        if by == "category":
+            bands = np.searchsorted([upper for upper, _ in ACCESSIBILITY_CATEGORIES[:-1]], self.columns["score"], side="right")
+            totals = np.bincount(bands, weights=population, minlength=len(ACCESSIBILITY_CATEGORIES))
+            weighted = np.bincount(bands, weights=values * population, minlength=len(ACCESSIBILITY_CATEGORIES))
+            return [
+                {
+                    "category": category,
+                    "population": int(round(totals[index])),
+                    metric: round(float(weighted[index] / totals[index]), 4) if totals[index] > 0 else None,
+                }
+                for index, (_, category) in enumerate(ACCESSIBILITY_CATEGORIES)
+            ]
+
+        names = self.sublocation_names
+        groups = self.columns["sublocation"]
+        totals = np.bincount(groups, weights=population, minlength=len(names))
+        weighted = np.bincount(groups, weights=values * population, minlength=len(names))
+        rows = []
+        for index, name in enumerate(names):
+            mean = float(weighted[index] / totals[index]) if totals[index] > 0 else 0.0
+            row = {"sublocation_name": name, "population": int(round(totals[index])), metric: round(mean, 4)}
+            if metric == "score":
+                row["category"] = classify_accessibility(mean)
+            rows.append(row)
+        return rows
+
+    def histogram(self, metric: str = "score", bins: int = 20) -> Dict[str, Any]:
+        """Population-weighted distribution of ``metric`` across demand points"""
+        counts, edges = np.histogram(self.columns[metric], bins=bins, weights=self.columns["population"])
+        return {
+            "metric": metric,
+            "edges": [round(float(edge), 4) for edge in edges],
+            "population": [int(round(count)) for count in counts],
+        }
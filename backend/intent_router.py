@@ -0,0 +1,457 @@
+# intent_router.py - Deterministic answers for template queries without calling the LLM
+import copy
+import difflib
+import json
+import os
+import re
+from typing import Optional, Dict, Any, List, Tuple
+
+from snapshot import DataSnapshot, classify_accessibility
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Stands in for any sublocation mention once queries and templates are normalized
+LOCATION_TOKEN = "sublocx"
+
+PLACEHOLDER_LOCATION = re.compile(r"\{(?:sublocation|location|area)\d?\}")
+
+STOPWORDS = {
+    "a", "an", "the", "is", "are", "of", "in", "on", "to", "for", "me", "and",
+    "with", "by", "what", "s", "do", "does", "how", "which", "about", "please", "i",
+}
+
+CATEGORY_INTERPRETATION = {
+    "Very Weak": "water access is critical and immediate intervention is required",
+    "Weak": "water access needs significant improvement",
+    "Good": "water access is at an acceptable level",
+    "Very Good": "water access is excellent",
+}
+
+AREA_SUBJECTS = ("areas", "sublocations")
+PEOPLE_SUBJECTS = ("people", "population")
+
+# dynamic_queries.patterns -> intent resolver over the captured grammar variables. A resolver
+# only answers when the bound variables mean what its template computes ("average population"
+# is not the average accessibility); None defers to the LLM.
+DYNAMIC_PATTERN_INTENTS = {
+    "Show me {location}": lambda v: "map_display",
+    "How is {location}": lambda v: "single_location_analysis",
+    "Compare {location1} with {location2}": lambda v: "two_location_comparison",
+    "Which {superlative} {subject}": lambda v: (
+        None if v["subject"] not in AREA_SUBJECTS
+        else "best_access_query" if v["superlative"] == "best"
+        else "worst_access_ranking" if v["superlative"] == "worst"
+        else None
+    ),
+    "How many {subject} {condition}": lambda v: (
+        "population_poor_access"
+        if v["subject"] in PEOPLE_SUBJECTS and v["condition"] in ("have poor access", "need intervention") else None
+    ),
+    "What is the {statistic} {subject}": lambda v: (
+        "average_accessibility" if v["statistic"] == "average" and v["subject"] == "accessibility" else None
+    ),
+    "Where {question} {subject}": lambda v: (
+        "infrastructure_recommendation" if v["question"] == "should" and v["subject"] == "water points" else None
+    ),
+}
+# A query that is exactly one of the dynamic_queries sentences
+DYNAMIC_MATCH_CONFIDENCE = 0.9
+# Scales template similarity when the query has words the template does not cover - a place,
+# a statistic, a negation - so those matches stay below any sensible threshold
+UNBOUND_TOKEN_PENALTY = 0.5
+
+
+def normalize_query(text: str) -> str:
+    """Lowercase, strip punctuation and collapse whitespace"""
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", text.lower()).split())
+
+
+def resolve_sublocations(normalized: str, names: List[str]) -> Tuple[List[str], str]:
+    """Find sublocation mentions (tolerating misspellings) in a normalized query.
+
+    Returns the canonical names in order of appearance and the query with each
+    mention replaced by LOCATION_TOKEN.
+    """
+    lookup = {name.lower(): name for name in names}
+    found: List[str] = []
+    tokens = []
+    for token in normalized.split():
+        name = lookup.get(token)
+        if name is None and len(token) >= 5 and token not in STOPWORDS:
+            close = difflib.get_close_matches(token, lookup.keys(), n=1, cutoff=0.8)
+            name = lookup[close[0]] if close else None
+        if name is not None:
+            found.append(name)
+            tokens.append(LOCATION_TOKEN)
+        else:
+            tokens.append(token)
+    return found, " ".join(tokens)
+
+
+def canonicalize_query(query: str, names: List[str]) -> str:
+    """Canonical form of a query: normalized text with sublocation aliases resolved"""
+    locations, shape = resolve_sublocations(normalize_query(query), names)
+    canonical = iter(location.lower() for location in locations)
+    return " ".join(next(canonical) if token == LOCATION_TOKEN else token for token in shape.split())
+
+
+def _shape(template: str) -> str:
+    return normalize_query(PLACEHOLDER_LOCATION.sub(LOCATION_TOKEN, template))
+
+
+def _content_tokens(shape: str) -> set:
+    return {token for token in shape.split() if token not in STOPWORDS}
+
+
+class IntentRouter:
+    """Fast local matcher over query_database.json and extended_queries.json.
+
+    Queries are normalized, sublocation mentions resolved, and the result is
+    compared against the known query templates and the dynamic_queries
+    grammar. High-confidence matches are answered from the cached statistics
+    snapshot; anything else returns None so the caller can fall back to the LLM.
+    """
+
+    def __init__(self, min_confidence: float = 0.8):
+        self.min_confidence = min_confidence
+        with open(os.path.join(BASE_DIR, "query_database.json")) as f:
+            query_database = json.load(f)
+        with open(os.path.join(BASE_DIR, "extended_queries.json")) as f:
+            extended_queries = json.load(f)
+        extended = extended_queries["extended_query_database"]
+        self.confirmation_prompts = extended_queries["response_templates"]["confirmation_prompts"]
+
+        # intent -> template entry (response_template + instructions)
+        self.intents: Dict[str, Dict[str, Any]] = {}
+        # (shape, content tokens, location count, intent)
+        self.templates: List[Tuple[str, set, int, str]] = []
+
+        for category in query_database["query_categories"].values():
+            for entry in category["queries"]:
+                self.intents[entry["intent"]] = entry
+                self._add_template(entry["query"], entry["intent"])
+
+        for query in extended.get("accessibility_variants", []):
+            self._add_template(query, "full_statistics")
+        for query in extended.get("statistical_queries", []):
+            self._add_template(query, "full_statistics")
+        for query in extended.get("comparison_queries", []):
+            self._add_template(query, "two_location_comparison")
+        for name, variants in extended.get("location_variants", {}).items():
+            for query in variants:
+                self._add_template(re.sub(name, "{location}", query, flags=re.IGNORECASE), "single_location_analysis")
+        for query in extended.get("ranking_queries", []):
+            words = set(normalize_query(query).split())
+            if words & {"worst", "bottom"} and not words & {"top", "best"}:
+                intent = "worst_access_ranking"
+            elif words & {"best", "top"} and not words & {"bottom", "worst"}:
+                intent = "top_access_ranking"
+            else:
+                intent = "full_ranking"
+            self._add_template(query, intent)
+
+        self.dynamic_patterns = self._compile_dynamic(query_database.get("dynamic_queries", {}))
+
+        self.handlers = {
+            "methodology_explanation": lambda areas, snap, locs: {},
+            "category_explanation": lambda areas, snap, locs: {},
+            "count_sublocations": self._count_sublocations,
+            "single_location_analysis": self._single_location,
+            "map_display": self._single_location,
+            "better_access_comparison": self._better_access,
+            "two_location_comparison": self._two_location,
+            "best_access_query": self._best_access,
+            "average_accessibility": self._average,
+            "population_poor_access": self._poor_access,
+            "full_statistics": self._full_statistics,
+            "worst_access_ranking": self._worst_ranking,
+            "full_ranking": self._full_ranking,
+            "top_access_ranking": self._top_ranking,
+            "population_access_mismatch": self._population_mismatch,
+            "infrastructure_recommendation": self._infrastructure,
+        }
+
+    @classmethod
+    def from_env(cls) -> Optional["IntentRouter"]:
+        if os.getenv("INTENT_ROUTER_ENABLED", "true").lower() not in ("1", "true", "yes"):
+            return None
+        return cls(min_confidence=float(os.getenv("INTENT_ROUTER_MIN_CONFIDENCE", "0.8")))
+
+    def _add_template(self, query: str, intent: str):
+        shape = _shape(query)
+        self.templates.append((shape, _content_tokens(shape), shape.split().count(LOCATION_TOKEN), intent))
+
+    def _compile_dynamic(self, dynamic: Dict[str, Any]) -> List[Tuple[re.Pattern, Any]]:
+        variables = dynamic.get("variables", {})
+        compiled = []
+        for pattern in dynamic.get("patterns", []):
+            resolver = DYNAMIC_PATTERN_INTENTS.get(pattern)
+            if resolver is None:
+                continue
+            regex = re.escape(normalize_query(PLACEHOLDER_LOCATION.sub(LOCATION_TOKEN, pattern).replace("{", " lbrace ").replace("}", " rbrace ")))
+            for name, options in variables.items():
+                if name == "location":
+                    continue
+                alternatives = "|".join(re.escape(normalize_query(option)) for option in options)
+                regex = regex.replace(re.escape(f"lbrace {name} rbrace"), f"(?P<{name}>{alternatives})")
+            compiled.append((re.compile(regex), resolver))
+        return compiled
+
+    def match(self, query: str, names: List[str]) -> Tuple[Optional[str], float, List[str]]:
+        """Best intent for a query, its confidence and the resolved sublocations"""
+        locations, shape = resolve_sublocations(normalize_query(query), names)
+        tokens = _content_tokens(shape)
+
+        best_intent, best_score = None, 0.0
+        for template_shape, template_tokens, location_count, intent in self.templates:
+            if location_count != len(locations):
+                continue
+            if template_shape == shape:
+                return intent, 1.0, locations
+            union = tokens | template_tokens
+            score = len(tokens & template_tokens) / len(union) if union else 0.0
+            if tokens - template_tokens:
+                # The query asks about something the template's answer ignores
+                score *= UNBOUND_TOKEN_PENALTY
+            if score > best_score:
+                best_intent, best_score = intent, score
+
+        for regex, resolver in self.dynamic_patterns:
+            # Whole query only: a matching prefix says nothing about the rest of the sentence
+            found = regex.fullmatch(shape)
+            if found:
+                intent = resolver(found.groupdict())
+                if intent and DYNAMIC_MATCH_CONFIDENCE > best_score:
+                    best_intent, best_score = intent, DYNAMIC_MATCH_CONFIDENCE
+                break
+
+        return best_intent, best_score, locations
+
+    def route(self, query: str, snapshot: DataSnapshot) -> Optional[Dict[str, Any]]:
+        """Answer a query from the snapshot, or None when the LLM should handle it"""
+        areas = snapshot.sublocations
+        names = [area["sublocation_name"] for area in areas]
+        intent, confidence, locations = self.match(query, names)
+        if intent is None or confidence < self.min_confidence:
+            return None
+
+        entry = self.intents.get(intent)
+        handler = self.handlers.get(intent)
+        if entry is None or handler is None:
+            return None
+
+        values = handler(areas, snapshot, locations)
+        if values is None:
+            return None
+
+        text_values = {key: ", ".join(value) if isinstance(value, list) else value for key, value in values.items()}
+        try:
+            text_response = entry["response_template"].format(**text_values)
+            map_instructions = self._fill(copy.deepcopy(entry["map_instructions"]), values)
+            chart_instructions = self._fill(copy.deepcopy(entry["chart_instructions"]), values)
+        except (KeyError, IndexError):
+            return None
+
+        return {
+            "text_response": text_response,
+            "map_instructions": map_instructions,
+            "chart_instructions": chart_instructions,
+            "proactive_suggestions": self.confirmation_prompts[:2],
+            "query_type": intent,
+            "confidence_level": "high",
+            "source": "intent_router",
+        }
+
+    def _fill(self, value: Any, values: Dict[str, Any]) -> Any:
+        """Substitute placeholders in instruction JSON, expanding list-valued ones"""
+        if isinstance(value, dict):
+            return {key: self._fill(item, values) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self._fill(item, values) for item in value]
+        if isinstance(value, str) and "{" in value:
+            whole = re.fullmatch(r"\{(\w+)\}", value)
+            if whole:
+                return values[whole.group(1)]
+            return value.format(**{key: ", ".join(item) if isinstance(item, list) else item for key, item in values.items()})
+        return value
+
+    # --- Placeholder handlers: return template values, or None to defer to the LLM ---
+
+    @staticmethod
+    def _by_name(areas: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        lookup = {}
+        for area in areas:
+            lookup.setdefault(area["sublocation_name"], area)
+        return lookup
+
+    @staticmethod
+    def _population(area: Dict[str, Any]) -> int:
+        return area["total_population"] or 0
+
+    def _count_sublocations(self, areas, snapshot, locations):
+        return {"sublocation_list": ", ".join(sorted(self._by_name(areas)))}
+
+    def _single_location(self, areas, snapshot, locations):
+        area = self._by_name(areas).get(locations[0])
+        if area is None:
+            return None
+        return {
+            "sublocation": area["sublocation_name"],
+            "category": area["accessibility_category"],
+            "score": f"{area['avg_combined_accessibility']:.3f}",
+            "interpretation": CATEGORY_INTERPRETATION.get(area["accessibility_category"], "access levels are unclassified"),
+            "population": f"{self._population(area):,}",
+        }
+
+    def _better_access(self, areas, snapshot, locations):
+        reference = self._by_name(areas).get(locations[0])
+        if reference is None:
+            return None
+        better = [area for area in self._by_name(areas).values()
+                  if area["avg_combined_accessibility"] > reference["avg_combined_accessibility"]]
+        if not better:
+            return None
+        scores = [area["avg_combined_accessibility"] for area in better]
+        return {
+            "sublocation": reference["sublocation_name"],
+            "reference_score": f"{reference['avg_combined_accessibility']:.3f}",
+            "better_areas": [area["sublocation_name"] for area in better],
+            "min_better_score": f"{min(scores):.3f}",
+            "max_better_score": f"{max(scores):.3f}",
+        }
+
+    def _two_location(self, areas, snapshot, locations):
+        lookup = self._by_name(areas)
+        first, second = lookup.get(locations[0]), lookup.get(locations[1])
+        if first is None or second is None or first is second:
+            return None
+        difference = first["avg_combined_accessibility"] - second["avg_combined_accessibility"]
+        if abs(difference) < 0.05:
+            interpretation = "both areas have broadly similar water access"
+        elif difference > 0:
+            interpretation = f"{first['sublocation_name']} has better water access than {second['sublocation_name']}"
+        else:
+            interpretation = f"{second['sublocation_name']} has better water access than {first['sublocation_name']}"
+        return {
+            "sublocation1": first["sublocation_name"],
+            "sublocation2": second["sublocation_name"],
+            "category1": first["accessibility_category"],
+            "category2": second["accessibility_category"],
+            "score1": f"{first['avg_combined_accessibility']:.3f}",
+            "score2": f"{second['avg_combined_accessibility']:.3f}",
+            "score_difference": f"{abs(difference):.3f}",
+            "interpretation": interpretation,
+        }
+
+    def _best_access(self, areas, snapshot, locations):
+        if not areas:
+            return None
+        best = areas[-1]
+        return {
+            "best_sublocation": best["sublocation_name"],
+            "best_score": f"{best['avg_combined_accessibility']:.3f}",
+            "best_category": best["accessibility_category"],
+            "best_population": f"{self._population(best):,}",
+            "best_water_points": best["water_points_count"],
+        }
+
+    def _average(self, areas, snapshot, locations):
+        stats = snapshot.stats
+        average = stats["avg_accessibility"]
+        if average is None:
+            return None
+        return {
+            "avg_score": f"{average:.3f}",
+            "avg_category": classify_accessibility(average),
+            "min_score": f"{stats['min_accessibility']:.3f}",
+            "max_score": f"{stats['max_accessibility']:.3f}",
+            "above_avg_count": sum(1 for area in areas if (area["avg_combined_accessibility"] or average) > average),
+            "below_avg_count": sum(1 for area in areas if (area["avg_combined_accessibility"] or average) < average),
+        }
+
+    def _category_population(self, snapshot: DataSnapshot) -> Dict[str, Tuple[int, int]]:
+        return {cat["category"]: (cat["count"], cat["population"] or 0) for cat in snapshot.categories}
+
+    def _poor_access(self, areas, snapshot, locations):
+        categories = self._category_population(snapshot)
+        very_weak = categories.get("Very Weak", (0, 0))[1]
+        weak = categories.get("Weak", (0, 0))[1]
+        total = snapshot.stats["total_population"] or 0
+        return {
+            "poor_population": f"{very_weak + weak:,}",
+            "poor_percentage": f"{100.0 * (very_weak + weak) / total:.1f}" if total else "0.0",
+            "very_weak_pop": f"{very_weak:,}",
+            "weak_pop": f"{weak:,}",
+        }
+
+    def _full_statistics(self, areas, snapshot, locations):
+        if snapshot.stats["avg_accessibility"] is None:
+            return None
+        categories = self._category_population(snapshot)
+        values = {
+            "total_pop": f"{snapshot.stats['total_population'] or 0:,}",
+            "avg_score": f"{snapshot.stats['avg_accessibility']:.3f}",
+        }
+        for prefix, category in (("vg", "Very Good"), ("good", "Good"), ("weak", "Weak"), ("vw", "Very Weak")):
+            count, population = categories.get(category, (0, 0))
+            values[f"{prefix}_count"] = count
+            values[f"{prefix}_pop"] = f"{population:,}"
+        return values
+
+    def _worst_ranking(self, areas, snapshot, locations):
+        worst = [area for area in areas if area["accessibility_category"] in ("Very Weak", "Weak")][:5]
+        if not worst:
+            return None
+        return {
+            "worst_areas": [area["sublocation_name"] for area in worst],
+            "worst_population": f"{sum(self._population(area) for area in worst):,}",
+            "threshold": "1.2",
+        }
+
+    def _full_ranking(self, areas, snapshot, locations):
+        ranking = list(reversed(areas))
+        return {
+            "full_ranking": ", ".join(f"{area['sublocation_name']} ({area['avg_combined_accessibility']:.3f})" for area in ranking),
+            "top_3": [area["sublocation_name"] for area in ranking[:3]],
+            "bottom_3": [area["sublocation_name"] for area in ranking[-3:]],
+        }
+
+    def _top_ranking(self, areas, snapshot, locations):
+        top = list(reversed(areas))[:5]
+        if not top:
+            return None
+        return {
+            "top_5_areas": [area["sublocation_name"] for area in top],
+            "top_5_population": f"{sum(self._population(area) for area in top):,}",
+            "top_5_avg_score": f"{sum(area['avg_combined_accessibility'] for area in top) / len(top):.3f}",
+        }
+
+    def _poor_areas_by_need(self, areas) -> List[Dict[str, Any]]:
+        poor = [area for area in areas if area["accessibility_category"] in ("Very Weak", "Weak")]
+        # Largest accessibility gap times population first
+        return sorted(poor, key=lambda area: (1.2 - area["avg_combined_accessibility"]) * self._population(area), reverse=True)
+
+    def _population_mismatch(self, areas, snapshot, locations):
+        populations = sorted(self._population(area) for area in areas)
+        if not populations:
+            return None
+        median = populations[len(populations) // 2]
+        priority = [area for area in self._poor_areas_by_need(areas) if self._population(area) >= median]
+        if not priority:
+            return None
+        affected = sum(self._population(area) for area in priority)
+        poor_total = sum(self._population(area) for area in self._poor_areas_by_need(areas))
+        return {
+            "priority_areas": [area["sublocation_name"] for area in priority],
+            "total_affected_pop": f"{affected:,}",
+            "percentage_affected": f"{100.0 * affected / poor_total:.1f}" if poor_total else "0.0",
+        }
+
+    def _infrastructure(self, areas, snapshot, locations):
+        recommended = self._poor_areas_by_need(areas)[:5]
+        if not recommended:
+            return None
+        return {
+            "recommended_areas": [area["sublocation_name"] for area in recommended],
+            "priority_order": " > ".join(area["sublocation_name"] for area in recommended),
+        }
@@ -0,0 +1,113 @@
+# llm_limiter.py - Bounded concurrency and back-pressure for Claude API calls
+import asyncio
+import math
+import os
+from typing import Any, Awaitable, Callable, Dict
+
+
+class LLMOverloadedError(Exception):
+    """Raised when the LLM wait queue is full; maps to HTTP 429 with Retry-After"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"LLM capacity exhausted, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class LLMLimiter:
+    """Caps concurrent LLM calls, bounds the wait queue and times out slow calls.
+
+    At most ``max_concurrency`` completions run at once. Up to ``max_queue``
+    further callers wait for a slot for at most ``queue_timeout`` seconds;
+    anything beyond that is rejected immediately with LLMOverloadedError so
+    the client can back off instead of piling onto the worker.
+    """
+
+    def __init__(self, max_concurrency: int = 4, max_queue: int = 16,
+                 queue_timeout: float = 10.0, call_timeout: float = 60.0):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.call_timeout = call_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._in_flight = 0
+        self._waiting = 0
+        self._rejected = 0
+        self._timed_out = 0
+        self._avg_latency = 5.0
+
+    @classmethod
+    def from_env(cls) -> "LLMLimiter":
+        return cls(
+            max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "4")),
+            max_queue=int(os.getenv("LLM_MAX_QUEUE", "16")),
+            queue_timeout=float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "10")),
+            call_timeout=float(os.getenv("LLM_TIMEOUT_SECONDS", "60")),
+        )
+
+    def retry_after(self) -> int:
+        """Estimate seconds until a slot frees up, from the observed call latency"""
+        backlog = (self._waiting + 1) / max(self.max_concurrency, 1)
+        return max(1, math.ceil(self._avg_latency * backlog))
+
+    async def acquire(self) -> float:
+        """Wait for a free slot; returns the start time to hand back to ``release``"""
+        if self._in_flight + self._waiting >= self.max_concurrency + self.max_queue:
+            self._rejected += 1
+            raise LLMOverloadedError(self.retry_after())
+
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._rejected += 1
+            raise LLMOverloadedError(self.retry_after())
+        finally:
+            self._waiting -= 1
+
+        self._in_flight += 1
+        return asyncio.get_running_loop().time()
+
+    def release(self, started: float):
+        """Free the slot taken by ``acquire``"""
+        self._in_flight -= 1
+        self._semaphore.release()
+        # Exponential moving average drives the Retry-After estimate
+        elapsed = asyncio.get_running_loop().time() - started
+        self._avg_latency = 0.8 * self._avg_latency + 0.2 * elapsed
+
+    def releaser(self, started: float) -> Callable[[], None]:
+        """``release`` for one slot as a callback that is safe to call more than once"""
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                self.release(started)
+
+        return release
+
+    async def run(self, call: Callable[[], Awaitable[Any]]) -> Any:
+        """Run ``call()`` once a slot is free, enforcing queue and call timeouts"""
+        started = await self.acquire()
+        try:
+            return await asyncio.wait_for(call(), timeout=self.call_timeout)
+        except asyncio.TimeoutError:
+            self._timed_out += 1
+            raise
+        finally:
+            self.release(started)
+
+    def record_timeout(self):
+        self._timed_out += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "in_flight": self._in_flight,
+            "waiting": self._waiting,
+            "rejected": self._rejected,
+            "timed_out": self._timed_out,
+            "avg_latency_seconds": round(self._avg_latency, 3),
+        }
@@ -1,14 +1,40 @@
 # main.py - HydroGPT Backend
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from pydantic import BaseModel, Field
 import anthropic
 import asyncpg
+import asyncio
 import json
+import numpy as np
 import os
-from typing import Optional, Dict, Any
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional, Dict, Any, AsyncIterator, Awaitable, Callable, List, Tuple
 from datetime import datetime
 from dotenv import load_dotenv
+from regions import UnknownRegionError, default_region, region_directory
+from snapshot import RegionSnapshots
+from context_builder import ContextBuilder, ContextSelection
+from conversation import Conversation, ConversationStore
+from llm_limiter import LLMLimiter, LLMOverloadedError
+from streaming import IncrementalJSONParser, sse_event
+from intent_router import IntentRouter, canonicalize_query
+from response_cache import ResponseCache
+from geojson_cache import PayloadCache, etag_matches, feature, feature_collection
+from singleflight import SingleFlight
+from accessibility import AccessibilityEngine
+from scenarios import ScenarioDelta, ScenarioEvaluator
+from optimizer import MAX_CANDIDATES, TIMEOUT_GRACE_SECONDS, CandidateSites, SitingOptimizer, grid_candidates
+from grid_store import GridStore
+from queries import registry as queries, pool_options, pool_stats
+from metrics import metrics
+import tracing
+from tiles import TileCache, LAYER_SQL, LAYER_TABLES, MVT_MEDIA_TYPE, valid_tile
+from water_points import WaterPointQuery, MAX_LIMIT, parse_bbox, build_query as build_water_points_query
 
 # Load environment variables
 load_dotenv()
@@ -22,19 +48,82 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Trace-Id"],
 )
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Latency and a trace span per endpoint template; streaming responses are timed until their headers are sent"""
+    started = time.perf_counter()
+    status = 500
+    with tracing.server_span(request.method, request.headers) as request_span:
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            if request_span is not None:
+                response.headers["X-Trace-Id"] = tracing.trace_id(request_span)
+            return response
+        finally:
+            route = request.scope.get("route")
+            endpoint = route.path if route is not None else "unmatched"
+            metrics.observe(
+                "http_request_duration_seconds", time.perf_counter() - started,
+                endpoint=endpoint, method=request.method, status=str(status)
+            )
+            tracing.finish_request(request_span, request.method, endpoint, status)
+
 class QueryRequest(BaseModel):
     query: str
     user_id: Optional[str] = "anonymous"
+    # Enables follow-up questions; omit for stateless queries
+    session_id: Optional[str] = Field(None, max_length=128)
+    # Study area to answer about; omit for DEFAULT_REGION
+    region: Optional[str] = Field(None, max_length=64)
+
+class NewWaterPoint(BaseModel):
+    lat: float = Field(..., ge=-90, le=90)
+    lon: float = Field(..., ge=-180, le=180)
+    capacity: int = Field(..., ge=1, le=3)
+
+class CapacityChange(BaseModel):
+    id: int
+    capacity: int = Field(..., ge=1, le=3)
+
+class ScenarioRequest(BaseModel):
+    add: List[NewWaterPoint] = []
+    remove: List[int] = []
+    set_capacity: List[CapacityChange] = []
+
+class CandidateSite(BaseModel):
+    lat: float = Field(..., ge=-90, le=90)
+    lon: float = Field(..., ge=-180, le=180)
+
+class SitingRequest(BaseModel):
+    sites: int = Field(5, ge=1, le=50)
+    capacity: int = Field(3, ge=1, le=3)
+    candidates: Optional[List[CandidateSite]] = Field(None, max_length=MAX_CANDIDATES)
+    grid_spacing_km: float = Field(1.0, ge=0.25, le=20)
+    time_budget_seconds: float = Field(5.0, gt=0, le=60)
+
+CLAUDE_MODEL = "claude-3-5-sonnet-20241022"
+
+
+def llm_span_attributes(request: Dict[str, Any]) -> Dict[str, Any]:
+    """GenAI semantic-convention attributes for a Claude request span"""
+    return {
+        "gen_ai.system": "anthropic",
+        "gen_ai.operation.name": "chat",
+        "gen_ai.request.model": request["model"],
+        "gen_ai.request.max_tokens": request["max_tokens"],
+    }
 
 # ADVANCED AI SYSTEM PROMPT - HydroGPT Spatial Intelligence Engine
 HYDROGPT_SYSTEM_PROMPT = """
-You are HydroGPT, an ADVANCED SPATIAL INTELLIGENCE AI with COMPLETE SYSTEM CONTROL over water accessibility analysis in Mbeere South Subcounty, Kenya. You operate like a sophisticated AI assistant that can control every aspect of the interface - maps, charts, popups, navigation, and data visualization.
+You are HydroGPT, an ADVANCED SPATIAL INTELLIGENCE AI with COMPLETE SYSTEM CONTROL over water accessibility analysis in the study area named in the database context. You operate like a sophisticated AI assistant that can control every aspect of the interface - maps, charts, popups, navigation, and data visualization.
 
 🧠 SPATIAL INTELLIGENCE CORE:
 You have complete situational awareness of:
-- All 19 sublocations with precise geographic knowledge
+- Every sublocation in the study area with precise geographic knowledge
 - Real-time data relationships and patterns
 - User intent prediction and proactive assistance
 - Dynamic interface adaptation based on queries
@@ -52,7 +141,7 @@ You have complete situational awareness of:
 - Very Good (1.5+): EXCELLENT - Optimal water accessibility
 
 🗺️ SUBLOCATION INTELLIGENCE DATABASE:
-GACABARI, GACHOKA, GACHURURIRI, GATEGI, GICHICHE, KARABA, KIAMBERE, KIAMURINGA, KIRIMA, KITHUNTHIRI, MAKIMA, MAVURIA, MBITA, MBONDONI, MWEA, NYANGWA, RIACHINA, RIAKANAU, WACHORO
+The database context lists every sublocation of the current study area - only use those names. The examples below are from Mbeere South Subcounty, Kenya.
 
 🤖 AI RESPONSE FORMAT (ALWAYS JSON):
 {
@@ -256,16 +345,46 @@ Query: "Show me details about Kiambere"
 - Adapt complexity to query sophistication
 """
 
+@dataclass
+class RegionAnalysis:
+    """Accessibility engine, scenario baseline, candidate grids and grid store for one region's data version"""
+    version: Optional[str] = None
+    engine: Optional[AccessibilityEngine] = None
+    evaluator: Optional[ScenarioEvaluator] = None
+    candidates: Dict[float, CandidateSites] = field(default_factory=dict)
+    grid_store: Optional[GridStore] = None
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
 class HydroGPTService:
     def __init__(self):
         self.claude_client = None
         self.db_pool = None
+        self.snapshots = RegionSnapshots()
+        self.llm_limiter = LLMLimiter.from_env()
+        self.intent_router = IntentRouter.from_env()
+        self.response_cache = ResponseCache.from_env()
+        self.context_builder = ContextBuilder.from_env()
+        self.conversations = ConversationStore.from_env()
+        self.prompt_cache = os.getenv("PROMPT_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+        self.map_cache = PayloadCache("default_map")
+        self.water_points_cache = PayloadCache("water_points")
+        # Concurrent identical requests share one computation (same canonical key and data version)
+        self.query_flights = SingleFlight("query")
+        self.water_point_flights = SingleFlight("water_points_filtered")
+        self.tile_flights = SingleFlight("tiles")
+        self.srids: Dict[str, int] = {}
+        self.tile_cache = TileCache.from_env()
+        # Engines hold travel-time matrices, so only the most recently used regions are kept
+        self.analyses: "OrderedDict[str, RegionAnalysis]" = OrderedDict()
+        self.max_analyses = int(os.getenv("ACCESSIBILITY_MAX_REGIONS", "4"))
+        self.grid_store_dir = os.getenv("GRID_STORE_DIR") or None
         
     async def init_claude(self):
         """Initialize Claude API client"""
         api_key = os.getenv("ANTHROPIC_API_KEY")
         if api_key:
-            self.claude_client = anthropic.Anthropic(api_key=api_key)
+            # Async client so a slow completion never blocks the event loop
+            self.claude_client = anthropic.AsyncAnthropic(api_key=api_key)
             print("✅ Claude API initialized successfully")
         else:
             print("❌ ANTHROPIC_API_KEY not found in environment variables")
@@ -277,113 +396,222 @@ class HydroGPTService:
             if not database_url:
                 print("❌ DATABASE_URL environment variable not set")
                 return
-            self.db_pool = await asyncpg.create_pool(database_url)
+            self.db_pool = await asyncpg.create_pool(database_url, **pool_options())
             print("✅ Database connected successfully")
+            if self.conversations:
+                self.conversations.use_pool(self.db_pool)
         except Exception as e:
             print(f"❌ Database connection failed: {e}")
+            return
+        
+        # Map the last published accessibility grid so it can be served before any recompute
+        region_id = default_region()
+        self.analysis(region_id).grid_store = GridStore.open(region_directory(self.grid_store_dir, region_id))
+        
+        try:
+            await self.snapshots.start(self.db_pool, database_url)
+        except Exception as e:
+            print(f"❌ Data snapshot build failed: {e}")
+    
+    def collect_gauges(self):
+        """Live pool, limiter, cache and session sizes for the /metrics exposition"""
+        pool = pool_stats(self.db_pool)
+        if pool["connected"]:
+            metrics.set_gauge("db_pool_connections", pool["in_use"], state="in_use")
+            metrics.set_gauge("db_pool_connections", pool["idle"], state="idle")
+            metrics.set_gauge("db_pool_max_connections", pool["max_size"])
+        limiter = self.llm_limiter.stats()
+        metrics.set_gauge("llm_requests", limiter["in_flight"], state="in_flight")
+        metrics.set_gauge("llm_requests", limiter["waiting"], state="waiting")
+        if self.response_cache:
+            cache = self.response_cache.stats()
+            metrics.set_gauge("response_cache_entries", cache["entries"])
+            metrics.set_gauge("response_cache_bytes", cache["bytes"])
+        if self.conversations:
+            metrics.set_gauge("conversation_sessions", self.conversations.stats()["sessions"])
+        for flights in (self.query_flights, self.map_cache.flights, self.water_points_cache.flights,
+                        self.water_point_flights, self.tile_flights):
+            metrics.set_gauge("singleflight_in_flight", flights.in_flight, group=flights.name)
     
-    async def get_context_data(self, query: str) -> str:
-        """Get comprehensive database context for intelligent AI responses"""
+    async def close(self):
+        """Release background tasks and database connections"""
+        await self.snapshots.close()
+        if self.db_pool:
+            await self.db_pool.close()
+    
+    async def select_context(self, query: str, focus: List[str] = (), region_id: Optional[str] = None) -> ContextSelection:
+        """Database context for a query: overview statistics plus the sublocation rows it needs"""
         if not self.db_pool:
-            return "Database not connected"
+            return ContextSelection.plain("Database not connected")
             
         try:
-            async with self.db_pool.acquire() as conn:
-                # Comprehensive sublocation data with new classification
-                sublocation_data = await conn.fetch("""
-                    SELECT 
-                        sublocation_name,
-                        avg_combined_accessibility,
-                        total_population,
-                        CASE 
-                            WHEN avg_combined_accessibility < 1.0 THEN 'Very Weak'
-                            WHEN avg_combined_accessibility < 1.2 THEN 'Weak'  
-                            WHEN avg_combined_accessibility < 1.5 THEN 'Good'
-                            ELSE 'Very Good'
-                        END as accessibility_category,
-                        water_points_count,
-                        high_capacity_water_points,
-                        medium_capacity_water_points,
-                        low_capacity_water_points
-                    FROM sublocation_statistics 
-                    ORDER BY avg_combined_accessibility ASC
-                """)
-                
-                # Statistical summary
-                stats = await conn.fetchrow("""
-                    SELECT 
-                        COUNT(*) as total_sublocations,
-                        AVG(avg_combined_accessibility) as avg_accessibility,
-                        MIN(avg_combined_accessibility) as min_accessibility,
-                        MAX(avg_combined_accessibility) as max_accessibility,
-                        SUM(total_population) as total_population,
-                        SUM(water_points_count) as total_water_points
-                    FROM sublocation_statistics
-                """)
-                
-                # Category distribution
-                categories = await conn.fetch("""
-                    SELECT 
-                        CASE 
-                            WHEN avg_combined_accessibility < 1.0 THEN 'Very Weak'
-                            WHEN avg_combined_accessibility < 1.2 THEN 'Weak'  
-                            WHEN avg_combined_accessibility < 1.5 THEN 'Good'
-                            ELSE 'Very Good'
-                        END as category,
-                        COUNT(*) as count,
-                        SUM(total_population) as population
-                    FROM sublocation_statistics
-                    GROUP BY 1
-                    ORDER BY MIN(avg_combined_accessibility)
-                """)
-                
-                # Build comprehensive context
-                context = f"""
-REAL-TIME DATABASE CONTEXT (Mbeere South Subcounty):
-
-OVERVIEW STATISTICS:
-- Total sublocations: {stats['total_sublocations']}
-- Total population: {stats['total_population']:,} people
-- Total water points: {stats['total_water_points']}
-- Average accessibility score: {stats['avg_accessibility']:.3f}
-- Accessibility range: {stats['min_accessibility']:.3f} to {stats['max_accessibility']:.3f}
-
-CATEGORY DISTRIBUTION:
-"""
-                for cat in categories:
-                    context += f"- {cat['category']}: {cat['count']} areas, {cat['population']:,} people\n"
-                
-                context += "\nDETAILED SUBLOCATION DATA:\n"
-                for area in sublocation_data:
-                    context += f"- {area['sublocation_name']}: {area['avg_combined_accessibility']:.3f} ({area['accessibility_category']}) | Pop: {area['total_population']:,} | Water points: {area['water_points_count']}\n"
-                
-                # Identify worst and best areas
-                worst_areas = [area for area in sublocation_data if area['accessibility_category'] in ['Very Weak', 'Weak']][:3]
-                best_areas = [area for area in sublocation_data if area['accessibility_category'] == 'Very Good'][-3:]
-                
-                context += f"\nPRIORITY INTERVENTION AREAS (Worst 3):\n"
-                for area in worst_areas:
-                    context += f"- {area['sublocation_name']}: {area['avg_combined_accessibility']:.3f} ({area['accessibility_category']}) - {area['total_population']:,} people affected\n"
-                
-                context += f"\nTOP PERFORMING AREAS (Best 3):\n"
-                for area in best_areas:
-                    context += f"- {area['sublocation_name']}: {area['avg_combined_accessibility']:.3f} ({area['accessibility_category']}) - {area['total_population']:,} people well-served\n"
-                
-                return context
-                
+            # Served from the in-memory snapshot - no database round-trip unless the data changed
+            with metrics.timer("query_stage_seconds", stage="context"):
+                snapshot = await self.snapshots.get(region_id)
+                return self.context_builder.select(query, snapshot, focus)
+        except Exception as e:
+            return ContextSelection.plain(f"Error getting context: {e}")
+    
+    async def get_context_data(self, query: str, region_id: Optional[str] = None) -> str:
+        """Get database context for intelligent AI responses"""
+        return (await self.select_context(query, region_id=region_id)).text
+    
+    async def sublocation_names(self, region_id: Optional[str] = None) -> List[str]:
+        if not self.db_pool:
+            return []
+        try:
+            snapshot = await self.snapshots.get(region_id)
+        except Exception:
+            return []
+        return [area["sublocation_name"] for area in snapshot.sublocations]
+    
+    async def conversation(self, session_id: Optional[str], region_id: Optional[str] = None) -> Optional[Conversation]:
+        if not session_id or not self.conversations:
+            return None
+        return await self.conversations.get(conversation_key(session_id, region_id or default_region()))
+    
+    async def route_query(self, user_query: str, region_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Answer template queries straight from the snapshot; None means ask the LLM"""
+        if not self.intent_router or not self.db_pool:
+            return None
+        try:
+            snapshot = await self.snapshots.get(region_id)
+            routed = self.intent_router.route(user_query, snapshot)
         except Exception as e:
-            return f"Error getting context: {e}"
+            print(f"⚠️  Intent routing failed, falling back to Claude: {e}")
+            return None
+        if routed:
+            routed["timestamp"] = datetime.now().isoformat()
+        return routed
+    
+    async def query_key(self, user_query: str, region_id: Optional[str] = None) -> Optional[str]:
+        """Data snapshot version (which is region-specific) plus the canonicalized query, or None without a snapshot"""
+        if not self.db_pool:
+            return None
+        try:
+            snapshot = await self.snapshots.get(region_id)
+        except Exception:
+            return None
+        names = [area["sublocation_name"] for area in snapshot.sublocations]
+        return f"{snapshot.version}:{canonicalize_query(user_query, names)}"
     
-    async def process_query(self, user_query: str) -> Dict[str, Any]:
-        """Main query processing pipeline"""
+    async def response_cache_key(self, user_query: str, region_id: Optional[str] = None) -> Optional[str]:
+        """Cache key: data snapshot version plus the canonicalized query"""
+        if not self.response_cache:
+            return None
+        return await self.query_key(user_query, region_id)
+    
+    async def cached_response(self, cache_key: Optional[str]) -> Optional[Dict[str, Any]]:
+        if cache_key is None:
+            return None
+        cached = await self.response_cache.get(cache_key)
+        metrics.increment("response_cache_lookups_total", result="hit" if cached else "miss")
+        if cached:
+            cached["timestamp"] = datetime.now().isoformat()
+            cached["cached"] = True
+        return cached
+    
+    def build_request(self, user_query: str, context: ContextSelection,
+                      conversation: Optional[Conversation] = None) -> Dict[str, Any]:
+        """Claude request arguments, ordered from most to least stable for prompt caching.
+        
+        The system prompt and the data-version context are separate cacheable
+        system blocks, so a new data version re-uses the cached system prompt.
+        Recent conversation turns follow (cached up to the last one), then the
+        conversation summary, per-query rows and the user query, which are the
+        only input processed in full on a cache hit.
+        """
+        cache_control = {"cache_control": {"type": "ephemeral"}} if self.prompt_cache else {}
+        version = f" (data version {context.version})" if context.version else ""
+        history = conversation.messages() if conversation else []
+        # Cache breakpoints are only valid on non-empty text blocks
+        if history and history[-1]["content"].strip():
+            history[-1] = {"role": "assistant", "content": [{"type": "text", "text": history[-1]["content"], **cache_control}]}
+        preamble = conversation.preamble() if conversation else ""
+        return {
+            "model": CLAUDE_MODEL,
+            "max_tokens": 1500,
+            "system": [
+                {"type": "text", "text": HYDROGPT_SYSTEM_PROMPT, **cache_control},
+                {"type": "text", "text": f"CURRENT DATA CONTEXT{version}:\n{context.shared}", **cache_control},
+            ],
+            "messages": history + [{"role": "user", "content": f"""{preamble}{context.detail}
+USER QUERY: {user_query}
+
+Respond with JSON containing text_response and appropriate map_instructions/chart_instructions based on the query type.
+"""}],
+        }
+    
+    async def process_query(self, user_query: str, session_id: Optional[str] = None,
+                            region_id: Optional[str] = None) -> Dict[str, Any]:
+        """Main query processing pipeline; identical concurrent queries share one run.
+        
+        Within a session, follow-ups that refer back ("and its population?")
+        are answered with the conversation history; self-contained queries take
+        the shared stateless path. Every turn is recorded in the session.
+        """
+        started = time.perf_counter()
+        region_id = region_id or default_region()
+        conversation = await self.conversation(session_id, region_id)
+        names = await self.sublocation_names(region_id) if conversation else []
+        follow_up = conversation is not None and conversation.follows_up(user_query, names)
+        if follow_up:
+            response = await self._process_query(user_query, conversation, region_id)
+        else:
+            key = await self.query_key(user_query, region_id)
+            if key is None:
+                response = await self._process_query(user_query, region_id=region_id)
+            else:
+                response = await self.query_flights.run(key, lambda: self._process_query(user_query, region_id=region_id))
+        
+        if conversation is not None:
+            with metrics.timer("query_stage_seconds", stage="conversation"):
+                await self.conversations.record(conversation, user_query, response, names)
+        metrics.observe("query_seconds", time.perf_counter() - started, **self.query_labels(response, follow_up))
+        return response
+    
+    def query_labels(self, response: Dict[str, Any], follow_up: bool) -> Dict[str, str]:
+        """Low-cardinality labels for a finished query: answer source, intent and cache outcome"""
+        if response.get("cached"):
+            source = "response_cache"
+        elif response.get("source") == "intent_router":
+            source = "intent_router"
+        else:
+            source = "follow_up" if follow_up else "llm"
+        # query_type comes from Claude for LLM answers; only the router's intent names are kept
+        intents = self.intent_router.intents if self.intent_router else {}
+        intent = response.get("query_type")
+        return {
+            "source": source,
+            "intent": intent if intent in intents else "other",
+            "cache": "hit" if response.get("cached") else "miss",
+        }
+    
+    async def _process_query(self, user_query: str, conversation: Optional[Conversation] = None,
+                             region_id: Optional[str] = None) -> Dict[str, Any]:
+        # Follow-ups depend on the session, so they skip template answers and the shared response cache
+        cache_key = None
+        if conversation is None:
+            # High-confidence template queries never reach Claude
+            with metrics.timer("query_stage_seconds", stage="route"):
+                routed = await self.route_query(user_query, region_id)
+            if routed:
+                return routed
+            
+            # Repeated questions are answered from the response cache
+            with metrics.timer("query_stage_seconds", stage="response_cache"):
+                cache_key = await self.response_cache_key(user_query, region_id)
+                cached = await self.cached_response(cache_key)
+            if cached:
+                return cached
         
         # Get context data
-        context_data = await self.get_context_data(user_query)
+        context = await self.select_context(user_query, conversation.focus if conversation else (), region_id)
         
         # If no Claude API, return simple response
         if not self.claude_client:
             return {
-                "text_response": f"HydroGPT received your query: '{user_query}'. Claude API not configured, but I can see your data context: {context_data}",
+                "text_response": f"HydroGPT received your query: '{user_query}'. Claude API not configured, but I can see your data context: {context.text}",
                 "map_instructions": None,
                 "chart_instructions": None,
                 "timestamp": datetime.now().isoformat()
@@ -391,27 +619,23 @@ CATEGORY DISTRIBUTION:
         
         # Send to Claude API
         try:
-            full_prompt = f"""
-{HYDROGPT_SYSTEM_PROMPT}
-
-CURRENT DATA CONTEXT:
-{context_data}
-
-USER QUERY: {user_query}
-
-Respond with JSON containing text_response and appropriate map_instructions/chart_instructions based on the query type.
-"""
+            with metrics.timer("query_stage_seconds", stage="prompt"):
+                request = self.build_request(user_query, context, conversation)
             
-            response = self.claude_client.messages.create(
-                model="claude-3-5-sonnet-20241022",
-                max_tokens=1500,
-                messages=[{"role": "user", "content": full_prompt}]
-            )
+            with metrics.timer("query_stage_seconds", stage="llm", model=request["model"]), \
+                    tracing.span("anthropic.messages.create", **llm_span_attributes(request)) as llm_span:
+                response = await self.llm_limiter.run(lambda: self.claude_client.messages.create(**request))
+                tracing.record_usage(llm_span, response.model, response.usage)
+            usage = self.context_builder.record(context, response.usage, request["model"])
             
             # Parse JSON response
             try:
-                llm_response = json.loads(response.content[0].text)
+                with metrics.timer("query_stage_seconds", stage="parse"):
+                    llm_response = json.loads(response.content[0].text)
+                if cache_key:
+                    await self.response_cache.put(cache_key, llm_response)
                 llm_response["timestamp"] = datetime.now().isoformat()
+                llm_response["usage"] = usage
                 return llm_response
             except json.JSONDecodeError:
                 # If LLM doesn't return valid JSON, wrap the response
@@ -419,25 +643,293 @@ Respond with JSON containing text_response and appropriate map_instructions/char
                     "text_response": response.content[0].text,
                     "map_instructions": None,
                     "chart_instructions": None,
-                    "timestamp": datetime.now().isoformat()
+                    "timestamp": datetime.now().isoformat(),
+                    "usage": usage
                 }
             
+        except (LLMOverloadedError, asyncio.TimeoutError):
+            # Surfaced to the client as 429/504 by the endpoint
+            raise
         except Exception as e:
             return {
                 "text_response": f"Error processing query with Claude API: {e}",
                 "map_instructions": None,
                 "chart_instructions": None,
-                "timestamp": datetime.now().isoformat()
+                "timestamp": datetime.now().isoformat(),
+                "error": True
             }
+    
+    async def stream_query(self, user_query: str, session_id: Optional[str] = None,
+                           region_id: Optional[str] = None) -> Tuple[AsyncIterator[str], Optional[Callable[[], None]]]:
+        """Prepare a Server-Sent Events stream for a user query.
+        
+        The LLM slot is reserved before the stream is returned, so overload
+        still surfaces as a 429 instead of an error event mid-stream. The
+        returned release callback frees it and must run even if the stream
+        is never iterated (client gone before the body starts); the stream
+        also calls it when it ends, and only the first call counts.
+        """
+        region_id = region_id or default_region()
+        conversation = await self.conversation(session_id, region_id)
+        names = await self.sublocation_names(region_id) if conversation else []
+        follow_up = conversation if conversation is not None and conversation.follows_up(user_query, names) else None
+        record = None
+        if conversation is not None:
+            async def record(answer: Dict[str, Any]):
+                await self.conversations.record(conversation, user_query, answer, names)
+        
+        response = None
+        cache_key = None
+        if follow_up is None:
+            response = await self.route_query(user_query, region_id)
+            if response is None:
+                cache_key = await self.response_cache_key(user_query, region_id)
+                response = await self.cached_response(cache_key)
+        if response is None and not self.claude_client:
+            response = await self._process_query(user_query, follow_up, region_id)
+        
+        if response is not None:
+            if record:
+                await record(response)
+            
+            async def complete_events():
+                yield sse_event("text", {"delta": response["text_response"]})
+                for key in ("map_instructions", "chart_instructions"):
+                    if response.get(key):
+                        yield sse_event(key, response[key])
+                yield sse_event("done", response)
+            
+            return complete_events(), None
+        
+        context = await self.select_context(user_query, follow_up.focus if follow_up else (), region_id)
+        started = await self.llm_limiter.acquire()
+        release = self.llm_limiter.releaser(started)
+        try:
+            request = self.build_request(user_query, context, follow_up)
+        except Exception:
+            release()
+            raise
+        return self._stream_events(request, started, release, cache_key, context, record), release
+    
+    async def _stream_events(self, request: Dict[str, Any], started: float, release: Callable[[], None],
+                             cache_key: Optional[str], context: ContextSelection,
+                             record: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None) -> AsyncIterator[str]:
+        """Forward text_response tokens and each instruction object as soon as it is complete"""
+        parser = IncrementalJSONParser()
+        loop = asyncio.get_running_loop()
+        deadline = started + self.llm_limiter.call_timeout
+        
+        # Not made current: the generator resumes in the response task, outside the request span
+        with tracing.detached_span("anthropic.messages.stream", **llm_span_attributes(request)) as llm_span:
+            try:
+                async with self.claude_client.messages.stream(**request) as stream:
+                    chunks = stream.text_stream.__aiter__()
+                    first_token = True
+                    while True:
+                        try:
+                            chunk = await asyncio.wait_for(chunks.__anext__(), timeout=max(deadline - loop.time(), 0))
+                        except StopAsyncIteration:
+                            break
+                        if first_token:
+                            metrics.observe("llm_first_token_seconds", loop.time() - started, model=request["model"])
+                            first_token = False
+                    
+                        for event in parser.feed(chunk):
+                            if event[0] == "text_delta":
+                                yield sse_event("text", {"delta": event[2]})
+                            elif event[1] in ("map_instructions", "chart_instructions") and event[2]:
+                                yield sse_event(event[1], event[2])
+                
+                    message = await stream.get_final_message()
+                    tracing.record_usage(llm_span, message.model, message.usage)
+            
+                try:
+                    llm_response = parser.result()
+                except json.JSONDecodeError:
+                    llm_response = None
+                if not isinstance(llm_response, dict):
+                    # If LLM doesn't return valid JSON, wrap the response
+                    llm_response = {
+                        "text_response": parser.text,
+                        "map_instructions": None,
+                        "chart_instructions": None
+                    }
+                elif cache_key:
+                    await self.response_cache.put(cache_key, llm_response)
+                llm_response["timestamp"] = datetime.now().isoformat()
+                metrics.observe("query_stage_seconds", loop.time() - started, stage="llm_stream", model=request["model"])
+                llm_response["usage"] = self.context_builder.record(context, message.usage, request["model"])
+                if record:
+                    await record(llm_response)
+                yield sse_event("done", llm_response)
+            
+            except asyncio.TimeoutError:
+                self.llm_limiter.record_timeout()
+                tracing.set_attributes(llm_span, **{"error.type": "timeout"})
+                yield sse_event("error", {"detail": "Claude API call timed out"})
+            except Exception as e:
+                tracing.set_attributes(llm_span, **{"error.type": type(e).__name__})
+                yield sse_event("error", {"detail": f"Error processing query with Claude API: {e}"})
+            finally:
+                release()
+
+    async def build_default_map_data(self, region_id: Optional[str] = None) -> bytes:
+        """Serialize a region's sublocation FeatureCollection for the map"""
+        region_id = region_id or default_region()
+        async with queries.acquire(self.db_pool) as conn:
+            # Precomputed per-sublocation rollup (database/init.sql) when present: a plain indexed read
+            if await queries.fetchval(conn, "rollup_exists"):
+                sublocations = await queries.fetch(conn, "default_map_rollup", region_id)
+            else:
+                sublocations = await queries.fetch(conn, "default_map_legacy", region_id)
+        
+        # Geometry text from PostGIS is embedded as-is rather than parsed and re-encoded
+        return feature_collection([
+            feature(json.dumps({
+                "name": row['sublocation_name'],
+                "accessibility": float(row['accessibility_score']),
+                "category": row['accessibility_category'],
+                "population": int(row['total_population']),
+                "water_points": row['water_points']
+            }), row['geometry'])
+            for row in sublocations
+        ])
+
+    def analysis(self, region_id: str) -> RegionAnalysis:
+        """Accessibility state for a region, evicting the least recently used beyond max_analyses"""
+        analysis = self.analyses.get(region_id)
+        if analysis is None:
+            analysis = self.analyses[region_id] = RegionAnalysis()
+        self.analyses.move_to_end(region_id)
+        while len(self.analyses) > self.max_analyses:
+            self.analyses.popitem(last=False)
+        return analysis
+    
+    async def get_analysis(self, region_id: Optional[str] = None) -> RegionAnalysis:
+        """SCM-G2SFCA engine and scenario baseline for a region's current data version, built on first use"""
+        region_id = region_id or default_region()
+        snapshot = await self.snapshots.get(region_id)
+        analysis = self.analysis(region_id)
+        async with analysis.lock:
+            if analysis.engine is None or analysis.version != snapshot.version:
+                async with queries.acquire(self.db_pool) as conn:
+                    engine = await AccessibilityEngine.load(conn, region_id)
+                # Baseline run fixes the reference score that scenarios are compared against
+                analysis.evaluator = await asyncio.to_thread(ScenarioEvaluator, engine)
+                analysis.candidates = {}
+                analysis.engine = engine
+                analysis.version = snapshot.version
+        return analysis
+    
+    async def get_grid_store(self, region_id: Optional[str] = None) -> GridStore:
+        """Per-demand-point accessibility columns for a region's current data version"""
+        region_id = region_id or default_region()
+        snapshot = await self.snapshots.get(region_id)
+        analysis = self.analysis(region_id)
+        if analysis.grid_store is not None and analysis.grid_store.version == snapshot.version:
+            return analysis.grid_store
+        
+        # Another worker may already have published this version
+        directory = region_directory(self.grid_store_dir, region_id)
+        store = await asyncio.to_thread(GridStore.open, directory)
+        if store is None or store.version != snapshot.version:
+            analysis = await self.get_analysis(region_id)
+            store = GridStore.from_result(snapshot.version, analysis.engine, analysis.evaluator.baseline)
+            if directory:
+                await asyncio.to_thread(store.write, directory)
+                store = await asyncio.to_thread(GridStore.open, directory)
+        analysis.grid_store = store
+        return store
+    
+    async def candidate_sites(self, spacing_km: float, region_id: Optional[str] = None) -> CandidateSites:
+        """Grid candidate sites with precomputed catchments, kept for the region's current engine"""
+        analysis = await self.get_analysis(region_id)
+        sites = analysis.candidates.get(spacing_km)
+        if sites is None:
+            async with queries.acquire(self.db_pool) as conn:
+                points = await grid_candidates(conn, spacing_km, region_id)
+            sites = await asyncio.to_thread(CandidateSites.build, analysis.engine, points[:, 0], points[:, 1])
+            analysis.candidates[spacing_km] = sites
+        return sites
+    
+    async def table_srid(self, conn: asyncpg.Connection, table: str) -> int:
+        """SRID of a table's geom column, looked up once"""
+        if table not in self.srids:
+            self.srids[table] = await queries.fetchval(conn, f"{table}_srid") or 4326
+        return self.srids[table]
+    
+    async def render_tile(self, conn: asyncpg.Connection, layer: str, z: int, x: int, y: int, region_id: str) -> bytes:
+        """One vector tile; sublocations are read from the precomputed rollup when it exists"""
+        if layer == "sublocations" and await queries.fetchval(conn, "rollup_exists"):
+            return await queries.fetchval(conn, "tile_sublocations_rollup", z, x, y, region_id) or b""
+        srid = await self.table_srid(conn, LAYER_TABLES[layer])
+        return await queries.fetchval(conn, f"tile_{layer}", z, x, y, srid, region_id) or b""
+    
+    async def build_water_points(self, params: WaterPointQuery) -> bytes:
+        """Serialize water points (or clusters, at low zoom) for a request"""
+        async with queries.acquire(self.db_pool) as conn:
+            sql, args = build_water_points_query(params, await self.table_srid(conn, "waterpoints"))
+            water_points = await queries.fetch(conn, "water_points", *args, sql=sql)
+        
+        if params.clustered:
+            return feature_collection([
+                feature(json.dumps({
+                    "cluster": True,
+                    "point_count": row['point_count'],
+                    "avg_capacity": round(float(row['avg_capacity']), 2) if row['avg_capacity'] is not None else None,
+                    "max_capacity": row['max_capacity']
+                }), row['geometry'])
+                for row in water_points
+            ])
+        
+        next_cursor = None
+        if params.limit is not None and len(water_points) > params.limit:
+            water_points = water_points[:params.limit]
+            next_cursor = water_points[-1]['id']
+        
+        body = feature_collection([
+            feature(json.dumps({
+                "id": row['id'],
+                "name": row['name'] or 'Unknown',
+                "water_source": row['water_source'] or 'Unknown',
+                "capacity_score": int(row['capacity_score']) if row['capacity_score'] else 1,
+                "status": row['status'] or 'Unknown'
+            }), row['geometry'])
+            for row in water_points
+        ])
+        if params.limit is not None:
+            # Paging info as a GeoJSON foreign member
+            body = body[:-1] + f',"next_cursor":{json.dumps(next_cursor)}}}'.encode()
+        return body
+
+def conversation_key(session_id: str, region_id: str) -> str:
+    """Sessions are per region; default-region keys are unchanged from before regions existed"""
+    return session_id if region_id == default_region() else f"{region_id}:{session_id}"
 
 # Initialize service
 hydrogpt_service = HydroGPTService()
+metrics.add_collector(hydrogpt_service.collect_gauges)
+
+REGION_QUERY = Query(None, max_length=64, description="Region id (see the regions table); defaults to DEFAULT_REGION")
+
+def resolve_region(region: Optional[str]) -> str:
+    """Region id for a request; unknown regions are a 404"""
+    try:
+        return hydrogpt_service.snapshots.region(region).region_id
+    except UnknownRegionError:
+        raise HTTPException(status_code=404, detail=f"Unknown region '{region}'")
 
 @app.on_event("startup")
 async def startup_event():
+    tracing.configure()
     await hydrogpt_service.init_claude()
     await hydrogpt_service.init_db()
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    await hydrogpt_service.close()
+    tracing.shutdown()
+
 @app.get("/")
 async def root():
     return {
@@ -446,13 +938,38 @@ async def root():
         "status": "ready",
         "database_connected": hydrogpt_service.db_pool is not None,
         "claude_configured": hydrogpt_service.claude_client is not None,
+        "data_version": hydrogpt_service.snapshots.snapshot.version if hydrogpt_service.snapshots.snapshot else None,
+        "regions": hydrogpt_service.snapshots.stats(),
+        "llm": hydrogpt_service.llm_limiter.stats(),
+        "response_cache": hydrogpt_service.response_cache.stats() if hydrogpt_service.response_cache else None,
+        "context": hydrogpt_service.context_builder.stats(),
+        "conversations": hydrogpt_service.conversations.stats() if hydrogpt_service.conversations else None,
+        "llm_first_token_seconds": metrics.snapshot("llm_first_token_seconds"),
+        "coalescing": {
+            flights.name: flights.stats()
+            for flights in (
+                hydrogpt_service.query_flights,
+                hydrogpt_service.map_cache.flights,
+                hydrogpt_service.water_points_cache.flights,
+                hydrogpt_service.water_point_flights,
+                hydrogpt_service.tile_flights,
+            )
+        },
         "endpoints": [
             "/api/query - Process natural language queries",
+            "/api/query/stream - Stream query responses as Server-Sent Events",
             "/api/default-map-data - Get sublocation map data",
+            "/tiles/{layer}/{z}/{x}/{y}.mvt - Vector tiles (sublocations, waterpoints)",
+            "?region=<region_id> - Select the study area on any endpoint (default: DEFAULT_REGION)",
             "/docs - API documentation"
         ]
     }
 
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus exposition of request, query stage, database, LLM token and cache metrics"""
+    return Response(content=metrics.render_prometheus(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.get("/health")
 async def health_check():
     """Simple health check endpoint for Railway"""
@@ -461,80 +978,110 @@ async def health_check():
 @app.post("/api/query")
 async def process_query(request: QueryRequest):
     """Process user query and return response with text, map, and chart instructions"""
+    region_id = resolve_region(request.region)
     try:
-        response = await hydrogpt_service.process_query(request.query)
+        response = await hydrogpt_service.process_query(request.query, request.session_id, region_id)
         return response
+    except LLMOverloadedError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Claude API call timed out")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/query/stream")
+async def stream_query(request: QueryRequest):
+    """Stream the query response as Server-Sent Events.
+    
+    Events: "text" ({"delta": ...}) as text_response tokens arrive,
+    "map_instructions" / "chart_instructions" as soon as each object is complete,
+    then "done" with the full response (or "error").
+    """
+    region_id = resolve_region(request.region)
+    try:
+        events, release = await hydrogpt_service.stream_query(request.query, request.session_id, region_id)
+    except LLMOverloadedError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Frees the LLM slot even when the client disconnects before the body starts
+        background=BackgroundTask(release) if release else None
+    )
+
+@app.delete("/api/conversations/{session_id}")
+async def clear_conversation(session_id: str, region: Optional[str] = REGION_QUERY):
+    """Forget a session's conversation history (e.g. when the user starts a new chat)"""
+    region_id = resolve_region(region)
+    if hydrogpt_service.conversations:
+        await hydrogpt_service.conversations.clear(conversation_key(session_id, region_id))
+    return {"session_id": session_id, "region": region_id, "cleared": True}
+
+@app.post("/api/snapshot/refresh")
+async def refresh_snapshot(region: Optional[str] = REGION_QUERY):
+    """Force a rebuild of a region's in-memory data snapshot (e.g. right after a data import)"""
+    if not hydrogpt_service.db_pool:
+        return {"error": "Database not connected"}
+    
+    try:
+        # A new region's row only becomes visible after the regions table is re-read
+        await hydrogpt_service.snapshots.reload_regions()
+        region_id = resolve_region(region)
+        snapshot = await hydrogpt_service.snapshots.refresh(region_id, force=True)
+        # This is the step documented after an import, so the map is rebuilt even if the version did not move
+        hydrogpt_service.map_cache.invalidate(region_id)
+        return {"region": snapshot.region_id, "data_version": snapshot.version, "built_at": snapshot.built_at.isoformat()}
+    except HTTPException:
+        raise
+    except Exception as e:
+        return {"error": f"Snapshot refresh failed: {e}"}
 
 @app.get("/api/default-map-data")
-async def get_default_map_data():
-    """Get initial map data - sublocations with accessibility colors"""
+async def get_default_map_data(request: Request, region: Optional[str] = REGION_QUERY):
+    """Get initial map data - sublocations with accessibility colors.
+    
+    The FeatureCollection is materialized once per region and data version and
+    served as pre-serialized (and pre-compressed) bytes with a strong ETag.
+    """
+    region_id = resolve_region(region)
     if not hydrogpt_service.db_pool:
         return {"error": "Database not connected"}
     
     try:
-        async with hydrogpt_service.db_pool.acquire() as conn:
-            # Get all 19 unique sublocations using slname field with avg_combined_accessibility
-            sublocations = await conn.fetch("""
-                SELECT 
-                    s.slname as sublocation_name,
-                    COALESCE(AVG(ss.avg_combined_accessibility), 0) as accessibility_score,
-                    COALESCE(AVG(ss.total_population), 0) as total_population,
-                    CASE 
-                        WHEN AVG(ss.avg_combined_accessibility) IS NULL THEN 'Unknown'
-                        WHEN AVG(ss.avg_combined_accessibility) < 1.0 THEN 'Very Weak'
-                        WHEN AVG(ss.avg_combined_accessibility) < 1.2 THEN 'Weak'  
-                        WHEN AVG(ss.avg_combined_accessibility) < 1.5 THEN 'Good'
-                        ELSE 'Very Good'
-                    END as accessibility_category,
-                    ST_AsGeoJSON(ST_Transform(ST_Union(s.geom), 4326)) as geometry
-                FROM sublocations s
-                LEFT JOIN sublocation_statistics ss ON s.slname = ss.sublocation_name
-                WHERE s.geom IS NOT NULL AND s.slname IS NOT NULL
-                GROUP BY s.slname
-                ORDER BY s.slname
-            """)
-        
-        return {
-            "type": "FeatureCollection",
-            "features": [
-                {
-                    "type": "Feature",
-                    "properties": {
-                        "name": row['sublocation_name'],
-                        "accessibility": float(row['accessibility_score']),
-                        "category": row['accessibility_category'],
-                        "population": int(row['total_population'])
-                    },
-                    "geometry": json.loads(row['geometry'])
-                }
-                for row in sublocations
-            ]
-        }
+        snapshot = await hydrogpt_service.snapshots.get(region_id)
+        payload = await hydrogpt_service.map_cache.get(
+            snapshot.version, lambda: hydrogpt_service.build_default_map_data(region_id), scope=region_id
+        )
+        return payload.response(request)
     except Exception as e:
         return {"error": f"Database query failed: {e}"}
 
 @app.get("/api/debug/tables")
-async def debug_tables():
+async def debug_tables(region: Optional[str] = REGION_QUERY):
     """Debug endpoint to check database tables"""
+    region_id = resolve_region(region)
     if not hydrogpt_service.db_pool:
         return {"error": "Database not connected"}
     
     try:
-        async with hydrogpt_service.db_pool.acquire() as conn:
+        async with queries.acquire(hydrogpt_service.db_pool) as conn:
             # Count sublocations
-            sublocation_count = await conn.fetchval("SELECT COUNT(*) FROM sublocations WHERE geom IS NOT NULL")
-            sublocation_names = await conn.fetch("SELECT locname FROM sublocations WHERE geom IS NOT NULL ORDER BY locname")
+            sublocation_count = await queries.fetchval(conn, "debug_sublocation_count", region_id)
+            sublocation_names = await queries.fetch(conn, "debug_sublocation_names", region_id)
             
             # Count statistics
-            stats_count = await conn.fetchval("SELECT COUNT(*) FROM sublocation_statistics")
-            stats_names = await conn.fetch("SELECT sublocation_name FROM sublocation_statistics ORDER BY sublocation_name")
+            stats_count = await queries.fetchval(conn, "debug_statistics_count", region_id)
+            stats_names = await queries.fetch(conn, "debug_statistics_names", region_id)
             
             # Count water points
-            waterpoint_count = await conn.fetchval("SELECT COUNT(*) FROM waterpoints WHERE geom IS NOT NULL")
+            waterpoint_count = await queries.fetchval(conn, "debug_waterpoint_count", region_id)
             
             return {
+                "region": region_id,
                 "sublocations": {
                     "count": sublocation_count,
                     "names": [row['locname'] for row in sublocation_names]
@@ -550,43 +1097,199 @@ async def debug_tables():
     except Exception as e:
         return {"error": f"Debug query failed: {e}"}
 
+@app.get("/api/debug/database")
+async def debug_database():
+    """Connection pool utilisation and per-query latency histograms"""
+    return {
+        "pool": pool_stats(hydrogpt_service.db_pool),
+        **queries.stats()
+    }
+
 @app.get("/api/water-points")
-async def get_water_points():
-    """Get water points data"""
+async def get_water_points(
+    request: Request,
+    bbox: Optional[str] = Query(None, description="Viewport as minLon,minLat,maxLon,maxLat (WGS84)"),
+    zoom: Optional[int] = Query(None, ge=0, le=22, description="Map zoom; trims coordinate precision and clusters at low zooms"),
+    capacity: Optional[str] = Query(None, description="Comma-separated capacity scores, e.g. 2,3"),
+    status: Optional[str] = Query(None, description="Comma-separated status values"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_LIMIT, description="Page size"),
+    cursor: Optional[int] = Query(None, description="next_cursor from the previous page"),
+    region: Optional[str] = REGION_QUERY
+):
+    """Get water points data, optionally bounded by viewport, zoom, filters and paging"""
+    region_id = resolve_region(region)
     if not hydrogpt_service.db_pool:
         return {"error": "Database not connected"}
     
     try:
-        async with hydrogpt_service.db_pool.acquire() as conn:
-            water_points = await conn.fetch("""
-                SELECT 
-                    source as name,
-                    water_sour as water_source,
-                    capacitysc as capacity_score,
-                    status,
-                    ST_AsGeoJSON(ST_Transform(geom, 4326)) as geometry
-                FROM waterpoints
-                WHERE geom IS NOT NULL
-            """)
+        params = WaterPointQuery(
+            region_id=region_id,
+            bbox=parse_bbox(bbox),
+            zoom=zoom,
+            capacity=[int(value) for value in capacity.split(",")] if capacity else [],
+            status=[value.strip() for value in status.split(",")] if status else [],
+            limit=limit,
+            cursor=cursor
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid water point parameters: {e}")
+    
+    try:
+        if params.is_default:
+            # Unfiltered requests share one pre-serialized payload per region and data version
+            snapshot = await hydrogpt_service.snapshots.get(region_id)
+            payload = await hydrogpt_service.water_points_cache.get(
+                snapshot.version, lambda: hydrogpt_service.build_water_points(params), scope=region_id
+            )
+            return payload.response(request)
         
+        snapshot = await hydrogpt_service.snapshots.get(region_id)
+        content = await hydrogpt_service.water_point_flights.run(
+            (snapshot.version, params.key), lambda: hydrogpt_service.build_water_points(params)
+        )
+        return Response(content=content, media_type="application/json")
+    except Exception as e:
+        return {"error": f"Water points query failed: {e}"}
+
+@app.get("/api/accessibility")
+async def get_accessibility(region: Optional[str] = REGION_QUERY):
+    """Recompute SCM-G2SFCA accessibility per sublocation with the in-process engine"""
+    region_id = resolve_region(region)
+    if not hydrogpt_service.db_pool:
+        return {"error": "Database not connected"}
+    
+    try:
+        analysis = await hydrogpt_service.get_analysis(region_id)
+        engine = analysis.engine
+        result = await asyncio.to_thread(engine.compute)
         return {
-            "type": "FeatureCollection", 
-            "features": [
-                {
-                    "type": "Feature",
-                    "properties": {
-                        "name": row['name'] or 'Unknown',
-                        "water_source": row['water_source'] or 'Unknown',
-                        "capacity_score": int(row['capacity_score']) if row['capacity_score'] else 1,
-                        "status": row['status'] or 'Unknown'
-                    },
-                    "geometry": json.loads(row['geometry'])
-                }
-                for row in water_points
-            ]
+            "region": region_id,
+            "data_version": analysis.version,
+            "compute_ms": round(result.compute_ms, 2),
+            "demand_points": len(engine.demand),
+            "water_points": len(engine.supply),
+            "travel_times": "terrain" if engine.detour_factors else "straight_line",
+            "reference_score": result.reference,
+            "sublocations": result.sublocations
         }
     except Exception as e:
-        return {"error": f"Water points query failed: {e}"}
+        return {"error": f"Accessibility computation failed: {e}"}
+
+@app.get("/api/accessibility/grid")
+async def get_accessibility_grid(
+    metric: str = Query("score", description="score, combined or a transport mode"),
+    by: str = Query("sublocation", pattern="^(sublocation|category)$"),
+    region: Optional[str] = REGION_QUERY
+):
+    """Population-weighted aggregates over per-demand-point accessibility, served from the grid store"""
+    region_id = resolve_region(region)
+    if not hydrogpt_service.db_pool:
+        raise HTTPException(status_code=503, detail="Database not connected")
+    
+    store = await hydrogpt_service.get_grid_store(region_id)
+    if metric not in store.metrics:
+        raise HTTPException(status_code=400, detail=f"metric must be one of {', '.join(store.metrics)}")
+    return {
+        "data_version": store.version,
+        "demand_points": len(store),
+        "metric": metric,
+        "groups": store.aggregate(metric, by)
+    }
+
+@app.get("/api/accessibility/grid/histogram")
+async def get_accessibility_histogram(
+    metric: str = Query("score", description="score, combined or a transport mode"),
+    bins: int = Query(20, ge=1, le=200),
+    region: Optional[str] = REGION_QUERY
+):
+    """Population-weighted distribution of accessibility across demand points"""
+    region_id = resolve_region(region)
+    if not hydrogpt_service.db_pool:
+        raise HTTPException(status_code=503, detail="Database not connected")
+    
+    store = await hydrogpt_service.get_grid_store(region_id)
+    if metric not in store.metrics:
+        raise HTTPException(status_code=400, detail=f"metric must be one of {', '.join(store.metrics)}")
+    return {"data_version": store.version, **store.histogram(metric, bins)}
+
+@app.post("/api/scenarios")
+async def evaluate_scenario(request: ScenarioRequest, region: Optional[str] = REGION_QUERY):
+    """What-if accessibility for added, decommissioned or re-rated water points"""
+    region_id = resolve_region(region)
+    if not hydrogpt_service.db_pool:
+        raise HTTPException(status_code=503, detail="Database not connected")
+    
+    analysis = await hydrogpt_service.get_analysis(region_id)
+    evaluator = analysis.evaluator
+    delta = ScenarioDelta(
+        add=[(point.lat, point.lon, point.capacity) for point in request.add],
+        remove=request.remove,
+        set_capacity=[(change.id, change.capacity) for change in request.set_capacity]
+    )
+    try:
+        result = await asyncio.to_thread(evaluator.evaluate, delta)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return {"region": region_id, "data_version": analysis.version, **result}
+
+@app.post("/api/scenarios/optimize")
+async def optimize_sites(request: SitingRequest, region: Optional[str] = REGION_QUERY):
+    """Suggest sites for new water points that lift the most people out of Very Weak/Weak access"""
+    region_id = resolve_region(region)
+    if not hydrogpt_service.db_pool:
+        raise HTTPException(status_code=503, detail="Database not connected")
+    
+    analysis = await hydrogpt_service.get_analysis(region_id)
+    engine = analysis.engine
+    if request.candidates:
+        lon = np.array([site.lon for site in request.candidates], dtype=np.float64)
+        lat = np.array([site.lat for site in request.candidates], dtype=np.float64)
+        candidates = await asyncio.to_thread(CandidateSites.build, engine, lon, lat)
+    else:
+        candidates = await hydrogpt_service.candidate_sites(request.grid_spacing_km, region_id)
+    if not len(candidates):
+        raise HTTPException(status_code=400, detail="No candidate sites inside the study area")
+    
+    optimizer = SitingOptimizer(analysis.evaluator, candidates, request.capacity)
+    try:
+        result = await asyncio.wait_for(asyncio.to_thread(optimizer.run, request.sites, request.time_budget_seconds),
+                                        request.time_budget_seconds + TIMEOUT_GRACE_SECONDS)
+    except asyncio.TimeoutError:
+        # The worker thread cannot be interrupted; stop it probing so it frees the CPU
+        optimizer.cancel()
+        raise HTTPException(status_code=504, detail="Site optimization did not finish within its time budget")
+    return {"region": region_id, "data_version": analysis.version, **result}
+
+@app.get("/tiles/{layer}/{z}/{x}/{y}.mvt")
+async def get_tile(request: Request, layer: str, z: int, x: int, y: int, region: Optional[str] = REGION_QUERY):
+    """Mapbox Vector Tile for the sublocations or waterpoints layer"""
+    region_id = resolve_region(region)
+    if layer not in LAYER_SQL:
+        raise HTTPException(status_code=404, detail=f"Unknown tile layer '{layer}'")
+    if not valid_tile(z, x, y):
+        raise HTTPException(status_code=404, detail="Tile coordinates out of range")
+    if not hydrogpt_service.db_pool:
+        raise HTTPException(status_code=503, detail="Database not connected")
+    
+    # The snapshot version is region-specific, so ETags never collide across regions
+    snapshot = await hydrogpt_service.snapshots.get(region_id)
+    headers = {"ETag": f'"{snapshot.version}-{layer}-{z}-{x}-{y}"', "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match", ""), [headers["ETag"]]):
+        return Response(status_code=304, headers=headers)
+    
+    key = (region_id, snapshot.version, layer, z, x, y)
+    tile = await hydrogpt_service.tile_cache.get(key)
+    if tile is None:
+        async def render() -> bytes:
+            async with queries.acquire(hydrogpt_service.db_pool) as conn:
+                rendered = await hydrogpt_service.render_tile(conn, layer, z, x, y, region_id)
+            await hydrogpt_service.tile_cache.put(key, rendered)
+            return rendered
+        
+        tile = await hydrogpt_service.tile_flights.run(key, render)
+    
+    return Response(content=tile, media_type=MVT_MEDIA_TYPE, headers=headers)
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,147 @@
+# metrics.py - In-process latency histograms, counters and gauges with Prometheus text exposition
+import bisect
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Any, List, Tuple
+
+# Seconds; roughly x2.5 steps from 1 ms to 30 s
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Prompt and completion sizes in tokens
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 3000, 4000, 6000, 8000, 12000, 16000)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """Fixed-bucket histogram; bucket i counts observations <= buckets[i] (last slot is +Inf)"""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Upper bucket bound containing the q-th observation (coarse, but allocation-free)"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.buckets[index] if index < len(self.buckets) else float("inf")
+        return float("inf")
+
+    def snapshot(self) -> Dict[str, Any]:
+        cumulative, running = {}, 0
+        for bound, count in zip(self.buckets, self.counts):
+            running += count
+            cumulative[str(bound)] = running
+        cumulative["+Inf"] = self.count
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "mean": round(self.sum / self.count, 6) if self.count else 0.0,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": cumulative,
+        }
+
+
+class MetricsRegistry:
+    """Named histograms and counters, each keyed by a set of labels"""
+
+    def __init__(self):
+        self.histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self.counters: Dict[str, Dict[Labels, float]] = {}
+        self.gauges: Dict[str, Dict[Labels, float]] = {}
+        self.buckets: Dict[str, Tuple[float, ...]] = {}
+        self.collectors: List[Callable[[], None]] = []
+
+    def define(self, name: str, buckets: Tuple[float, ...]):
+        """Use ``buckets`` instead of LATENCY_BUCKETS for every series of ``name``"""
+        self.buckets[name] = buckets
+
+    def histogram(self, name: str, **labels: str) -> Histogram:
+        series = self.histograms.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = series[key] = Histogram(self.buckets.get(name, LATENCY_BUCKETS))
+        return histogram
+
+    def observe(self, name: str, value: float, **labels: str):
+        self.histogram(name, **labels).observe(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels: str):
+        """Observe the duration of the ``with`` block in seconds (also when it raises)"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def increment(self, name: str, amount: float = 1.0, **labels: str):
+        series = self.counters.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        series[key] = series.get(key, 0.0) + amount
+
+    def set_gauge(self, name: str, value: float, **labels: str):
+        self.gauges.setdefault(name, {})[tuple(sorted(labels.items()))] = float(value)
+
+    def add_collector(self, collect: Callable[[], None]):
+        """Callback run before each exposition, typically setting gauges from live state"""
+        self.collectors.append(collect)
+
+    def snapshot(self, name: str) -> Dict[str, Any]:
+        """Histogram summaries for ``name``, keyed by the label values joined with ','"""
+        return {
+            ",".join(value for _, value in labels) or "all": histogram.snapshot()
+            for labels, histogram in sorted(self.histograms.get(name, {}).items())
+        }
+
+    def render_prometheus(self) -> str:
+        """All series in the Prometheus text exposition format (version 0.0.4)"""
+        for collect in self.collectors:
+            collect()
+
+        lines = []
+        for name, series in sorted(self.counters.items()):
+            lines.append(f"# TYPE {name} counter")
+            lines.extend(f"{name}{_labels(labels)} {_number(value)}" for labels, value in sorted(series.items()))
+        for name, series in sorted(self.gauges.items()):
+            lines.append(f"# TYPE {name} gauge")
+            lines.extend(f"{name}{_labels(labels)} {_number(value)}" for labels, value in sorted(series.items()))
+        for name, series in sorted(self.histograms.items()):
+            lines.append(f"# TYPE {name} histogram")
+            for labels, histogram in sorted(series.items()):
+                running = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    running += count
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', _number(bound)),))} {running}")
+                lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {histogram.count}")
+                lines.append(f"{name}_sum{_labels(labels)} {_number(histogram.sum)}")
+                lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+
+def _number(value: float) -> str:
+    return repr(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,193 @@
+# optimizer.py - Lazy-greedy siting of new water points over the SCM-G2SFCA objective
+import heapq
+import time
+from dataclasses import dataclass
+from typing import Dict, Any, List, Optional
+
+import asyncpg
+import numpy as np
+
+from accessibility import AccessibilityEngine, CatchmentPairs
+from queries import registry
+from regions import default_region
+from scenarios import ScenarioEvaluator, POOR_CATEGORIES, gather_ranges
+from snapshot import ACCESSIBILITY_CATEGORIES
+
+# Score at which a point leaves the poor-access bands (upper bound of "Weak")
+ADEQUATE_SCORE = max(upper for upper, category in ACCESSIBILITY_CATEGORIES if category in POOR_CATEGORIES)
+# Candidate catchments are precomputed (~9,000 driving pairs per site at 20,000 demand points over
+# Mbeere South), so memory rather than the first pass (<1 ms per candidate) bounds the candidate set
+MAX_CANDIDATES = 2000
+# Extra time the endpoint allows past the optimizer's own budget before answering 504
+TIMEOUT_GRACE_SECONDS = 10.0
+
+# Regular WGS84 grid over the study area, clipped to the sublocation boundaries, at most $2 points
+CANDIDATE_GRID_SQL = """
+    WITH area AS (
+        SELECT ST_Transform(ST_Union(geom), 4326) as geom
+        FROM sublocations
+        WHERE region_id = $3 AND geom IS NOT NULL
+    ),
+    grid AS (
+        SELECT ST_SetSRID(ST_MakePoint(x, y), 4326) as geom
+        FROM area,
+            generate_series(ST_XMin(area.geom)::numeric, ST_XMax(area.geom)::numeric, $1::numeric) x,
+            generate_series(ST_YMin(area.geom)::numeric, ST_YMax(area.geom)::numeric, $1::numeric) y
+    )
+    SELECT lon, lat
+    FROM (
+        SELECT
+            ST_X(grid.geom) as lon,
+            ST_Y(grid.geom) as lat,
+            ROW_NUMBER() OVER (ORDER BY ST_Y(grid.geom), ST_X(grid.geom)) - 1 as n,
+            COUNT(*) OVER () as total
+        FROM grid, area
+        WHERE ST_Contains(area.geom, grid.geom)
+    ) inside
+    -- Grids finer than the cap keep every k-th point, thinning the whole area rather than cutting it off
+    WHERE n % CEIL(total::numeric / $2::bigint)::bigint = 0
+    ORDER BY lat, lon
+    LIMIT $2
+"""
+registry.register("candidate_grid", CANDIDATE_GRID_SQL)
+
+
+async def grid_candidates(conn: asyncpg.Connection, spacing_km: float, region_id: Optional[str] = None) -> np.ndarray:
+    """Candidate sites as (lon, lat) rows on a grid inside one region's sublocations.geom"""
+    region_id = region_id or default_region()
+    rows = await registry.fetch(conn, "candidate_grid", spacing_km / 111.32, MAX_CANDIDATES, region_id)
+    return np.array([(row['lon'], row['lat']) for row in rows], dtype=np.float64).reshape(-1, 2)
+
+
+@dataclass
+class CandidateSites:
+    """Candidate locations with catchment pairs computed once and grouped by site"""
+    lon: np.ndarray
+    lat: np.ndarray
+    pairs: Dict[str, CatchmentPairs]
+    indptr: Dict[str, np.ndarray]
+
+    @classmethod
+    def build(cls, engine: AccessibilityEngine, lon: np.ndarray, lat: np.ndarray) -> "CandidateSites":
+        pairs, indptr = {}, {}
+        for mode, mode_pairs in engine.pairs_for_new_supply(lon, lat).items():
+            order = np.argsort(mode_pairs.supply, kind="stable")
+            pairs[mode] = CatchmentPairs(mode_pairs.demand[order], mode_pairs.supply[order],
+                                         mode_pairs.minutes[order], mode_pairs.decay[order])
+            counts = np.bincount(pairs[mode].supply - len(engine.supply), minlength=len(lon))
+            indptr[mode] = np.concatenate([[0], np.cumsum(counts)])
+        return cls(lon=lon, lat=lat, pairs=pairs, indptr=indptr)
+
+    def __len__(self) -> int:
+        return len(self.lon)
+
+    def select(self, sites: List[int]) -> Dict[str, CatchmentPairs]:
+        """Catchment pairs of the given candidate sites"""
+        selected = {}
+        for mode, pairs in self.pairs.items():
+            index = gather_ranges(self.indptr[mode], np.array(sites, dtype=np.int64))
+            selected[mode] = CatchmentPairs(pairs.demand[index], pairs.supply[index],
+                                            pairs.minutes[index], pairs.decay[index])
+        return selected
+
+
+class SitingOptimizer:
+    """Picks new water point sites that most reduce population-weighted poor access.
+
+    The objective is sum_i D_i min(score_i, ADEQUATE_SCORE): it rewards moving
+    people towards the "Good" band and stops rewarding them once they are
+    there. Each probe is an incremental scenario (current picks plus one
+    candidate) over precomputed candidate catchments. The first pass only
+    recomputes each candidate's own catchment in wide modes (driving), which
+    slightly underestimates its gain; a candidate reaching the top of the
+    heap is then probed exactly. Supply competition makes the objective only
+    approximately submodular, so lazy greedy (CELF) is a heuristic here: a
+    stale bound is re-evaluated before its site is accepted, unless the time
+    budget has run out.
+    """
+
+    def __init__(self, evaluator: ScenarioEvaluator, candidates: CandidateSites, capacity: int = 3):
+        self.evaluator = evaluator
+        self.candidates = candidates
+        self.capacity = capacity
+        self.population = evaluator.engine.demand.population
+        self.evaluations = 0
+        self.deadline = float("inf")
+
+    def objective(self, score: np.ndarray) -> float:
+        return float((self.population * np.minimum(score, ADEQUATE_SCORE)).sum())
+
+    def adequate_population(self, score: np.ndarray) -> float:
+        return float(self.population[score >= ADEQUATE_SCORE].sum())
+
+    def score_with(self, sites: List[int], catchment_only: bool = False) -> np.ndarray:
+        """Scores with the given candidate sites built (see ModeState.evaluate for ``catchment_only``)"""
+        engine = self.evaluator.engine
+        capacity = np.concatenate([engine.supply.capacity, np.zeros(len(self.candidates))])
+        changed = len(engine.supply) + np.array(sites, dtype=np.int64)
+        capacity[changed] = float(self.capacity)
+        self.evaluations += 1
+        score, _ = self.evaluator.scores(capacity, changed, self.candidates.select(sites),
+                                         catchment_only=catchment_only)
+        return score
+
+    def cancel(self):
+        """Make a running ``run`` stop probing and return with what it has"""
+        self.deadline = 0.0
+
+    def run(self, sites: int, time_budget: float) -> Dict[str, Any]:
+        started = time.perf_counter()
+        self.deadline = started + time_budget
+        baseline = self.evaluator.baseline.score
+        current = self.objective(baseline)
+        chosen: List[int] = []
+        steps: List[Dict[str, Any]] = []
+        complete = True
+
+        # Max-heap of (-gain bound, candidate, number of picks when the bound was computed); first-pass
+        # estimates carry -1, so each is probed exactly before its site can be accepted
+        heap = []
+        # Candidates come in grid order; a shuffled first pass that the budget cuts short still
+        # samples the whole area instead of only its southern rows
+        for candidate in np.random.default_rng(0).permutation(len(self.candidates)).tolist():
+            if time.perf_counter() > self.deadline:
+                complete = False
+                break
+            estimate = self.objective(self.score_with([candidate], catchment_only=True))
+            heap.append((current - estimate, candidate, -1))
+        probed = len(heap)
+        heapq.heapify(heap)
+
+        while heap and len(chosen) < sites:
+            negative_gain, candidate, evaluated_at = heapq.heappop(heap)
+            if evaluated_at != len(chosen):
+                if time.perf_counter() <= self.deadline:
+                    gain = self.objective(self.score_with(chosen + [candidate])) - current
+                    heapq.heappush(heap, (-gain, candidate, len(chosen)))
+                    continue
+                # Out of time: accept the best remaining bound without re-evaluating it
+                complete = False
+            if negative_gain >= 0:
+                break
+            chosen.append(candidate)
+            current -= negative_gain
+            steps.append({
+                "lat": round(float(self.candidates.lat[candidate]), 6),
+                "lon": round(float(self.candidates.lon[candidate]), 6),
+                "capacity": self.capacity,
+                "marginal_gain": round(-negative_gain, 2),
+            })
+
+        final = self.score_with(chosen)
+        result = self.evaluator.compare(self.evaluator.engine.aggregate(final), 0, 0.0)
+        return {
+            "sites": steps,
+            "candidates": len(self.candidates),
+            "candidates_evaluated": probed,
+            "evaluations": self.evaluations,
+            "complete": complete,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+            "people_lifted_to_adequate": round(self.adequate_population(final) - self.adequate_population(baseline)),
+            "population_lifted_out_of_poor_access": result["population_lifted_out_of_poor_access"],
+            "sublocations": result["sublocations"],
+        }
@@ -0,0 +1,156 @@
+# queries.py - Named SQL registry, pool configuration and per-query latency metrics
+#
+# Statements are always sent with the same text for a given name, so asyncpg's per-connection
+# statement cache parses and plans each one once per connection and reuses the prepared
+# statement afterwards. Every execution is timed into the db_query_seconds histogram.
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Any, List, Optional
+
+import asyncpg
+
+import tracing
+from metrics import MetricsRegistry, metrics
+
+QUERIES: Dict[str, str] = {
+    "rollup_exists": "SELECT to_regclass('sublocation_rollup') IS NOT NULL",
+    "default_map_rollup": """
+        SELECT
+            sublocation_name,
+            accessibility_score,
+            total_population,
+            accessibility_category,
+            water_points,
+            geojson as geometry
+        FROM sublocation_rollup
+        WHERE region_id = $1
+        ORDER BY sublocation_name
+    """,
+    # Databases initialized before the rollup existed aggregate on the fly
+    "default_map_legacy": """
+        SELECT
+            s.slname as sublocation_name,
+            COALESCE(AVG(ss.avg_combined_accessibility), 0) as accessibility_score,
+            COALESCE(AVG(ss.total_population), 0) as total_population,
+            CASE
+                WHEN AVG(ss.avg_combined_accessibility) IS NULL THEN 'Unknown'
+                WHEN AVG(ss.avg_combined_accessibility) < 1.0 THEN 'Very Weak'
+                WHEN AVG(ss.avg_combined_accessibility) < 1.2 THEN 'Weak'
+                WHEN AVG(ss.avg_combined_accessibility) < 1.5 THEN 'Good'
+                ELSE 'Very Good'
+            END as accessibility_category,
+            NULL::integer as water_points,
+            ST_AsGeoJSON(ST_Transform(ST_Union(s.geom), 4326)) as geometry
+        FROM sublocations s
+        LEFT JOIN sublocation_statistics ss ON ss.region_id = s.region_id AND s.slname = ss.sublocation_name
+        WHERE s.region_id = $1 AND s.geom IS NOT NULL AND s.slname IS NOT NULL
+        GROUP BY s.slname
+        ORDER BY s.slname
+    """,
+    "waterpoints_srid": "SELECT ST_SRID(geom) FROM waterpoints WHERE geom IS NOT NULL LIMIT 1",
+    "sublocations_srid": "SELECT ST_SRID(geom) FROM sublocations WHERE geom IS NOT NULL LIMIT 1",
+    "debug_sublocation_count": "SELECT COUNT(*) FROM sublocations WHERE region_id = $1 AND geom IS NOT NULL",
+    "debug_sublocation_names": """
+        SELECT locname FROM sublocations WHERE region_id = $1 AND geom IS NOT NULL ORDER BY locname
+    """,
+    "debug_statistics_count": "SELECT COUNT(*) FROM sublocation_statistics WHERE region_id = $1",
+    "debug_statistics_names": """
+        SELECT sublocation_name FROM sublocation_statistics WHERE region_id = $1 ORDER BY sublocation_name
+    """,
+    "debug_waterpoint_count": "SELECT COUNT(*) FROM waterpoints WHERE region_id = $1 AND geom IS NOT NULL",
+}
+
+
+def pool_options() -> Dict[str, Any]:
+    """asyncpg.create_pool keyword arguments from the environment.
+
+    Keep DB_POOL_MAX_SIZE x worker count below the database's connection
+    limit. Set DB_STATEMENT_CACHE_SIZE=0 behind a transaction-mode pooler
+    such as PgBouncer, which cannot keep prepared statements.
+    """
+    return {
+        "min_size": int(os.getenv("DB_POOL_MIN_SIZE", "2")),
+        "max_size": int(os.getenv("DB_POOL_MAX_SIZE", "10")),
+        "max_inactive_connection_lifetime": float(os.getenv("DB_POOL_MAX_INACTIVE_SECONDS", "300")),
+        "command_timeout": float(os.getenv("DB_COMMAND_TIMEOUT_SECONDS", "30")),
+        "statement_cache_size": int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100")),
+    }
+
+
+def pool_stats(pool: Optional[asyncpg.Pool]) -> Dict[str, Any]:
+    if pool is None:
+        return {"connected": False}
+    size, idle = pool.get_size(), pool.get_idle_size()
+    return {
+        "connected": True,
+        "min_size": pool.get_min_size(),
+        "max_size": pool.get_max_size(),
+        "size": size,
+        "in_use": size - idle,
+        "idle": idle,
+        "utilisation": round((size - idle) / pool.get_max_size(), 3),
+    }
+
+
+class QueryRegistry:
+    """Executes statements by name and records their latency"""
+
+    def __init__(self, registry: MetricsRegistry = metrics):
+        self.metrics = registry
+        self.statements: Dict[str, str] = dict(QUERIES)
+
+    def register(self, name: str, sql: str) -> str:
+        """Add a statement owned by another module (tiles, snapshot, engine loaders)"""
+        self.statements[name] = sql
+        return name
+
+    def sql(self, name: str) -> str:
+        return self.statements[name]
+
+    @asynccontextmanager
+    async def acquire(self, pool: asyncpg.Pool):
+        """pool.acquire() that records how long callers wait for a connection"""
+        started = time.perf_counter()
+        async with pool.acquire() as conn:
+            self.metrics.observe("db_pool_acquire_seconds", time.perf_counter() - started)
+            yield conn
+
+    async def fetch(self, conn: asyncpg.Connection, name: str, *args, sql: Optional[str] = None) -> List[asyncpg.Record]:
+        return await self._run(conn.fetch, name, sql, args)
+
+    async def fetchrow(self, conn: asyncpg.Connection, name: str, *args, sql: Optional[str] = None) -> Optional[asyncpg.Record]:
+        return await self._run(conn.fetchrow, name, sql, args)
+
+    async def fetchval(self, conn: asyncpg.Connection, name: str, *args, sql: Optional[str] = None) -> Any:
+        return await self._run(conn.fetchval, name, sql, args)
+
+    async def execute(self, conn: asyncpg.Connection, name: str, *args, sql: Optional[str] = None) -> str:
+        return await self._run(conn.execute, name, sql, args)
+
+    async def _run(self, method, name: str, sql: Optional[str], args: tuple):
+        # ``sql`` overrides the registered text for statements assembled per request (water points);
+        # they are still timed under their registered name
+        started = time.perf_counter()
+        text = sql or self.statements[name]
+        try:
+            with tracing.span(f"db {name}", **{"db.system": "postgresql", "db.operation.name": name, "db.query.text": text}):
+                return await method(text, *args)
+        except Exception:
+            self.metrics.increment("db_query_errors_total", query=name)
+            raise
+        finally:
+            self.metrics.observe("db_query_seconds", time.perf_counter() - started, query=name)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queries": self.metrics.snapshot("db_query_seconds"),
+            "pool_acquire": self.metrics.snapshot("db_pool_acquire_seconds"),
+            "errors": {
+                ",".join(value for _, value in labels): count
+                for labels, count in self.metrics.counters.get("db_query_errors_total", {}).items()
+            },
+        }
+
+
+registry = QueryRegistry()
@@ -0,0 +1,65 @@
+# regions.py - Study areas served by one backend process
+#
+# Every data row carries a region_id (database/init.sql). Requests name a region with the
+# ``region`` parameter; omitting it selects DEFAULT_REGION, so single-area clients are unchanged.
+import os
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+import asyncpg
+
+from queries import registry
+
+# region_id column default in database/init.sql, carried by rows loaded before regions existed.
+# Fixed in the schema: DEFAULT_REGION only chooses the region served when a request names none.
+SCHEMA_DEFAULT_REGION = "mbeere_south"
+DEFAULT_REGION_NAME = "Mbeere South Subcounty"
+
+registry.register("regions_exists", "SELECT to_regclass('regions') IS NOT NULL")
+registry.register("regions", "SELECT region_id, name FROM regions ORDER BY region_id")
+
+
+def default_region() -> str:
+    """DEFAULT_REGION, read at call time so a value from .env (loaded after import) is honoured"""
+    return os.getenv("DEFAULT_REGION", SCHEMA_DEFAULT_REGION)
+
+
+class UnknownRegionError(KeyError):
+    """A request named a region that is not in the regions table"""
+
+
+@dataclass(frozen=True)
+class Region:
+    region_id: str
+    name: str
+
+
+def default_regions() -> Dict[str, Region]:
+    """Just the default region, as known before the regions table is read"""
+    region_id = default_region()
+    return {region_id: Region(region_id, DEFAULT_REGION_NAME if region_id == SCHEMA_DEFAULT_REGION else region_id)}
+
+
+async def load_regions(conn: asyncpg.Connection) -> Dict[str, Region]:
+    """Regions from the regions table; the default region is always present"""
+    regions = default_regions()
+    if await registry.fetchval(conn, "regions_exists"):
+        for row in await registry.fetch(conn, "regions"):
+            regions[row['region_id']] = Region(row['region_id'], row['name'] or row['region_id'])
+    return regions
+
+
+def region_directory(base: Optional[str], region_id: str) -> Optional[str]:
+    """<base>/<region_id> for per-region files (travel times, grid stores).
+
+    The default region falls back to ``base`` itself when it has no
+    subdirectory, so files written before regions existed are still found.
+    """
+    if not base:
+        return None
+    directory = os.path.join(base, region_id)
+    if region_id == default_region() and not os.path.isdir(directory) and os.path.isdir(base):
+        # Pre-region layout: manifests and CURRENT pointers directly under base
+        if any(entry.is_file() for entry in os.scandir(base)):
+            return base
+    return directory
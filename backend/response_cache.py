@@ -0,0 +1,127 @@
+# response_cache.py - LRU/TTL cache for /api/query responses with an optional SQLite tier
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Tuple
+
+
+class ResponseCache:
+    """In-memory LRU cache of query responses bounded by entry count, bytes and TTL.
+
+    Keys combine the canonical query with the data snapshot version, so a data
+    reload never serves stale answers. When ``sqlite_path`` is set, entries are
+    written through to SQLite and memory misses are looked up there, so warm
+    entries survive restarts.
+    """
+
+    def __init__(self, max_entries: int = 1000, max_bytes: int = 32 * 1024 * 1024,
+                 ttl_seconds: float = 86400, sqlite_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.sqlite_path = sqlite_path
+        # key -> (expires_at, encoded response)
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._db: Optional[sqlite3.Connection] = None
+        if sqlite_path:
+            self._db = sqlite3.connect(sqlite_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.execute("DELETE FROM response_cache WHERE expires_at < ?", (time.time(),))
+            self._db.commit()
+            self._db_lock = asyncio.Lock()
+
+    @classmethod
+    def from_env(cls) -> Optional["ResponseCache"]:
+        if os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() not in ("1", "true", "yes"):
+            return None
+        return cls(
+            max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000")),
+            max_bytes=int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+            ttl_seconds=float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "86400")),
+            sqlite_path=os.getenv("RESPONSE_CACHE_SQLITE_PATH") or None,
+        )
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Cached response for ``key``, or None"""
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return json.loads(entry[1])
+            self._remove(key)
+
+        if self._db is not None:
+            async with self._db_lock:
+                row = await asyncio.to_thread(self._disk_get, key, now)
+            if row is not None:
+                self.disk_hits += 1
+                self._store(key, row[1], row[0])
+                return json.loads(row[1])
+
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, response: Dict[str, Any]):
+        """Cache a response under ``key``"""
+        value = json.dumps(response).encode()
+        if len(value) > self.max_bytes:
+            return
+        expires_at = time.time() + self.ttl_seconds
+        self._store(key, value, expires_at)
+
+        if self._db is not None:
+            async with self._db_lock:
+                await asyncio.to_thread(self._disk_put, key, value, expires_at)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round((self.hits + self.disk_hits) / lookups, 3) if lookups else 0.0,
+            "sqlite": self.sqlite_path,
+        }
+
+    def _store(self, key: str, value: bytes, expires_at: float):
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (expires_at, value)
+        self._bytes += len(value)
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: str):
+        _, value = self._entries.pop(key)
+        self._bytes -= len(value)
+
+    def _disk_get(self, key: str, now: float) -> Optional[Tuple[float, bytes]]:
+        return self._db.execute(
+            "SELECT expires_at, value FROM response_cache WHERE key = ? AND expires_at > ?", (key, now)
+        ).fetchone()
+
+    def _disk_put(self, key: str, value: bytes, expires_at: float):
+        self._db.execute(
+            "INSERT OR REPLACE INTO response_cache (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, value, expires_at),
+        )
+        self._db.commit()
@@ -0,0 +1,328 @@
+# scenarios.py - Incremental what-if evaluation on top of the SCM-G2SFCA engine
+import time
+from dataclasses import dataclass
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+from accessibility import AccessibilityEngine, AccessibilityResult, CatchmentPairs, mode_accessibility
+
+POOR_CATEGORIES = ("Very Weak", "Weak")
+# Above this share of a mode's pairs, recomputing the whole mode is cheaper than the incremental path.
+# Only the modes that cross it are recomputed densely: with straight-line travel times over Mbeere
+# South (20k demand points, 800 water points) a driving catchment (~24 km) covers about 44% of the
+# subcounty, so driving always crosses it while walking and animals stay incremental (<1 ms each).
+# The dense driving pass over its ~7M pairs takes ~125 ms, against ~330 ms for a from-scratch recompute.
+INCREMENTAL_MAX_PAIR_SHARE = 0.25
+# Siting probes (one new supply each) whose first ring holds more than this share of a mode's pairs
+# are estimated over the new catchment alone: their second ring, reached through every supply the
+# catchment shares, spans most of the area. Walking and animal catchments stay well below it.
+CATCHMENT_ONLY_PAIR_SHARE = 0.02
+
+
+def gather_ranges(indptr: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    """Concatenate arange(indptr[r], indptr[r + 1]) for every r in ``rows``"""
+    starts = indptr[rows]
+    lengths = indptr[rows + 1] - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.int64)
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return offsets + np.arange(total)
+
+
+def segment_sum(values: np.ndarray, indptr: np.ndarray) -> np.ndarray:
+    """Sum of values[indptr[r]:indptr[r + 1]] for every row r (CSR row sums, empty rows give 0)"""
+    sums = np.zeros(len(indptr) - 1)
+    nonempty = np.flatnonzero(indptr[1:] > indptr[:-1])
+    if len(nonempty):
+        sums[nonempty] = np.add.reduceat(values, indptr[nonempty])
+    return sums
+
+
+def index_mask(size: int, *indices: np.ndarray) -> np.ndarray:
+    """Boolean membership mask over ``range(size)``; linear-time alternative to np.unique"""
+    mask = np.zeros(size, dtype=bool)
+    for values in indices:
+        mask[values] = True
+    return mask
+
+
+@dataclass
+class ModeState:
+    """Baseline SCM-G2SFCA intermediates for one mode, indexed by demand (CSR) and by supply"""
+    demand: np.ndarray
+    supply: np.ndarray
+    decay: np.ndarray
+    weight: np.ndarray
+    demand_indptr: np.ndarray
+    by_supply: np.ndarray
+    supply_indptr: np.ndarray
+    attraction: np.ndarray
+    totals: np.ndarray
+    probability: np.ndarray
+    load: np.ndarray
+    ratio: np.ndarray
+    access: np.ndarray
+
+    @classmethod
+    def build(cls, pairs: CatchmentPairs, capacity: np.ndarray, population: np.ndarray) -> "ModeState":
+        n_demand, n_supply = len(population), len(capacity)
+        order = np.argsort(pairs.demand, kind="stable")
+        demand, supply, decay = pairs.demand[order], pairs.supply[order], pairs.decay[order]
+        demand_indptr = np.concatenate([[0], np.cumsum(np.bincount(demand, minlength=n_demand))])
+        by_supply = np.argsort(supply, kind="stable")
+        supply_indptr = np.concatenate([[0], np.cumsum(np.bincount(supply, minlength=n_supply))])
+
+        weight = population[demand] * decay
+        attraction = capacity[supply] * decay
+        totals = np.bincount(demand, weights=attraction, minlength=n_demand)
+        probability = np.divide(attraction, totals[demand], out=np.zeros(len(attraction)), where=totals[demand] > 0)
+        load = np.bincount(supply, weights=probability * weight, minlength=n_supply)
+        ratio = np.divide(capacity, load, out=np.zeros(n_supply), where=load > 0)
+        access = np.bincount(demand, weights=probability * ratio[supply] * decay, minlength=n_demand)
+        return cls(demand, supply, decay, weight, demand_indptr, by_supply, supply_indptr,
+                   attraction, totals, probability, load, ratio, access)
+
+    def evaluate(self, capacity: np.ndarray, changed: np.ndarray, added: CatchmentPairs,
+                 population: np.ndarray, catchment_only: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+        """Scores after a capacity delta and/or added supplies, touching only affected catchments.
+
+        ``capacity`` covers existing plus added supplies; ``changed`` lists the
+        supply indices whose capacity differs from the baseline. Returns the new
+        per-demand scores and the indices of demand points that were recomputed.
+        With ``catchment_only`` (a single added supply, no other changes) a
+        delta whose first ring exceeds CATCHMENT_ONLY_PAIR_SHARE is estimated
+        over the new supply's catchment instead (see evaluate_catchment).
+        """
+        n_existing, n_demand = len(self.load), len(self.access)
+        n_supply = len(capacity)
+        changed_existing = changed[changed < n_existing]
+
+        # Demand points whose supply choice probabilities change
+        touched = self.by_supply[gather_ranges(self.supply_indptr, changed_existing)]
+        in_first = index_mask(n_demand, self.demand[touched], added.demand)
+        first_ring = np.flatnonzero(in_first)
+        first_pairs = self.demand_indptr[first_ring + 1].sum() - self.demand_indptr[first_ring].sum()
+        if catchment_only and first_pairs > CATCHMENT_ONLY_PAIR_SHARE * len(self.demand):
+            access = self.access.copy()
+            scores, demand = self.evaluate_catchment(float(capacity[added.supply[0]]), added, population)
+            access[demand] = scores
+            return access, demand
+        if first_pairs > INCREMENTAL_MAX_PAIR_SHARE * len(self.demand):
+            return self.evaluate_dense(capacity, changed_existing, added, population), np.arange(n_demand)
+        rows = gather_ranges(self.demand_indptr, first_ring)
+        position = np.empty(n_demand, dtype=np.int64)
+        position[first_ring] = np.arange(len(first_ring))
+        local, local_added = position[self.demand[rows]], position[added.demand]
+
+        attraction = capacity[self.supply[rows]] * self.decay[rows]
+        attraction_added = capacity[added.supply] * added.decay
+        totals = (np.bincount(local, weights=attraction, minlength=len(first_ring))
+                  + np.bincount(local_added, weights=attraction_added, minlength=len(first_ring)))
+        probability = np.divide(attraction, totals[local], out=np.zeros(len(rows)), where=totals[local] > 0)
+        probability_added = np.divide(attraction_added, totals[local_added],
+                                      out=np.zeros(len(attraction_added)), where=totals[local_added] > 0)
+
+        # Supplies whose demand load changes, and their new supply-to-demand ratios
+        weight = population[self.demand[rows]] * self.decay[rows]
+        load = np.concatenate([self.load, np.zeros(n_supply - n_existing)])
+        load += np.bincount(self.supply[rows], weights=(probability - self.probability[rows]) * weight,
+                            minlength=n_supply)
+        load += np.bincount(added.supply, weights=probability_added * population[added.demand] * added.decay,
+                            minlength=n_supply)
+        affected_supply = np.flatnonzero(index_mask(n_supply, self.supply[rows], added.supply, changed))
+        ratio = np.concatenate([self.ratio, np.zeros(n_supply - n_existing)])
+        ratio[affected_supply] = np.divide(capacity[affected_supply], load[affected_supply],
+                                           out=np.zeros(len(affected_supply)),
+                                           where=load[affected_supply] > 1e-12)
+
+        # Demand points reached by any affected supply get their scores recomputed
+        affected_existing = affected_supply[affected_supply < n_existing]
+        reached = self.by_supply[gather_ranges(self.supply_indptr, affected_existing)]
+        second_ring = np.flatnonzero(index_mask(n_demand, self.demand[reached], added.demand))
+        rows2 = gather_ranges(self.demand_indptr, second_ring)
+        demand2 = self.demand[rows2]
+        probability2 = self.probability[rows2]
+        # Rows of first-ring demand points appear in rows2 in the same order as in rows
+        probability2[in_first[demand2]] = probability
+        position[second_ring] = np.arange(len(second_ring))
+        local2, local2_added = position[demand2], position[added.demand]
+        scores = (np.bincount(local2, weights=probability2 * ratio[self.supply[rows2]] * self.decay[rows2],
+                              minlength=len(second_ring))
+                  + np.bincount(local2_added, weights=probability_added * ratio[added.supply] * added.decay,
+                                minlength=len(second_ring)))
+
+        access = self.access.copy()
+        access[second_ring] = scores
+        return access, second_ring
+
+    def evaluate_catchment(self, capacity: float, added: CatchmentPairs,
+                           population: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Scores of the demand points in one new supply's catchment, holding other supplies' ratios.
+
+        ``added`` holds the pairs of a single new supply, so each demand point
+        appears once. Its demand totals grow by the new attraction, which scales
+        the existing choice probabilities by T / T'; the loads this diverts from
+        existing supplies would raise their ratios, which is ignored here, so
+        no score is overestimated. Costs O(catchment) rather than O(pairs).
+        Returns the scores and the indices of the demand points they belong to.
+        """
+        attraction = capacity * added.decay
+        before = self.totals[added.demand]
+        totals = before + attraction
+        scale = np.divide(before, totals, out=np.zeros(len(totals)), where=totals > 0)
+        probability = np.divide(attraction, totals, out=np.zeros(len(totals)), where=totals > 0)
+        load = float((probability * population[added.demand] * added.decay).sum())
+        ratio = capacity / load if load > 0 else 0.0
+        return self.access[added.demand] * scale + probability * ratio * added.decay, added.demand
+
+    def evaluate_dense(self, capacity: np.ndarray, changed_existing: np.ndarray, added: CatchmentPairs,
+                       population: np.ndarray) -> np.ndarray:
+        """Recompute every score of the mode, for deltas whose catchments cover most pairs.
+
+        Reuses the baseline attraction and demand totals (only the changed
+        supplies' rows are updated) and sums over the demand-sorted pairs
+        with reduceat, which is several times cheaper than evaluate_full.
+        """
+        n_demand = len(self.access)
+        counts = np.diff(self.demand_indptr)
+        rows = self.by_supply[gather_ranges(self.supply_indptr, changed_existing)]
+        attraction = self.attraction.copy()
+        attraction[rows] = capacity[self.supply[rows]] * self.decay[rows]
+        attraction_added = capacity[added.supply] * added.decay
+        totals = (self.totals
+                  + np.bincount(self.demand[rows], weights=attraction[rows] - self.attraction[rows], minlength=n_demand)
+                  + np.bincount(added.demand, weights=attraction_added, minlength=n_demand))
+        pair_totals = np.repeat(totals, counts)
+        probability = np.divide(attraction, pair_totals, out=np.zeros(len(attraction)), where=pair_totals > 0)
+        probability_added = np.divide(attraction_added, totals[added.demand],
+                                      out=np.zeros(len(attraction_added)), where=totals[added.demand] > 0)
+
+        load = (np.bincount(self.supply, weights=probability * self.weight, minlength=len(capacity))
+                + np.bincount(added.supply, weights=probability_added * population[added.demand] * added.decay,
+                              minlength=len(capacity)))
+        ratio = np.divide(capacity, load, out=np.zeros(len(capacity)), where=load > 0)
+        return (segment_sum(probability * ratio[self.supply] * self.decay, self.demand_indptr)
+                + np.bincount(added.demand, weights=probability_added * ratio[added.supply] * added.decay,
+                              minlength=n_demand))
+
+    def evaluate_full(self, capacity: np.ndarray, added: CatchmentPairs, population: np.ndarray) -> np.ndarray:
+        """From-scratch recomputation of the mode; the reference the fast paths are checked against"""
+        # Zero-capacity supplies (decommissioned points, unpicked optimizer candidates) contribute nothing
+        keep = capacity[self.supply] > 0
+        merged = CatchmentPairs(
+            demand=np.concatenate([self.demand[keep], added.demand]),
+            supply=np.concatenate([self.supply[keep], added.supply]),
+            minutes=np.empty(0),
+            decay=np.concatenate([self.decay[keep], added.decay]),
+        )
+        return mode_accessibility(merged, capacity, population)
+
+
+@dataclass
+class ScenarioDelta:
+    """Changes to the water point network, expressed against the baseline engine"""
+    add: List[Tuple[float, float, int]]
+    remove: List[int]
+    set_capacity: List[Tuple[int, int]]
+
+
+class ScenarioEvaluator:
+    """Answers what-if questions against a baseline AccessibilityEngine.
+
+    Baseline intermediates are computed once; each scenario only recomputes
+    the demand points inside the catchments of changed or added water points.
+    """
+
+    def __init__(self, engine: AccessibilityEngine):
+        self.engine = engine
+        self.baseline: AccessibilityResult = engine.compute()
+        population = engine.demand.population
+        self.states = {
+            mode: ModeState.build(engine.pairs[mode], engine.supply.capacity, population)
+            for mode in engine.modes
+        }
+        self.supply_index = {int(waterpoint_id): index for index, waterpoint_id in enumerate(engine.supply.ids)}
+
+    def capacity_delta(self, delta: ScenarioDelta) -> Tuple[np.ndarray, np.ndarray]:
+        """New capacity vector (existing + added supplies) and the changed indices"""
+        capacity = np.concatenate([self.engine.supply.capacity, np.array([cap for _, _, cap in delta.add], dtype=np.float64)])
+        for waterpoint_id in delta.remove:
+            capacity[self._index(waterpoint_id)] = 0.0
+        for waterpoint_id, new_capacity in delta.set_capacity:
+            capacity[self._index(waterpoint_id)] = float(new_capacity)
+        n_existing = len(self.engine.supply)
+        changed = np.flatnonzero(capacity[:n_existing] != self.engine.supply.capacity)
+        changed = np.concatenate([changed, np.arange(n_existing, len(capacity))])
+        return capacity, changed
+
+    def added_pairs(self, delta: ScenarioDelta) -> Dict[str, CatchmentPairs]:
+        lon = np.array([lon for _, lon, _ in delta.add], dtype=np.float64)
+        lat = np.array([lat for lat, _, _ in delta.add], dtype=np.float64)
+        return self.engine.pairs_for_new_supply(lon, lat)
+
+    def scores(self, capacity: np.ndarray, changed: np.ndarray, added: Dict[str, CatchmentPairs],
+               states: Optional[Dict[str, ModeState]] = None,
+               catchment_only: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+        """Relative per-demand-point scores under a delta, and the mask of recomputed points.
+
+        ``states`` defaults to the baseline; callers exploring several deltas on
+        top of a common base (the siting optimizer) pass their own.
+        ``catchment_only`` is passed on to ModeState.evaluate.
+        """
+        engine = self.engine
+        population = engine.demand.population
+        combined = np.zeros(len(engine.demand))
+        affected = np.zeros(len(engine.demand), dtype=bool)
+        for mode, state in (states or self.states).items():
+            access, recomputed = state.evaluate(capacity, changed, added[mode], population, catchment_only)
+            combined += engine.modes[mode]["weight"] * access
+            affected[recomputed] = True
+        score = combined / self.baseline.reference if self.baseline.reference > 0 else combined
+        return score, affected
+
+    def evaluate(self, delta: ScenarioDelta) -> Dict[str, Any]:
+        started = time.perf_counter()
+        capacity, changed = self.capacity_delta(delta)
+        score, affected = self.scores(capacity, changed, self.added_pairs(delta))
+        scenario = self.engine.aggregate(score)
+        return self.compare(scenario, int(affected.sum()), (time.perf_counter() - started) * 1000)
+
+    def evaluate_full(self, delta: ScenarioDelta) -> List[Dict[str, Any]]:
+        """Non-incremental sublocation scores for ``delta``, used to validate the fast path"""
+        capacity, _ = self.capacity_delta(delta)
+        added = self.added_pairs(delta)
+        population = self.engine.demand.population
+        combined = sum(self.engine.modes[mode]["weight"] * state.evaluate_full(capacity, added[mode], population)
+                       for mode, state in self.states.items())
+        return self.engine.aggregate(combined / self.baseline.reference)
+
+    def compare(self, scenario: List[Dict[str, Any]], affected_points: int, compute_ms: float) -> Dict[str, Any]:
+        rows = []
+        lifted = 0
+        for before, after in zip(self.baseline.sublocations, scenario):
+            if before["category"] in POOR_CATEGORIES and after["category"] not in POOR_CATEGORIES:
+                lifted += before["population"]
+            rows.append({
+                "sublocation_name": before["sublocation_name"],
+                "population": before["population"],
+                "baseline_accessibility": before["accessibility"],
+                "scenario_accessibility": after["accessibility"],
+                "change": round(after["accessibility"] - before["accessibility"], 4),
+                "baseline_category": before["category"],
+                "scenario_category": after["category"],
+                "category_changed": before["category"] != after["category"],
+            })
+        return {
+            "compute_ms": round(compute_ms, 2),
+            "affected_demand_points": affected_points,
+            "population_lifted_out_of_poor_access": lifted,
+            "sublocations": rows,
+        }
+
+    def _index(self, waterpoint_id: int) -> int:
+        index = self.supply_index.get(int(waterpoint_id))
+        if index is None:
+            raise ValueError(f"Unknown water point id {waterpoint_id}")
+        return index
@@ -0,0 +1,54 @@
+# singleflight.py - Collapse concurrent identical requests onto one in-flight computation
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+from metrics import MetricsRegistry, metrics
+
+
+class SingleFlight:
+    """Runs at most one computation per key at a time; concurrent callers share its result.
+
+    The computation runs as its own task, so a caller that disconnects (and
+    is cancelled) does not cancel the work the others are waiting for.
+    Nothing is kept once the computation finishes: callers arriving later
+    start a new one, so results are never staler than the key they asked for.
+    Exceptions are shared the same way as results.
+    """
+
+    def __init__(self, name: str, registry: MetricsRegistry = metrics):
+        self.name = name
+        self.metrics = registry
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    async def run(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._calls.get(key)
+        if task is None:
+            self.metrics.increment("singleflight_calls_total", group=self.name, role="leader")
+            task = asyncio.ensure_future(compute())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+        else:
+            self.metrics.increment("singleflight_calls_total", group=self.name, role="collapsed")
+        return await asyncio.shield(task)
+
+    def _finished(self, key: Hashable, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Mark the exception as retrieved when every waiter has gone away
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        calls = self.metrics.counters.get("singleflight_calls_total", {})
+        leaders = calls.get((("group", self.name), ("role", "leader")), 0.0)
+        collapsed = calls.get((("group", self.name), ("role", "collapsed")), 0.0)
+        return {
+            "in_flight": self.in_flight,
+            "computations": int(leaders),
+            "collapsed": int(collapsed),
+            "collapse_ratio": round(collapsed / (leaders + collapsed), 3) if leaders + collapsed else 0.0,
+        }
@@ -0,0 +1,421 @@
+# snapshot.py - Versioned in-memory snapshot of HydroGPT statistics
+import asyncio
+import hashlib
+import os
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional, Dict, Any, List, Tuple
+
+import asyncpg
+
+from queries import registry
+from regions import DEFAULT_REGION_NAME, Region, UnknownRegionError, default_region, default_regions, load_regions
+
+# Accessibility classification bands (upper bound exclusive), matching the system prompt
+ACCESSIBILITY_CATEGORIES = [
+    (1.0, "Very Weak"),
+    (1.2, "Weak"),
+    (1.5, "Good"),
+    (float("inf"), "Very Good"),
+]
+
+
+def classify_accessibility(score: Optional[float]) -> str:
+    """Map an accessibility score to its category label"""
+    if score is None:
+        return "Unknown"
+    for upper, category in ACCESSIBILITY_CATEGORIES:
+        if score < upper:
+            return category
+    return "Very Good"
+
+
+# Channel raised by the triggers in database/init.sql whenever a data table changes
+NOTIFY_CHANNEL = "hydrogpt_data_changed"
+
+# Per-region change detector, also used when LISTEN/NOTIFY is unavailable (e.g. behind pgbouncer).
+# Every INSERT or UPDATE writes a row version with a new transaction id (xmin), so the newest xmin
+# moves on in-place corrections as well as imports; the counts catch deletes. Demand points feed
+# the accessibility engine, which is rebuilt per snapshot version, so they count as well. The map
+# rollup is refreshed separately from the imports it summarizes (REFRESH rewrites its rows), so its
+# xmin moves the version, and the cached map with it, only once the refresh has committed.
+FINGERPRINT_TABLES = [
+    ("stats", "sublocation_statistics"),
+    ("sublocations", "sublocations"),
+    ("waterpoints", "waterpoints"),
+    ("demand_points", "demand_points"),
+    ("rollup", "sublocation_rollup"),
+]
+# Databases initialized before these tables existed are fingerprinted without them
+OPTIONAL_TABLES = {"demand_points", "sublocation_rollup"}
+
+
+def fingerprint_sql(tables: List[str]) -> str:
+    """Row count and newest xmin of every table in ``tables`` for region $1"""
+    columns = []
+    for label, table in FINGERPRINT_TABLES:
+        if table in tables:
+            columns.append(f"(SELECT COUNT(*) FROM {table} WHERE region_id = $1) as {label}_count")
+            columns.append(f"(SELECT MAX(xmin::text::bigint) FROM {table} WHERE region_id = $1) as {label}_xmin")
+    return "SELECT\n        " + ",\n        ".join(columns)
+
+
+STATISTICS_COLUMNS = [
+    "sublocation_name",
+    "avg_combined_accessibility",
+    "total_population",
+    "water_points_count",
+    "high_capacity_water_points",
+    "medium_capacity_water_points",
+    "low_capacity_water_points",
+]
+
+
+def snapshot_sql(tables: List[str]) -> str:
+    """The fingerprint and every statistics row for region $1 in one statement.
+
+    The only statistics query: overall stats and the category distribution are
+    derived from these rows in Python (see summarize). Each row repeats the
+    fingerprint columns; a region without statistics still returns one row,
+    with NULL statistics, so a cold build is always a single round trip.
+    """
+    return f"""
+    WITH fingerprint AS ({fingerprint_sql(tables)})
+    SELECT fingerprint.*, s.*
+    FROM fingerprint
+    LEFT JOIN (
+        SELECT {", ".join(STATISTICS_COLUMNS)}
+        FROM sublocation_statistics
+        WHERE region_id = $1
+    ) s ON true
+    ORDER BY s.avg_combined_accessibility ASC
+"""
+
+
+FINGERPRINT_SQL = fingerprint_sql([table for _, table in FINGERPRINT_TABLES])
+SNAPSHOT_SQL = snapshot_sql([table for _, table in FINGERPRINT_TABLES])
+
+registry.register("snapshot_tables", """
+    SELECT name FROM unnest($1::text[]) as name WHERE to_regclass(name) IS NOT NULL
+""")
+registry.register("snapshot_fingerprint", FINGERPRINT_SQL)
+registry.register("snapshot_build", SNAPSHOT_SQL)
+
+
+@dataclass
+class DataSnapshot:
+    """Statistics, category distribution and rendered context for one region's data version"""
+    version: str
+    region_id: str
+    region_name: str
+    fingerprint: str
+    sublocations: List[Dict[str, Any]]
+    stats: Dict[str, Any]
+    categories: List[Dict[str, Any]]
+    context_text: str
+    built_at: datetime
+
+
+def _sum(values: List[Optional[float]]) -> Optional[float]:
+    """SQL SUM semantics: NULLs ignored, NULL when nothing is left"""
+    present = [value for value in values if value is not None]
+    return sum(present) if present else None
+
+
+def summarize(rows: List[Dict[str, Any]]) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """Classify each sublocation row in place; return overall stats and the category distribution"""
+    scores = [row['avg_combined_accessibility'] for row in rows if row['avg_combined_accessibility'] is not None]
+    stats = {
+        "total_sublocations": len(rows),
+        "avg_accessibility": sum(scores) / len(scores) if scores else None,
+        "min_accessibility": min(scores) if scores else None,
+        "max_accessibility": max(scores) if scores else None,
+        "total_population": _sum([row['total_population'] for row in rows]),
+        "total_water_points": _sum([row['water_points_count'] for row in rows]),
+    }
+
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    for row in rows:
+        row['accessibility_category'] = classify_accessibility(row['avg_combined_accessibility'])
+        groups.setdefault(row['accessibility_category'], []).append(row)
+
+    categories = []
+    for category, members in groups.items():
+        member_scores = [row['avg_combined_accessibility'] for row in members if row['avg_combined_accessibility'] is not None]
+        categories.append({
+            "category": category,
+            "count": len(members),
+            "population": _sum([row['total_population'] for row in members]),
+            "_min": min(member_scores) if member_scores else None,
+        })
+    # Worst band first; unscored rows last, as ORDER BY MIN(...) would put them
+    categories.sort(key=lambda cat: (cat['_min'] is None, cat['_min'] or 0.0))
+    for cat in categories:
+        del cat['_min']
+    return stats, categories
+
+
+def _score(value: Optional[float]) -> str:
+    """Score for the context text; regions and rows without statistics have none"""
+    return "n/a" if value is None else f"{value:.3f}"
+
+
+def _count(value: Optional[float]) -> str:
+    return "n/a" if value is None else f"{value:,}"
+
+
+def render_overview(stats: Dict[str, Any], categories: List[Dict[str, Any]], area: str = DEFAULT_REGION_NAME) -> str:
+    """Header, overview statistics and category distribution shared by every context variant"""
+    context = f"""
+REAL-TIME DATABASE CONTEXT ({area}):
+
+OVERVIEW STATISTICS:
+- Total sublocations: {stats['total_sublocations']}
+- Total population: {_count(stats['total_population'])} people
+- Total water points: {_count(stats['total_water_points'])}
+- Average accessibility score: {_score(stats['avg_accessibility'])}
+- Accessibility range: {_score(stats['min_accessibility'])} to {_score(stats['max_accessibility'])}
+
+CATEGORY DISTRIBUTION:
+"""
+    for cat in categories:
+        context += f"- {cat['category']}: {cat['count']} areas, {cat['population'] or 0:,} people\n"
+    return context
+
+
+def render_rows(sublocation_data: List[Dict[str, Any]]) -> str:
+    """One line per sublocation: score, category, population and water points"""
+    return "".join(
+        f"- {area['sublocation_name']}: {_score(area['avg_combined_accessibility'])} ({area['accessibility_category']}) | Pop: {_count(area['total_population'])} | Water points: {_count(area['water_points_count'])}\n"
+        for area in sublocation_data
+    )
+
+
+def render_context(stats: Dict[str, Any], categories: List[Dict[str, Any]], sublocation_data: List[Dict[str, Any]],
+                   area: str = DEFAULT_REGION_NAME) -> str:
+    """Render the full LLM context block from snapshot data"""
+    context = render_overview(stats, categories, area)
+    context += "\nDETAILED SUBLOCATION DATA:\n"
+    context += render_rows(sublocation_data)
+
+    # Identify worst and best areas
+    worst_areas = [area for area in sublocation_data if area['accessibility_category'] in ['Very Weak', 'Weak']][:3]
+    best_areas = [area for area in sublocation_data if area['accessibility_category'] == 'Very Good'][-3:]
+
+    context += f"\nPRIORITY INTERVENTION AREAS (Worst 3):\n"
+    for area in worst_areas:
+        context += f"- {area['sublocation_name']}: {_score(area['avg_combined_accessibility'])} ({area['accessibility_category']}) - {_count(area['total_population'])} people affected\n"
+
+    context += f"\nTOP PERFORMING AREAS (Best 3):\n"
+    for area in best_areas:
+        context += f"- {area['sublocation_name']}: {_score(area['avg_combined_accessibility'])} ({area['accessibility_category']}) - {_count(area['total_population'])} people well-served\n"
+
+    return context
+
+
+class SnapshotManager:
+    """Keeps one region's DataSnapshot in memory and rebuilds it only when its data changes.
+
+    Staleness is signalled by RegionSnapshots (LISTEN/NOTIFY or polling); a
+    stale snapshot is rebuilt only if the region's row-count/newest-xmin
+    fingerprint moved, so UPDATEs in place are picked up as well as imports. In the steady state ``get`` returns the cached
+    snapshot without touching the database. With ``cache_enabled`` off every
+    ``get`` reads the region afresh, still in one statement.
+    """
+
+    def __init__(self, region: Region, pool: Optional[asyncpg.Pool] = None, tables: Optional[List[str]] = None,
+                 cache_enabled: bool = True):
+        self.region = region
+        self.snapshot: Optional[DataSnapshot] = None
+        self.cache_enabled = cache_enabled
+        self.use_tables(tables or [table for _, table in FINGERPRINT_TABLES])
+        self._pool = pool
+        self._lock = asyncio.Lock()
+        self._stale = True
+
+    def use_tables(self, tables: List[str]):
+        """Fingerprint only ``tables`` (the ones this database has)"""
+        self.fingerprint_sql = fingerprint_sql(tables)
+        self.snapshot_sql = snapshot_sql(tables)
+
+    def invalidate(self):
+        """Mark the current snapshot as stale; the next ``get`` rebuilds it"""
+        self._stale = True
+
+    async def get(self) -> DataSnapshot:
+        """Return the current snapshot, rebuilding it first if it is stale"""
+        if not self.cache_enabled:
+            async with registry.acquire(self._pool) as conn:
+                return await self._build(conn)
+        if self.snapshot is None or self._stale:
+            async with self._lock:
+                if self.snapshot is None or self._stale:
+                    await self._rebuild_if_changed()
+        return self.snapshot
+
+    async def refresh(self, force: bool = False) -> DataSnapshot:
+        """Re-check the data fingerprint and rebuild the snapshot if it changed (or when forced)"""
+        async with self._lock:
+            await self._rebuild_if_changed(force)
+        return self.snapshot
+
+    async def _rebuild_if_changed(self, force: bool = False):
+        async with registry.acquire(self._pool) as conn:
+            # Cold or forced builds skip the separate check: the build statement carries the fingerprint
+            if not force and self.snapshot is not None:
+                fingerprint = await self._fingerprint(conn)
+                if fingerprint == self.snapshot.fingerprint:
+                    self._stale = False
+                    return
+
+            self._stale = False
+            await self._build(conn)
+
+        print(f"📸 Data snapshot {self.snapshot.version} built for {self.region.region_id} "
+              f"({len(self.snapshot.sublocations)} sublocations)")
+
+    async def _fingerprint(self, conn: asyncpg.Connection) -> str:
+        row = await registry.fetchrow(conn, "snapshot_fingerprint", self.region.region_id, sql=self.fingerprint_sql)
+        return "|".join(str(value) for value in row.values())
+
+    async def _build(self, conn: asyncpg.Connection) -> DataSnapshot:
+        rows = await registry.fetch(conn, "snapshot_build", self.region.region_id, sql=self.snapshot_sql)
+        fingerprint = "|".join(str(value) for key, value in rows[0].items() if key not in STATISTICS_COLUMNS)
+        sublocation_data = [
+            {column: row[column] for column in STATISTICS_COLUMNS}
+            for row in rows if row['sublocation_name'] is not None
+        ]
+        stats, categories = summarize(sublocation_data)
+
+        self.snapshot = DataSnapshot(
+            # The region is part of the version, so every cache keyed on it is region-scoped
+            version=hashlib.sha1(f"{self.region.region_id}|{fingerprint}".encode()).hexdigest()[:12],
+            region_id=self.region.region_id,
+            region_name=self.region.name,
+            fingerprint=fingerprint,
+            sublocations=sublocation_data,
+            stats=stats,
+            categories=categories,
+            context_text=render_context(stats, categories, sublocation_data, self.region.name),
+            built_at=datetime.now(),
+        )
+        return self.snapshot
+
+
+class RegionSnapshots:
+    """Snapshots for every region, sharing one LISTEN connection and poll loop.
+
+    A region's snapshot is built on first use, so a process serving many
+    study areas only holds the ones being queried. Change notifications
+    come from statement-level triggers and do not say which region changed:
+    every built snapshot is marked stale and the per-region fingerprint
+    decides which ones actually rebuild.
+    """
+
+    def __init__(self):
+        self.regions: Dict[str, Region] = default_regions()
+        self.managers: Dict[str, SnapshotManager] = {}
+        self.tables = [table for _, table in FINGERPRINT_TABLES]
+        # Off: every request reads its region's statistics afresh (one statement each)
+        self.cache_enabled = os.getenv("SNAPSHOT_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+        self.poll_interval = float(os.getenv("SNAPSHOT_POLL_SECONDS", "60"))
+        self._pool: Optional[asyncpg.Pool] = None
+        self._listener: Optional[asyncpg.Connection] = None
+        self._poll_task: Optional[asyncio.Task] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    @property
+    def snapshot(self) -> Optional[DataSnapshot]:
+        """The default region's snapshot, if built"""
+        manager = self.managers.get(default_region())
+        return manager.snapshot if manager else None
+
+    async def start(self, pool: asyncpg.Pool, database_url: str):
+        """Load the regions, build the default region's snapshot and subscribe to change notifications"""
+        self._pool = pool
+        await self.reload_regions()
+        await self.manager(default_region()).refresh(force=True)
+
+        try:
+            self._listener = await asyncpg.connect(database_url)
+            await self._listener.add_listener(NOTIFY_CHANNEL, self._on_notify)
+            print(f"✅ Listening for data changes on '{NOTIFY_CHANNEL}'")
+        except Exception as e:
+            self._listener = None
+            print(f"⚠️  LISTEN/NOTIFY unavailable, relying on fingerprint polling: {e}")
+
+        if self.poll_interval > 0:
+            self._poll_task = asyncio.create_task(self._poll_loop())
+
+    async def close(self):
+        """Stop background polling and release the listener connection"""
+        for task in (self._poll_task, self._refresh_task):
+            if task:
+                task.cancel()
+        if self._listener:
+            await self._listener.close()
+            self._listener = None
+
+    async def reload_regions(self):
+        async with registry.acquire(self._pool) as conn:
+            self.regions = await load_regions(conn)
+            present = await registry.fetch(conn, "snapshot_tables", sorted(OPTIONAL_TABLES))
+        optional = {row['name'] for row in present}
+        self.tables = [table for _, table in FINGERPRINT_TABLES if table not in OPTIONAL_TABLES or table in optional]
+        for manager in self.managers.values():
+            manager.use_tables(self.tables)
+        for region_id in list(self.managers):
+            if region_id not in self.regions:
+                del self.managers[region_id]
+
+    def region(self, region_id: Optional[str] = None) -> Region:
+        """The named region (default when None); raises UnknownRegionError"""
+        region = self.regions.get(region_id or default_region())
+        if region is None:
+            raise UnknownRegionError(region_id)
+        return region
+
+    def manager(self, region_id: Optional[str] = None) -> SnapshotManager:
+        region = self.region(region_id)
+        manager = self.managers.get(region.region_id)
+        if manager is None:
+            manager = self.managers[region.region_id] = SnapshotManager(
+                region, self._pool, self.tables, self.cache_enabled
+            )
+        return manager
+
+    async def get(self, region_id: Optional[str] = None) -> DataSnapshot:
+        return await self.manager(region_id).get()
+
+    async def refresh(self, region_id: Optional[str] = None, force: bool = False) -> DataSnapshot:
+        return await self.manager(region_id).refresh(force)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "regions": len(self.regions),
+            "loaded": {
+                region_id: manager.snapshot.version if manager.snapshot else None
+                for region_id, manager in self.managers.items()
+            },
+        }
+
+    def _on_notify(self, connection, pid, channel, payload):
+        """asyncpg listener callback - schedule a rebuild off the notification path"""
+        for manager in self.managers.values():
+            manager.invalidate()
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.get_running_loop().create_task(self._refresh_quietly(regions=payload == "regions"))
+
+    async def _poll_loop(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            await self._refresh_quietly(regions=True)
+
+    async def _refresh_quietly(self, regions: bool = False):
+        try:
+            if regions:
+                await self.reload_regions()
+            for manager in list(self.managers.values()):
+                await manager.refresh()
+        except Exception as e:
+            print(f"❌ Snapshot refresh failed: {e}")
@@ -0,0 +1,164 @@
+# streaming.py - Incremental parsing of streamed HydroGPT JSON and SSE helpers
+import json
+from typing import Any, List, Optional, Tuple
+
+# Top-level string fields forwarded token-by-token instead of once complete
+STREAMED_STRING_KEYS = ("text_response",)
+
+
+def sse_event(event: str, data: Any) -> str:
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class IncrementalJSONParser:
+    """Incremental parser for the top-level JSON object HydroGPT asks Claude to emit.
+
+    Feed it model text as it streams. ``feed`` returns a list of events:
+    ``("text_delta", key, str)`` while a streamed string field (text_response)
+    is being generated, and ``("field", key, value)`` as soon as any other
+    top-level value - e.g. the map_instructions object - is complete. Any text
+    before the opening brace (such as a markdown fence) is ignored.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.finished = False
+        self._pos = 0
+        self._started = False
+        self._start = 0
+        self._end = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        # Position within the top-level object: key_wait, key, colon_wait, value_wait, value, after_value
+        self._state = "key_wait"
+        self._key_start = 0
+        self._key: Optional[str] = None
+        self._value_start = 0
+        self._value_kind: Optional[str] = None
+        self._stream_start: Optional[int] = None
+        self._stream_emitted = 0
+
+    def feed(self, chunk: str) -> List[Tuple]:
+        self.text += chunk
+        events: List[Tuple] = []
+        text = self.text
+
+        for i in range(self._pos, len(text)):
+            if self.finished:
+                break
+            c = text[i]
+
+            if not self._started:
+                if c == "{":
+                    self._started = True
+                    self._start = i
+                    self._depth = 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._end_string(i, events)
+                continue
+
+            if c == '"':
+                self._in_string = True
+                if self._depth == 1 and self._state == "key_wait":
+                    self._state = "key"
+                    self._key_start = i
+                elif self._depth == 1 and self._state == "value_wait":
+                    self._begin_value(i, "string")
+                    if self._key in STREAMED_STRING_KEYS:
+                        self._stream_start = i + 1
+                        self._stream_emitted = i + 1
+            elif c in "{[":
+                if self._depth == 1 and self._state == "value_wait":
+                    self._begin_value(i, "container")
+                self._depth += 1
+            elif c in "}]":
+                self._depth -= 1
+                if self._depth == 1 and self._state == "value" and self._value_kind == "container":
+                    self._end_value(text[self._value_start:i + 1], events)
+                elif self._depth == 0:
+                    if self._state == "value" and self._value_kind == "scalar":
+                        self._end_value(text[self._value_start:i], events)
+                    self.finished = True
+                    self._end = i + 1
+            elif self._depth == 1:
+                if c == ":" and self._state == "colon_wait":
+                    self._state = "value_wait"
+                elif c == ",":
+                    if self._state == "value" and self._value_kind == "scalar":
+                        self._end_value(text[self._value_start:i], events)
+                    self._state = "key_wait"
+                elif not c.isspace() and self._state == "value_wait":
+                    self._begin_value(i, "scalar")
+
+        self._pos = len(text)
+
+        # Forward whatever part of a streamed string is safely decodable so far
+        if self._stream_start is not None:
+            delta = self._decode_stream(len(text))
+            if delta:
+                events.append(("text_delta", self._key, delta))
+
+        return events
+
+    def result(self) -> Optional[dict]:
+        """The complete parsed object once the closing brace has arrived"""
+        if not self.finished:
+            return None
+        return json.loads(self.text[self._start:self._end], strict=False)
+
+    def _begin_value(self, i: int, kind: str):
+        self._state = "value"
+        self._value_start = i
+        self._value_kind = kind
+
+    def _end_string(self, i: int, events: List[Tuple]):
+        if self._state == "key":
+            self._key = json.loads(self.text[self._key_start:i + 1])
+            self._state = "colon_wait"
+        elif self._state == "value" and self._value_kind == "string":
+            if self._stream_start is not None:
+                delta = self._decode_stream(i)
+                if delta:
+                    events.append(("text_delta", self._key, delta))
+                self._stream_start = None
+            self._end_value(self.text[self._value_start:i + 1], events)
+
+    def _end_value(self, raw: str, events: List[Tuple]):
+        try:
+            value = json.loads(raw, strict=False)
+        except json.JSONDecodeError:
+            value = raw.strip()
+        events.append(("field", self._key, value))
+        self._state = "after_value"
+        self._value_kind = None
+
+    def _decode_stream(self, end: int) -> str:
+        """Decode raw string content up to ``end`` without splitting an escape sequence"""
+        cut = end
+        while cut > self._stream_emitted:
+            try:
+                decoded = json.loads('"' + self.text[self._stream_emitted:cut] + '"', strict=False)
+            except json.JSONDecodeError:
+                # Hold back a partial escape such as a trailing backslash or \\u00
+                if end - cut >= 6:
+                    return ""
+                cut -= 1
+                continue
+            if decoded and "\ud800" <= decoded[-1] <= "\udbff":
+                # High surrogate - wait for its pair before emitting
+                cut -= 6
+                continue
+            self._stream_emitted = cut
+            return decoded
+        return ""
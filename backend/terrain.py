@@ -0,0 +1,248 @@
+# terrain.py - Tobler travel-time matrices from a DEM, precomputed in batch and reused by the engine
+#
+# Usage: python terrain.py --dem mbeere_dem.tif --output travel_times/ [--region mbeere_south]
+# Requires rasterio and scipy for the batch job only; loading results needs numpy alone.
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import os
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from accessibility import (
+    TRANSPORT_MODES, PAIR_BLOCK_CELLS, CatchmentPairs, DemandPoints, SupplyPoints,
+    haversine_km, make_pairs,
+)
+from regions import default_region, region_directory
+
+MANIFEST = "manifest.json"
+# Tobler's hiking function: 6 km/h * exp(-3.5 |slope + 0.05|); flat-ground speed is about 5.04 km/h
+TOBLER_FLAT_KMH = 6.0 * math.exp(-3.5 * 0.05)
+METRES_PER_DEGREE = 111_320.0
+NEIGHBOURS = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+
+
+def tobler_speed_kmh(slope: np.ndarray) -> np.ndarray:
+    """Walking speed for a rise-over-run slope (positive = uphill)"""
+    return 6.0 * np.exp(-3.5 * np.abs(slope + 0.05))
+
+
+def point_signature(lon: np.ndarray, lat: np.ndarray, ids: Optional[np.ndarray] = None) -> str:
+    """Stable fingerprint of a point set, used to tell whether stored matrices still apply"""
+    digest = hashlib.sha1(np.round(lon, 6).tobytes() + np.round(lat, 6).tobytes())
+    if ids is not None:
+        digest.update(np.asarray(ids, dtype=np.int64).tobytes())
+    return digest.hexdigest()[:16]
+
+
+@dataclass
+class TerrainGrid:
+    """Elevation raster (metres) with per-row cell sizes in metres"""
+    elevation: np.ndarray
+    valid: np.ndarray
+    cell_width_m: np.ndarray
+    cell_height_m: float
+    to_cell: object
+
+    @classmethod
+    def from_geotiff(cls, path: str) -> "TerrainGrid":
+        import rasterio
+        from rasterio.warp import transform as warp_transform
+
+        with rasterio.open(path) as src:
+            band = src.read(1, masked=True)
+            transform, crs = src.transform, src.crs
+        elevation = band.filled(np.nan).astype(np.float64)
+        valid = ~np.isnan(elevation)
+        rows = np.arange(elevation.shape[0])
+
+        if crs.is_geographic:
+            latitude = transform.f + (rows + 0.5) * transform.e
+            cell_width_m = abs(transform.a) * METRES_PER_DEGREE * np.cos(np.radians(latitude))
+            cell_height_m = abs(transform.e) * METRES_PER_DEGREE
+        else:
+            cell_width_m = np.full(len(rows), abs(transform.a))
+            cell_height_m = abs(transform.e)
+
+        def to_cell(lon: np.ndarray, lat: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+            xs, ys = warp_transform("EPSG:4326", crs, lon.tolist(), lat.tolist())
+            inverse = ~transform
+            cols, rows_ = inverse * (np.array(xs), np.array(ys))
+            return np.floor(rows_).astype(np.int64), np.floor(cols).astype(np.int64)
+
+        return cls(elevation=elevation, valid=valid, cell_width_m=cell_width_m,
+                   cell_height_m=cell_height_m, to_cell=to_cell)
+
+    def node_ids(self) -> np.ndarray:
+        """Graph node index per cell (-1 for nodata)"""
+        ids = np.full(self.elevation.shape, -1, dtype=np.int64)
+        ids[self.valid] = np.arange(int(self.valid.sum()))
+        return ids
+
+    def locate(self, lon: np.ndarray, lat: np.ndarray, ids: np.ndarray) -> np.ndarray:
+        """Graph node for each point, -1 when outside the raster or on nodata"""
+        rows, cols = self.to_cell(lon, lat)
+        height, width = self.elevation.shape
+        inside = (rows >= 0) & (rows < height) & (cols >= 0) & (cols < width)
+        nodes = np.full(len(lon), -1, dtype=np.int64)
+        nodes[inside] = ids[rows[inside], cols[inside]]
+        return nodes
+
+    def walking_graph(self, ids: np.ndarray):
+        """Directed 8-neighbour graph weighted by Tobler walking minutes"""
+        from scipy.sparse import csr_matrix
+
+        height, width = self.elevation.shape
+        sources, targets, minutes = [], [], []
+        for dr, dc in NEIGHBOURS:
+            r0, r1 = max(0, -dr), height - max(0, dr)
+            c0, c1 = max(0, -dc), width - max(0, dc)
+            here = ids[r0:r1, c0:c1]
+            there = ids[r0 + dr:r1 + dr, c0 + dc:c1 + dc]
+            linked = (here >= 0) & (there >= 0)
+            rise = self.elevation[r0 + dr:r1 + dr, c0 + dc:c1 + dc] - self.elevation[r0:r1, c0:c1]
+            run = np.hypot(dc * self.cell_width_m[r0:r1, None], dr * self.cell_height_m)
+            run = np.broadcast_to(run, rise.shape)
+            step = run / 1000.0 / tobler_speed_kmh(rise / run) * 60.0
+            sources.append(here[linked])
+            targets.append(there[linked])
+            minutes.append(step[linked])
+        n_nodes = int(self.valid.sum())
+        return csr_matrix((np.concatenate(minutes), (np.concatenate(sources), np.concatenate(targets))),
+                          shape=(n_nodes, n_nodes))
+
+
+def terrain_pairs(grid: TerrainGrid, demand: DemandPoints, supply: SupplyPoints,
+                  modes: Dict[str, Dict[str, float]] = TRANSPORT_MODES) -> Dict[str, CatchmentPairs]:
+    """Per-mode catchment pairs from cost-distance over the DEM.
+
+    One Dijkstra per water point runs on the reversed walking graph, giving
+    demand-to-water-point times. Other modes scale the walking times by
+    their flat-ground speed relative to Tobler's, so a single search serves
+    every mode. Points outside the raster get no pairs.
+    """
+    from scipy.sparse.csgraph import dijkstra
+
+    ids = grid.node_ids()
+    reversed_graph = grid.walking_graph(ids).T.tocsr()
+    demand_nodes = grid.locate(demand.lon, demand.lat, ids)
+    supply_nodes = grid.locate(supply.lon, supply.lat, ids)
+    on_grid = np.flatnonzero(demand_nodes >= 0)
+    scale = {mode: TOBLER_FLAT_KMH / params["speed_kmh"] for mode, params in modes.items()}
+    limit = max(params["threshold_minutes"] / scale[mode] for mode, params in modes.items())
+
+    collected = {mode: ([], [], []) for mode in modes}
+    sources = np.flatnonzero(supply_nodes >= 0)
+    block = max(1, PAIR_BLOCK_CELLS // max(1, reversed_graph.shape[0]))
+    for start in range(0, len(sources), block):
+        batch = sources[start:start + block]
+        walking = dijkstra(reversed_graph, directed=True, indices=supply_nodes[batch], limit=limit)
+        walking = walking[:, demand_nodes[on_grid]]
+        for mode, params in modes.items():
+            minutes = walking * scale[mode]
+            cols, rows = np.nonzero(minutes < params["threshold_minutes"])
+            collected[mode][0].append(on_grid[rows])
+            collected[mode][1].append(batch[cols])
+            collected[mode][2].append(minutes[cols, rows])
+
+    return {mode: make_pairs(*(np.concatenate(parts) if parts else np.empty(0) for parts in collected[mode]),
+                             threshold=modes[mode]["threshold_minutes"])
+            for mode in modes}
+
+
+def detour_factors(pairs: Dict[str, CatchmentPairs], demand: DemandPoints, supply: SupplyPoints,
+                   modes: Dict[str, Dict[str, float]] = TRANSPORT_MODES) -> Dict[str, float]:
+    """Median terrain-to-straight-line time ratio per mode, used for hypothetical water points"""
+    factors = {}
+    for mode, mode_pairs in pairs.items():
+        straight = haversine_km(demand.lon[mode_pairs.demand], demand.lat[mode_pairs.demand],
+                                supply.lon[mode_pairs.supply], supply.lat[mode_pairs.supply])
+        straight_minutes = straight * 60.0 / modes[mode]["speed_kmh"]
+        usable = straight_minutes > 0
+        if usable.any():
+            factors[mode] = round(float(np.median(mode_pairs.minutes[usable] / straight_minutes[usable])), 4)
+    return factors
+
+
+def save_travel_times(directory: str, pairs: Dict[str, CatchmentPairs], demand: DemandPoints,
+                      supply: SupplyPoints, source: str):
+    """Write per-mode pair arrays as .npy files plus a manifest describing what they cover"""
+    os.makedirs(directory, exist_ok=True)
+    for mode, mode_pairs in pairs.items():
+        for name in ("demand", "supply", "minutes"):
+            np.save(os.path.join(directory, f"{mode}.{name}.npy"), getattr(mode_pairs, name))
+    manifest = {
+        "source": source,
+        "created_at": datetime.now().isoformat(),
+        "demand_signature": point_signature(demand.lon, demand.lat),
+        "supply_signature": point_signature(supply.lon, supply.lat, supply.ids),
+        "modes": {mode: {"pairs": len(mode_pairs.demand)} for mode, mode_pairs in pairs.items()},
+        "detour_factors": detour_factors(pairs, demand, supply),
+    }
+    temporary = os.path.join(directory, f"{MANIFEST}.tmp")
+    with open(temporary, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(temporary, os.path.join(directory, MANIFEST))
+
+
+def load_travel_times(directory: Optional[str], demand: DemandPoints, supply: SupplyPoints,
+                      modes: Dict[str, Dict[str, float]] = TRANSPORT_MODES
+                      ) -> Optional[Tuple[Dict[str, CatchmentPairs], Dict[str, float]]]:
+    """Stored pairs and detour factors, or None when absent or built for different points"""
+    if not directory:
+        return None
+    try:
+        with open(os.path.join(directory, MANIFEST)) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+
+    if (manifest.get("demand_signature") != point_signature(demand.lon, demand.lat)
+            or manifest.get("supply_signature") != point_signature(supply.lon, supply.lat, supply.ids)
+            or set(manifest.get("modes", {})) != set(modes)):
+        print(f"⚠️ Travel times in {directory} were built for different points; using straight-line times")
+        return None
+
+    pairs = {}
+    for mode, params in modes.items():
+        arrays = [np.load(os.path.join(directory, f"{mode}.{name}.npy"), mmap_mode="r")
+                  for name in ("demand", "supply", "minutes")]
+        pairs[mode] = make_pairs(*arrays, threshold=params["threshold_minutes"])
+    return pairs, manifest.get("detour_factors", {})
+
+
+async def build(dem: str, output: str, database_url: str, region_id: Optional[str] = None):
+    import asyncpg
+    from accessibility import load_demand_points, load_supply_points
+
+    region_id = region_id or default_region()
+    conn = await asyncpg.connect(database_url)
+    try:
+        supply = await load_supply_points(conn, region_id)
+        demand = await load_demand_points(conn, region_id)
+    finally:
+        await conn.close()
+
+    grid = TerrainGrid.from_geotiff(dem)
+    pairs = terrain_pairs(grid, demand, supply)
+    # Matrices live in <output>/<region_id>, where AccessibilityEngine.load looks for them
+    save_travel_times(region_directory(output, region_id), pairs, demand, supply, source=os.path.basename(dem))
+    for mode, mode_pairs in pairs.items():
+        print(f"✅ {mode}: {len(mode_pairs.demand)} demand/water point pairs")
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Precompute Tobler travel-time matrices from a DEM")
+    parser.add_argument("--dem", required=True, help="GeoTIFF elevation raster covering the study area")
+    parser.add_argument("--output", default=os.getenv("TRAVEL_TIME_DIR", "travel_times"))
+    parser.add_argument("--region", default=default_region(), help="Region whose points the DEM covers")
+    args = parser.parse_args()
+    asyncio.run(build(args.dem, args.output, os.getenv("DATABASE_URL"), args.region))
@@ -0,0 +1,68 @@
+"""
+Conversation memory: which answers are recorded and how history is replayed to Claude
+
+    python -m pytest -q test_conversation.py
+"""
+import asyncio
+
+import pytest
+
+from context_builder import ContextSelection
+from conversation import Conversation, ConversationStore, Turn
+
+NAMES = ["MAKIMA", "KARABA", "KIAMBERE"]
+
+
+def answer(text, **extra):
+    return {"text_response": text, "map_instructions": None, "chart_instructions": None, **extra}
+
+
+@pytest.mark.parametrize("response", [
+    answer(""),
+    answer("  \n"),
+    {"map_instructions": None},
+    answer("Error processing query with Claude API: overloaded", error=True),
+], ids=["empty", "blank", "missing", "error"])
+def test_empty_and_error_answers_are_not_recorded(response):
+    store = ConversationStore()
+
+    async def run():
+        conversation = await store.get("session")
+        await store.record(conversation, "How is Makima doing?", response, NAMES)
+        return conversation
+
+    conversation = asyncio.run(run())
+    assert conversation.empty
+    assert conversation.messages() == []
+
+
+def test_answered_turn_is_recorded():
+    store = ConversationStore()
+
+    async def run():
+        conversation = await store.get("session")
+        await store.record(conversation, "How is Makima doing?", answer("MAKIMA scores 0.968 (Very Weak)."), NAMES)
+        return conversation
+
+    conversation = asyncio.run(run())
+    assert [message["role"] for message in conversation.messages()] == ["user", "assistant"]
+    assert conversation.focus == ["MAKIMA"]
+
+
+def test_cache_breakpoints_only_on_non_empty_blocks():
+    from main import HydroGPTService
+
+    service = HydroGPTService()
+    service.prompt_cache = True
+    # A session saved with an empty last answer, e.g. from an older process
+    conversation = Conversation(session_id="session", turns=[
+        Turn(query="How is Makima doing?", answer="MAKIMA scores 0.968 (Very Weak).", sublocations=["MAKIMA"]),
+        Turn(query="And Karaba?", answer=""),
+    ])
+    request = service.build_request("What about its population?", ContextSelection.plain("context"), conversation)
+
+    blocks = request["system"] + [block for message in request["messages"] if isinstance(message["content"], list)
+                                  for block in message["content"]]
+    assert all(block["text"].strip() for block in blocks if "cache_control" in block)
+    assert all(message["content"] for message in request["messages"])
+    assert request["messages"][-2]["content"][0]["text"] == "MAKIMA scores 0.968 (Very Weak)."
@@ -0,0 +1,85 @@
+"""
+Intent router: template queries answered locally, everything else left to Claude
+
+    python -m pytest -q test_intent_router.py
+"""
+import pytest
+
+from intent_router import IntentRouter
+
+SCORES = {
+    "GACHOKA": 1.62, "KARABA": 1.45, "KIAMBERE": 1.34, "MAKIMA": 0.968,
+    "MAVURIA": 1.05, "MBITA": 1.18, "RIAKANAU": 0.91, "WACHORO": 1.27,
+}
+
+
+@pytest.fixture(scope="module")
+def router():
+    return IntentRouter()
+
+
+@pytest.fixture(scope="module")
+def snapshot(make_snapshot):
+    return make_snapshot([
+        {
+            "sublocation_name": name,
+            "avg_combined_accessibility": score,
+            "total_population": 2000 + 150 * index,
+            "water_points_count": 3 + index,
+            "high_capacity_water_points": 1,
+            "medium_capacity_water_points": 1,
+            "low_capacity_water_points": 1 + index,
+        }
+        for index, (name, score) in enumerate(sorted(SCORES.items(), key=lambda item: item[1]))
+    ])
+
+
+@pytest.mark.parametrize("query, intent", [
+    ("Which areas have the worst water access?", "worst_access_ranking"),
+    ("Where should we build new water points?", "infrastructure_recommendation"),
+    ("How is water accessibility in Makima?", "single_location_analysis"),
+    ("how is water accessibility in makimma", "single_location_analysis"),
+    ("What's the average accessibility score?", "average_accessibility"),
+    ("What is the average accessibility", "average_accessibility"),
+    ("Compare Makima and Karaba", "two_location_comparison"),
+    ("How many people have poor water access?", "population_poor_access"),
+    ("Rank all areas by accessibility", "full_ranking"),
+])
+def test_template_queries_are_answered_locally(router, snapshot, query, intent):
+    answer = router.route(query, snapshot)
+    assert answer is not None
+    assert answer["query_type"] == intent
+    assert answer["source"] == "intent_router"
+
+
+@pytest.mark.parametrize("query", [
+    # Negation the recommendation template cannot express
+    "Where should we not build new water points?",
+    # A sublocation the county-wide average does not bind
+    "What is the average accessibility score in Makima?",
+    # A statistic other than accessibility
+    "What is the average population?",
+    "What is the total population?",
+    # Superlative over a different subject plus a contradicting category
+    "Which lowest population areas have good access?",
+    "Which most people live in Makima?",
+    # Prefix of a dynamic pattern followed by more question
+    "Show me Makima and the water points near Karaba",
+    "How many people have poor access in Karaba?",
+    # Same words as a template except the number asked for
+    "Show top 3 areas with best access",
+])
+def test_queries_with_unbound_meaning_fall_back_to_claude(router, snapshot, query):
+    assert router.route(query, snapshot) is None
+
+
+def test_partial_matches_score_below_the_threshold(router):
+    names = list(SCORES)
+    intent, confidence, _ = router.match("Where should we not build new water points?", names)
+    assert intent == "infrastructure_recommendation"
+    assert confidence < router.min_confidence
+
+
+def test_average_answer_uses_snapshot_values(router, snapshot):
+    answer = router.route("What's the average accessibility score?", snapshot)
+    assert f"{snapshot.stats['avg_accessibility']:.3f}" in answer["text_response"]
@@ -0,0 +1,138 @@
+"""
+Siting optimizer: lazy-greedy gains against brute force and a from-scratch engine
+
+    python -m pytest -q test_optimizer.py
+"""
+import itertools
+
+import numpy as np
+import pytest
+
+import optimizer
+import scenarios
+from accessibility import AccessibilityEngine, SupplyPoints
+from optimizer import CandidateSites, SitingOptimizer
+from scenarios import ScenarioEvaluator
+
+CAPACITY = 3
+
+
+@pytest.fixture(scope="module")
+def evaluator(make_engine):
+    return ScenarioEvaluator(make_engine(n_demand=600, n_supply=40, seed=3))
+
+
+@pytest.fixture(scope="module")
+def candidates(evaluator, study_area):
+    lon, lat, span = study_area.lon, study_area.lat, study_area.span
+    lon, lat = np.meshgrid(np.linspace(lon, lon + span, 6), np.linspace(lat, lat + span, 6))
+    return CandidateSites.build(evaluator.engine, lon.ravel(), lat.ravel())
+
+
+def objective_from_scratch(evaluator, candidates, sites):
+    """Objective with ``sites`` built, from a new engine rather than the incremental path"""
+    supply = evaluator.engine.supply
+    extended = SupplyPoints(
+        ids=np.concatenate([supply.ids, np.full(len(sites), -1)]),
+        lon=np.concatenate([supply.lon, candidates.lon[sites]]),
+        lat=np.concatenate([supply.lat, candidates.lat[sites]]),
+        capacity=np.concatenate([supply.capacity, np.full(len(sites), float(CAPACITY))]),
+    )
+    engine = AccessibilityEngine(evaluator.engine.demand, extended)
+    engine.reference = evaluator.baseline.reference
+    score = engine.compute().score
+    return float((engine.demand.population * np.minimum(score, optimizer.ADEQUATE_SCORE)).sum())
+
+
+def brute_force_greedy(evaluator, candidates, sites):
+    probe = SitingOptimizer(evaluator, candidates, CAPACITY)
+    chosen, gains = [], []
+    current = probe.objective(evaluator.baseline.score)
+    for _ in range(sites):
+        values = {candidate: probe.objective(probe.score_with(chosen + [candidate]))
+                  for candidate in range(len(candidates)) if candidate not in chosen}
+        best = max(values, key=values.get)
+        chosen.append(best)
+        gains.append(values[best] - current)
+        current = values[best]
+    return chosen, gains
+
+
+def test_lazy_greedy_matches_brute_force_greedy(evaluator, candidates, monkeypatch):
+    # Exact first-pass probes: lazy greedy must then pick what plain greedy picks
+    monkeypatch.setattr(scenarios, "CATCHMENT_ONLY_PAIR_SHARE", float("inf"))
+    result = SitingOptimizer(evaluator, candidates, CAPACITY).run(4, time_budget=60)
+    chosen, gains = brute_force_greedy(evaluator, candidates, 4)
+    assert result["complete"]
+    assert result["candidates_evaluated"] == len(candidates)
+    assert [(site["lat"], site["lon"]) for site in result["sites"]] == \
+        [(round(float(candidates.lat[c]), 6), round(float(candidates.lon[c]), 6)) for c in chosen]
+    assert [site["marginal_gain"] for site in result["sites"]] == [round(gain, 2) for gain in gains]
+
+
+def test_gains_match_a_from_scratch_engine(evaluator, candidates):
+    chosen, gains = brute_force_greedy(evaluator, candidates, 3)
+    before = objective_from_scratch(evaluator, candidates, [])
+    for count, (_, gain) in enumerate(zip(chosen, gains), start=1):
+        after = objective_from_scratch(evaluator, candidates, chosen[:count])
+        assert after - before == pytest.approx(gain, rel=1e-9)
+        before = after
+
+
+def test_catchment_estimates_never_exceed_the_exact_gain(evaluator, candidates):
+    probe = SitingOptimizer(evaluator, candidates, CAPACITY)
+    for candidate in range(len(candidates)):
+        estimate = probe.objective(probe.score_with([candidate], catchment_only=True))
+        exact = probe.objective(probe.score_with([candidate]))
+        assert estimate <= exact + 1e-9
+
+
+def test_catchment_estimate_recomputes_only_the_catchment(evaluator, candidates):
+    capacity = np.concatenate([evaluator.engine.supply.capacity, np.zeros(len(candidates))])
+    site = len(evaluator.engine.supply) + 14
+    capacity[site] = CAPACITY
+    added = candidates.select([14])["driving"]
+    state = evaluator.states["driving"]
+    _, recomputed = state.evaluate(capacity, np.array([site]), added, evaluator.engine.demand.population,
+                                   catchment_only=True)
+    np.testing.assert_array_equal(np.sort(recomputed), np.sort(added.demand))
+
+
+def test_estimated_first_pass_picks_with_exact_gains(evaluator, candidates):
+    result = SitingOptimizer(evaluator, candidates, CAPACITY).run(4, time_budget=60)
+    _, gains = brute_force_greedy(evaluator, candidates, 4)
+    assert result["complete"]
+    index = {(round(float(lat), 6), round(float(lon), 6)): c for c, (lat, lon) in enumerate(zip(candidates.lat, candidates.lon))}
+    picks = [index[site["lat"], site["lon"]] for site in result["sites"]]
+    before = objective_from_scratch(evaluator, candidates, [])
+    for count, site in enumerate(result["sites"], start=1):
+        after = objective_from_scratch(evaluator, candidates, picks[:count])
+        assert site["marginal_gain"] == pytest.approx(after - before, abs=0.01)
+        before = after
+    assert sum(site["marginal_gain"] for site in result["sites"]) >= 0.98 * sum(gains)
+
+
+def test_first_pass_cut_short_samples_the_whole_area(evaluator, candidates, study_area, monkeypatch):
+    # A clock that advances one second per reading: the budget allows a fixed number of probes
+    clock = itertools.count()
+    monkeypatch.setattr(optimizer.time, "perf_counter", lambda: float(next(clock)))
+    probe = SitingOptimizer(evaluator, candidates, CAPACITY)
+    probed = []
+    score_with = probe.score_with
+    monkeypatch.setattr(probe, "score_with", lambda sites, **options: probed.append(sites[-1]) or score_with(sites, **options))
+
+    result = probe.run(2, time_budget=8)
+    assert not result["complete"]
+    assert 0 < result["candidates_evaluated"] < len(candidates)
+    first_pass = probed[:result["candidates_evaluated"]]
+    latitudes = candidates.lat[first_pass]
+    middle = study_area.lat + study_area.span / 2
+    assert (latitudes < middle).any() and (latitudes > middle).any()
+
+
+def test_cancel_stops_probing(evaluator, candidates):
+    probe = SitingOptimizer(evaluator, candidates, CAPACITY)
+    probe.score_with = lambda sites, score_with=probe.score_with, **options: (probe.cancel(), score_with(sites, **options))[1]
+    result = probe.run(3, time_budget=60)
+    assert not result["complete"]
+    assert result["candidates_evaluated"] == 1
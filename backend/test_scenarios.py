@@ -0,0 +1,72 @@
+"""
+What-if scenarios: incremental and dense fast paths agree with a from-scratch recompute
+
+    python -m pytest -q test_scenarios.py
+"""
+import numpy as np
+import pytest
+
+from conftest import STUDY_AREA
+from scenarios import ScenarioDelta, ScenarioEvaluator, segment_sum
+
+LAT, LON = STUDY_AREA.lat, STUDY_AREA.lon
+
+
+@pytest.fixture(scope="module")
+def evaluator(make_engine):
+    return ScenarioEvaluator(make_engine())
+
+
+DELTAS = [
+    ScenarioDelta(add=[(LAT + 0.2, LON + 0.2, 3)], remove=[], set_capacity=[]),
+    ScenarioDelta(add=[], remove=[1003, 1040], set_capacity=[]),
+    ScenarioDelta(add=[], remove=[], set_capacity=[(1010, 1), (1011, 3)]),
+    ScenarioDelta(add=[(LAT + 0.05, LON + 0.4, 1), (LAT + 0.3, LON + 0.1, 2)], remove=[1020],
+                  set_capacity=[(1021, 3)]),
+    # Edge of the study area, where few demand points are in reach
+    ScenarioDelta(add=[(LAT, LON, 2)], remove=[], set_capacity=[]),
+]
+
+
+@pytest.mark.parametrize("delta", DELTAS)
+def test_scenario_matches_full_recompute(evaluator, delta):
+    result = evaluator.evaluate(delta)
+    full = evaluator.evaluate_full(delta)
+    assert [row["scenario_accessibility"] for row in result["sublocations"]] == [row["accessibility"] for row in full]
+    assert [row["scenario_category"] for row in result["sublocations"]] == [row["category"] for row in full]
+
+
+@pytest.mark.parametrize("delta", DELTAS)
+def test_each_mode_matches_its_full_recompute(evaluator, delta):
+    capacity, changed = evaluator.capacity_delta(delta)
+    added = evaluator.added_pairs(delta)
+    population = evaluator.engine.demand.population
+    for mode, state in evaluator.states.items():
+        access, _ = state.evaluate(capacity, changed, added[mode], population)
+        expected = state.evaluate_full(capacity, added[mode], population)
+        np.testing.assert_allclose(access, expected, rtol=1e-12, atol=1e-15, err_msg=mode)
+
+
+def test_only_modes_whose_catchments_cover_the_area_are_recomputed_densely(evaluator):
+    capacity, changed = evaluator.capacity_delta(DELTAS[0])
+    added = evaluator.added_pairs(DELTAS[0])
+    population = evaluator.engine.demand.population
+    recomputed = {mode: len(state.evaluate(capacity, changed, added[mode], population)[1])
+                  for mode, state in evaluator.states.items()}
+    n_demand = len(population)
+    assert recomputed["driving"] == n_demand
+    assert recomputed["walking"] < n_demand / 10
+    assert recomputed["animals"] < n_demand / 10
+
+
+def test_unchanged_network_reproduces_the_baseline(evaluator):
+    result = evaluator.evaluate(ScenarioDelta(add=[], remove=[], set_capacity=[]))
+    assert all(row["change"] == 0 for row in result["sublocations"])
+    assert result["population_lifted_out_of_poor_access"] == 0
+
+
+def test_segment_sum_handles_empty_rows():
+    values = np.array([1.0, 2.0, 3.0, 4.0])
+    indptr = np.array([0, 0, 2, 2, 4, 4])
+    np.testing.assert_array_equal(segment_sum(values, indptr), [0.0, 3.0, 0.0, 7.0, 0.0])
+    np.testing.assert_array_equal(segment_sum(np.empty(0), np.zeros(3, dtype=np.int64)), [0.0, 0.0])
@@ -0,0 +1,212 @@
+"""
+Snapshot change detection and context rendering, against an in-memory stand-in for the database
+
+    python -m pytest -q test_snapshot.py
+"""
+import asyncio
+import itertools
+import json
+import re
+from contextlib import asynccontextmanager
+
+import pytest
+from starlette.requests import Request
+
+import main
+from context_builder import ContextBuilder
+from intent_router import IntentRouter
+from regions import Region
+from snapshot import STATISTICS_COLUMNS, SnapshotManager, RegionSnapshots, render_overview
+
+REGION = Region("mbeere_south", "Mbeere South Subcounty")
+SUBSELECT = re.compile(r"\(SELECT (COUNT\(\*\)|MAX\(xmin::text::bigint\)) FROM (\w+) WHERE region_id = \$1\) as (\w+)")
+
+
+class FakeDatabase:
+    """Tables as lists of rows; every write stamps the rows with a new transaction id, like xmin"""
+
+    def __init__(self, *tables):
+        self.tables = {table: [] for table in tables}
+        self.xid = itertools.count(100)
+        self.statements = []
+
+    def write(self, table, *rows, region_id=REGION.region_id):
+        xmin = next(self.xid)
+        self.tables[table].extend(dict(row, region_id=region_id, xmin=xmin) for row in rows)
+
+    def rows(self, table, region_id):
+        return [row for row in self.tables[table] if row['region_id'] == region_id]
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield self
+
+    async def fetchval(self, sql, *args):
+        table = re.search(r"to_regclass\('(\w+)'\)", sql).group(1)
+        return table in self.tables
+
+    async def fetchrow(self, sql, region_id):
+        self.statements.append(sql)
+        row = {}
+        for aggregate, table, label in SUBSELECT.findall(sql):
+            rows = self.rows(table, region_id)
+            row[label] = len(rows) if aggregate == "COUNT(*)" else max((r['xmin'] for r in rows), default=None)
+        return row
+
+    async def fetch(self, sql, *args):
+        if "unnest" in sql:
+            return [{"name": table} for table in args[0] if table in self.tables]
+        if "WITH fingerprint" not in sql:
+            assert "FROM sublocation_rollup" in sql
+            return self.rows("sublocation_rollup", args[0])
+        # The fingerprint repeated on every statistics row, or on one all-NULL row
+        fingerprint = await self.fetchrow(sql, args[0])
+        rows = sorted(self.rows("sublocation_statistics", args[0]), key=lambda row: row['avg_combined_accessibility'])
+        return [dict(fingerprint, **{column: row[column] for column in STATISTICS_COLUMNS})
+                for row in rows] or [dict(fingerprint, **dict.fromkeys(STATISTICS_COLUMNS))]
+
+
+def statistics_row(name, score):
+    return {
+        "sublocation_name": name, "avg_combined_accessibility": score, "total_population": 1000,
+        "water_points_count": 2, "high_capacity_water_points": 1, "medium_capacity_water_points": 1,
+        "low_capacity_water_points": 0,
+    }
+
+
+@pytest.fixture
+def database():
+    database = FakeDatabase("sublocation_statistics", "sublocations", "waterpoints", "demand_points", "sublocation_rollup")
+    database.write("sublocation_statistics", statistics_row("KIAMBERE", 0.9), statistics_row("MAVURIA", 1.3))
+    database.write("waterpoints", {"capacitysc": 2})
+    return database
+
+
+def test_demand_point_import_bumps_the_version(database):
+    manager = SnapshotManager(REGION, database)
+    before = asyncio.run(manager.refresh()).version
+    assert asyncio.run(manager.refresh()).version == before
+
+    database.write("demand_points", {"population": 120})
+    assert asyncio.run(manager.refresh()).version != before
+
+
+def test_databases_without_demand_points_are_still_fingerprinted(database):
+    del database.tables["demand_points"]
+    snapshots = RegionSnapshots()
+    snapshots._pool = database
+    asyncio.run(snapshots.reload_regions())
+    assert "demand_points" not in snapshots.manager(REGION.region_id).fingerprint_sql
+    snapshot = asyncio.run(snapshots.refresh(REGION.region_id))
+    assert [row['sublocation_name'] for row in snapshot.sublocations] == ["KIAMBERE", "MAVURIA"]
+
+UNSCORED_ROWS = [
+    {
+        "sublocation_name": "NEW AREA",
+        "avg_combined_accessibility": None,
+        "total_population": None,
+        "water_points_count": None,
+        "high_capacity_water_points": None,
+        "medium_capacity_water_points": None,
+        "low_capacity_water_points": None,
+    },
+]
+
+
+@pytest.fixture(scope="module")
+def make_region(make_snapshot):
+    return lambda rows: make_snapshot([dict(row) for row in rows], "new_region", "New Region")
+
+
+@pytest.mark.parametrize("rows", [[], UNSCORED_ROWS], ids=["empty", "unscored"])
+def test_region_without_statistics_renders(make_region, rows):
+    snapshot = make_region(rows)
+    assert snapshot.stats["avg_accessibility"] is None
+    assert "Average accessibility score: n/a" in snapshot.context_text
+    assert f"Total sublocations: {len(rows)}" in render_overview(snapshot.stats, snapshot.categories)
+
+
+@pytest.mark.parametrize("rows", [[], UNSCORED_ROWS], ids=["empty", "unscored"])
+def test_region_without_statistics_selects_context_and_defers_routing(make_region, rows):
+    snapshot = make_region(rows)
+    for mode in ("query", "full"):
+        assert "New Region" in ContextBuilder(mode=mode).select("What's the overall summary?", snapshot).text
+    router = IntentRouter()
+    for query in ("What's the average accessibility score?", "Give me a statistical summary of all areas"):
+        assert router.route(query, snapshot) is None
+
+
+def test_unscored_row_is_listed_as_unknown(make_region):
+    snapshot = make_region(UNSCORED_ROWS)
+    assert "- NEW AREA: n/a (Unknown) | Pop: n/a | Water points: n/a" in snapshot.context_text
+
+
+def refresh_rollup(database):
+    """REFRESH MATERIALIZED VIEW sublocation_rollup: rewrite every row from the current statistics"""
+    database.tables["sublocation_rollup"] = []
+    database.write("sublocation_rollup", *[{
+        "sublocation_name": row['sublocation_name'], "accessibility_score": row['avg_combined_accessibility'],
+        "total_population": row['total_population'], "accessibility_category": "Weak",
+        "water_points": row['water_points_count'], "geometry": None,
+    } for row in database.rows("sublocation_statistics", REGION.region_id)])
+
+
+def test_map_follows_import_then_rollup_refresh(database, monkeypatch):
+    refresh_rollup(database)
+    service = main.HydroGPTService()
+    service.db_pool = service.snapshots._pool = database
+    monkeypatch.setattr(main, "hydrogpt_service", service)
+    request = Request({"type": "http", "headers": []})
+
+    def map_scores():
+        response = asyncio.run(main.get_default_map_data(request, REGION.region_id))
+        return [feature["properties"]["accessibility"] for feature in json.loads(response.body)["features"]]
+
+    asyncio.run(main.refresh_snapshot(REGION.region_id))
+    assert map_scores() == [0.9, 1.3]
+
+    # Import: the statistics change at once, the rollup only when it is refreshed
+    database.write("sublocation_statistics", statistics_row("NTHAWA", 1.1))
+    asyncio.run(main.refresh_snapshot(REGION.region_id))
+    assert map_scores() == [0.9, 1.3]
+
+    refresh_rollup(database)
+    asyncio.run(main.refresh_snapshot(REGION.region_id))
+    assert map_scores() == [0.9, 1.3, 1.1]
+
+
+def test_rollup_refresh_moves_the_version(database):
+    manager = SnapshotManager(REGION, database)
+    before = asyncio.run(manager.refresh()).version
+    refresh_rollup(database)
+    assert asyncio.run(manager.refresh()).version != before
+
+
+def test_cold_build_is_one_statement_and_unchanged_data_one_check(database):
+    manager = SnapshotManager(REGION, database)
+    first = asyncio.run(manager.get())
+    assert len(database.statements) == 1
+
+    manager.invalidate()
+    assert asyncio.run(manager.get()) is first
+    assert len(database.statements) == 2 and "WITH fingerprint" not in database.statements[-1]
+
+
+def test_empty_region_builds_from_the_fingerprint_row(database):
+    manager = SnapshotManager(Region("new_region", "New Region"), database)
+    snapshot = asyncio.run(manager.get())
+    assert snapshot.sublocations == [] and snapshot.stats["total_sublocations"] == 0
+
+    database.write("sublocation_statistics", statistics_row("NEW AREA", 1.2), region_id="new_region")
+    assert asyncio.run(manager.refresh()).version != snapshot.version
+
+
+def test_disabled_cache_reads_every_request_in_one_statement(database, monkeypatch):
+    monkeypatch.setenv("SNAPSHOT_CACHE_ENABLED", "false")
+    snapshots = RegionSnapshots()
+    snapshots._pool = database
+    first = asyncio.run(snapshots.get(REGION.region_id))
+    database.write("sublocation_statistics", statistics_row("NTHAWA", 1.1))
+    second = asyncio.run(snapshots.get(REGION.region_id))
+    assert len(database.statements) == 2
+    assert len(second.sublocations) == len(first.sublocations) + 1
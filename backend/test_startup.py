@@ -37,7 +37,7 @@ async def test_startup():
     
     # Close connection
     if service.db_pool:
-        await service.db_pool.close()
+        await service.close()
         print("\n🔒 Database connection closed")
 
 if __name__ == "__main__":
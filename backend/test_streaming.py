@@ -0,0 +1,107 @@
+"""
+Streaming JSON parser and LLM slot handling for /api/query/stream (no database or Claude needed)
+
+    python -m pytest -q test_streaming.py
+"""
+import asyncio
+import json
+
+from llm_limiter import LLMLimiter
+from streaming import IncrementalJSONParser
+
+ANSWER = {
+    "text_response": "Makima is \"Very Weak\" (0.968) — café \U0001F30A\nNext line",
+    "map_instructions": {"highlight_areas": ["MAKIMA"], "zoom_to_location": "MAKIMA"},
+    "chart_instructions": None,
+    "proactive_suggestions": ["Compare with Karaba?", "Show {braces} and [brackets]"],
+    "database_query_needed": False,
+    "confidence_level": "high",
+}
+
+
+def feed_all(text, chunk_size):
+    parser = IncrementalJSONParser()
+    events = []
+    for offset in range(0, len(text), chunk_size):
+        events.extend(parser.feed(text[offset:offset + chunk_size]))
+    return parser, events
+
+
+def test_deltas_rebuild_text_response_for_any_chunking():
+    text = json.dumps(ANSWER, ensure_ascii=False)
+    for chunk_size in (1, 2, 3, 5, 7, 64, len(text)):
+        parser, events = feed_all(text, chunk_size)
+        deltas = "".join(event[2] for event in events if event[0] == "text_delta")
+        assert deltas == ANSWER["text_response"], chunk_size
+        assert parser.result() == ANSWER
+
+
+def test_escaped_unicode_is_never_split():
+    # ensure_ascii escapes the emoji as a surrogate pair
+    text = json.dumps(ANSWER, ensure_ascii=True)
+    parser, events = feed_all(text, 1)
+    deltas = [event[2] for event in events if event[0] == "text_delta"]
+    assert "".join(deltas) == ANSWER["text_response"]
+    assert all(not ("\ud800" <= delta[-1] <= "\udbff") for delta in deltas)
+
+
+def test_fields_are_emitted_as_soon_as_complete():
+    text = json.dumps(ANSWER)
+    parser = IncrementalJSONParser()
+    cut = text.index('"chart_instructions"')
+    events = parser.feed(text[:cut])
+    fields = {event[1]: event[2] for event in events if event[0] == "field"}
+    assert fields["map_instructions"] == ANSWER["map_instructions"]
+    assert parser.result() is None
+
+    events = parser.feed(text[cut:])
+    fields = {event[1]: event[2] for event in events if event[0] == "field"}
+    assert fields["chart_instructions"] is None
+    assert fields["proactive_suggestions"] == ANSWER["proactive_suggestions"]
+    assert fields["database_query_needed"] is False
+    assert parser.finished
+
+
+def test_text_around_the_object_is_ignored():
+    text = "```json\n" + json.dumps(ANSWER) + "\n```"
+    parser, events = feed_all(text, 4)
+    assert parser.result() == ANSWER
+    assert not parser.feed(" trailing")
+
+
+def test_releaser_frees_the_slot_once():
+    async def run():
+        limiter = LLMLimiter(max_concurrency=1, max_queue=0)
+        release = limiter.releaser(await limiter.acquire())
+        release()
+        release()
+        assert limiter.stats()["in_flight"] == 0
+        # The slot is usable again and the semaphore was not over-released
+        release = limiter.releaser(await limiter.acquire())
+        assert limiter._semaphore.locked()
+        release()
+
+    asyncio.run(run())
+
+
+def test_unstarted_stream_does_not_leak_its_slot():
+    from main import HydroGPTService
+
+    async def run():
+        service = HydroGPTService()
+        service.claude_client = object()
+        service.llm_limiter = LLMLimiter(max_concurrency=1, max_queue=0)
+
+        # Client disconnected before the body started: only the background release runs
+        events, release = await service.stream_query("Why is access poor in Makima?")
+        release()
+        assert service.llm_limiter.stats()["in_flight"] == 0
+
+        # Stream consumed (the fake client fails), then the background release runs as well
+        events, release = await service.stream_query("Why is access poor in Makima?")
+        assert [event async for event in events][-1].startswith("event: error")
+        release()
+        assert service.llm_limiter.stats()["in_flight"] == 0
+        assert not service.llm_limiter._semaphore.locked()
+
+    asyncio.run(run())
@@ -0,0 +1,83 @@
+"""
+Vector tiles: conditional requests, on-disk version pruning and the rollup-backed sublocations layer
+
+    python -m pytest -q test_tiles.py
+"""
+import asyncio
+import os
+from types import SimpleNamespace
+
+from starlette.requests import Request
+
+import main
+from tiles import TileCache
+
+REGION = "mbeere_south"
+
+
+def test_new_version_prunes_older_disk_tiles(tmp_path):
+    cache = TileCache(directory=str(tmp_path))
+
+    async def run():
+        for step, version in enumerate(["v1", "v2", "v3"]):
+            await cache.put((REGION, version, "sublocations", 10, 612, 511), b"tile")
+            await cache.put(("other_region", "o1", "sublocations", 10, 612, 511), b"tile")
+            # Directory mtimes order the versions; make them distinct on coarse clocks
+            os.utime(tmp_path / REGION / version, (step, step))
+        await cache.put((REGION, "v3", "waterpoints", 10, 612, 511), b"tile")
+
+    asyncio.run(run())
+    assert sorted(os.listdir(tmp_path / REGION)) == ["v2", "v3"]
+    assert os.listdir(tmp_path / "other_region") == ["o1"]
+
+
+def test_prune_keeps_the_current_version(tmp_path):
+    cache = TileCache(directory=str(tmp_path))
+    asyncio.run(cache.put((REGION, "v1", "sublocations", 0, 0, 0), b"tile"))
+    cache.prune(REGION, "v1", keep=1)
+    assert os.listdir(tmp_path / REGION) == ["v1"]
+
+
+class TileConnection:
+    """Answers the rollup check and records the tile statements it is sent"""
+
+    def __init__(self, rollup):
+        self.rollup = rollup
+        self.statements = []
+
+    async def fetchval(self, sql, *args):
+        if "to_regclass" in sql:
+            return self.rollup
+        self.statements.append(sql)
+        return 4326 if "ST_SRID" in sql else b"tile"
+
+
+def test_sublocations_layer_reads_the_rollup_when_present():
+    service = main.HydroGPTService()
+    with_rollup, without = TileConnection(True), TileConnection(False)
+    assert asyncio.run(service.render_tile(with_rollup, "sublocations", 10, 612, 511, REGION)) == b"tile"
+    assert asyncio.run(service.render_tile(without, "sublocations", 10, 612, 511, REGION)) == b"tile"
+    assert ["FROM sublocation_rollup" in sql for sql in with_rollup.statements] == [True]
+    assert not any("sublocation_rollup" in sql for sql in without.statements)
+    assert "ST_Dump" in without.statements[-1] and "GROUP BY s.slname" in without.statements[-1]
+
+
+def test_matching_etag_returns_304_without_rendering(monkeypatch):
+    service = main.HydroGPTService()
+    service.db_pool = object()
+
+    async def snapshot(region_id=None):
+        return SimpleNamespace(version="abc123")
+
+    async def render(*args):
+        raise AssertionError("a matching ETag must not render the tile")
+
+    monkeypatch.setattr(service.snapshots, "get", snapshot)
+    monkeypatch.setattr(service, "render_tile", render)
+    monkeypatch.setattr(main, "hydrogpt_service", service)
+    etag = '"abc123-sublocations-10-612-511"'
+    for header in (etag, f'"stale", {etag}', "*"):
+        request = Request({"type": "http", "headers": [(b"if-none-match", header.encode())]})
+        response = asyncio.run(main.get_tile(request, "sublocations", 10, 612, 511, REGION))
+        assert response.status_code == 304
+        assert response.headers["etag"] == etag
@@ -0,0 +1,219 @@
+# tiles.py - Mapbox Vector Tiles over sublocations and water points with a versioned tile cache
+import asyncio
+import os
+import shutil
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from queries import registry
+
+MVT_MEDIA_TYPE = "application/vnd.mapbox-vector-tile"
+MAX_ZOOM = 22
+
+# Per-layer SQL. $1-$3 = z/x/y, $4 = SRID of the source table so the (region_id, geom) GIST
+# index applies, $5 = region_id. The sublocations statement is the fallback for databases
+# without sublocation_rollup (see ROLLUP_TILE_SQL).
+LAYER_SQL = {
+    "sublocations": """
+        WITH bounds AS (
+            SELECT ST_TileEnvelope($1, $2, $3) as geom
+        ),
+        -- Multi-part sublocations are stored as several rows; one feature per sublocation
+        parts AS (
+            SELECT s.slname, ST_Collect(part.geom) as geom
+            FROM sublocations s
+            CROSS JOIN bounds
+            CROSS JOIN LATERAL ST_Dump(s.geom) part
+            WHERE s.region_id = $5
+              AND s.geom && ST_Transform(bounds.geom, $4::integer)
+              AND s.slname IS NOT NULL
+            GROUP BY s.slname
+        ),
+        stats AS (
+            SELECT
+                sublocation_name,
+                AVG(avg_combined_accessibility) as accessibility,
+                AVG(total_population) as population,
+                SUM(water_points_count) as water_points
+            FROM sublocation_statistics
+            WHERE region_id = $5 AND sublocation_name IN (SELECT slname FROM parts)
+            GROUP BY sublocation_name
+        ),
+        mvtgeom AS (
+            SELECT
+                ST_AsMVTGeom(ST_Transform(p.geom, 3857), bounds.geom, 4096, 64, true) as geom,
+                p.slname as name,
+                ROUND(COALESCE(stats.accessibility, 0)::numeric, 3)::float8 as accessibility,
+                CASE
+                    WHEN stats.accessibility IS NULL THEN 'Unknown'
+                    WHEN stats.accessibility < 1.0 THEN 'Very Weak'
+                    WHEN stats.accessibility < 1.2 THEN 'Weak'
+                    WHEN stats.accessibility < 1.5 THEN 'Good'
+                    ELSE 'Very Good'
+                END as category,
+                COALESCE(stats.population, 0)::integer as population,
+                COALESCE(stats.water_points, 0)::integer as water_points
+            FROM parts p
+            CROSS JOIN bounds
+            LEFT JOIN stats ON stats.sublocation_name = p.slname
+        )
+        SELECT ST_AsMVT(mvtgeom.*, 'sublocations', 4096, 'geom') FROM mvtgeom
+    """,
+    "waterpoints": """
+        WITH bounds AS (
+            SELECT ST_TileEnvelope($1, $2, $3) as geom
+        ),
+        mvtgeom AS (
+            SELECT
+                ST_AsMVTGeom(ST_Transform(w.geom, 3857), bounds.geom, 4096, 64, true) as geom,
+                w.id,
+                COALESCE(w.source, 'Unknown') as name,
+                COALESCE(w.water_sour, 'Unknown') as water_source,
+                COALESCE(w.capacitysc, 1) as capacity_score,
+                COALESCE(w.status, 'Unknown') as status
+            FROM waterpoints w
+            CROSS JOIN bounds
+            WHERE w.region_id = $5
+              AND w.geom && ST_Transform(bounds.geom, $4::integer)
+        )
+        SELECT ST_AsMVT(mvtgeom.*, 'waterpoints', 4096, 'geom') FROM mvtgeom
+    """,
+}
+
+# Sublocations from the precomputed map rollup (database/init.sql): one row per sublocation with
+# its statistics already joined, stored in WGS84. $1-$3 = z/x/y, $4 = region_id.
+ROLLUP_TILE_SQL = """
+    WITH bounds AS (
+        SELECT ST_TileEnvelope($1, $2, $3) as geom
+    ),
+    mvtgeom AS (
+        SELECT
+            ST_AsMVTGeom(ST_Transform(r.geom, 3857), bounds.geom, 4096, 64, true) as geom,
+            r.sublocation_name as name,
+            ROUND(r.accessibility_score::numeric, 3)::float8 as accessibility,
+            r.accessibility_category as category,
+            r.total_population as population,
+            COALESCE(r.water_points, 0)::integer as water_points
+        FROM sublocation_rollup r
+        CROSS JOIN bounds
+        WHERE r.region_id = $4
+          AND r.geom && ST_Transform(bounds.geom, 4326)
+    )
+    SELECT ST_AsMVT(mvtgeom.*, 'sublocations', 4096, 'geom') FROM mvtgeom
+"""
+
+for _layer, _sql in LAYER_SQL.items():
+    registry.register(f"tile_{_layer}", _sql)
+registry.register("tile_sublocations_rollup", ROLLUP_TILE_SQL)
+
+# Source table per layer, used for the SRID lookup
+LAYER_TABLES = {
+    "sublocations": "sublocations",
+    "waterpoints": "waterpoints",
+}
+
+
+def valid_tile(z: int, x: int, y: int) -> bool:
+    return 0 <= z <= MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+class TileCache:
+    """Two-tier tile cache keyed by region and data version: memory LRU plus an on-disk directory.
+
+    Disk tiles live under ``<directory>/<region>/<version>/<layer>/<z>/<x>/<y>.mvt``
+    so a new data version never serves old tiles. The first tile written for a
+    new version prunes the region's older versions, keeping the previous one
+    for requests (or other workers) still on it.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, directory: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self._tiles: "OrderedDict[Tuple, bytes]" = OrderedDict()
+        self._bytes = 0
+        self._versions: Dict[str, str] = {}
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls) -> "TileCache":
+        return cls(
+            max_bytes=int(os.getenv("TILE_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+            directory=os.getenv("TILE_CACHE_DIR") or None,
+        )
+
+    async def get(self, key: Tuple) -> Optional[bytes]:
+        tile = self._tiles.get(key)
+        if tile is not None:
+            self._tiles.move_to_end(key)
+            self.hits += 1
+            return tile
+
+        if self.directory:
+            tile = await asyncio.to_thread(self._read, key)
+            if tile is not None:
+                self.disk_hits += 1
+                self._store(key, tile)
+                return tile
+
+        self.misses += 1
+        return None
+
+    async def put(self, key: Tuple, tile: bytes):
+        self._store(key, tile)
+        if self.directory:
+            await asyncio.to_thread(self._write, key, tile)
+            region_id, version = key[:2]
+            if self._versions.get(region_id) != version:
+                self._versions[region_id] = version
+                await asyncio.to_thread(self.prune, region_id, version)
+
+    def prune(self, region_id: str, version: str, keep: int = 2):
+        """Remove all but the newest ``keep`` versions of a region's disk tiles, never ``version``"""
+        versions = [
+            entry for entry in os.scandir(os.path.join(self.directory, region_id))
+            if entry.is_dir() and entry.name != version
+        ]
+        versions.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+        for entry in versions[keep - 1:]:
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "tiles": len(self._tiles),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "directory": self.directory,
+        }
+
+    def _store(self, key: Tuple, tile: bytes):
+        if key in self._tiles:
+            self._bytes -= len(self._tiles.pop(key))
+        self._tiles[key] = tile
+        self._bytes += len(tile)
+        while self._tiles and self._bytes > self.max_bytes:
+            _, evicted = self._tiles.popitem(last=False)
+            self._bytes -= len(evicted)
+
+    def _path(self, key: Tuple) -> str:
+        region_id, version, layer, z, x, y = key
+        return os.path.join(self.directory, region_id, version, layer, str(z), str(x), f"{y}.mvt")
+
+    def _read(self, key: Tuple) -> Optional[bytes]:
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _write(self, key: Tuple, tile: bytes):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write-then-rename so concurrent readers never see a partial tile
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as f:
+            f.write(tile)
+        os.replace(temporary, path)
@@ -0,0 +1,154 @@
+# tracing.py - Optional OpenTelemetry spans for requests, database queries and Claude calls
+#
+# Off unless TRACING_EXPORTER is set and the OpenTelemetry SDK is installed:
+#   TRACING_EXPORTER=otlp   -> OTLP/HTTP to OTEL_EXPORTER_OTLP_ENDPOINT (default http://localhost:4318)
+#   TRACING_EXPORTER=json   -> one JSON span per line under TRACING_JSON_DIR, for offline analysis
+# Every helper is a no-op while tracing is off, so call sites need no guards.
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+try:
+    from opentelemetry import propagate, trace
+except ImportError:  # tracing is optional - the API package comes with opentelemetry-sdk
+    propagate = trace = None
+
+_tracer = None
+_provider = None
+
+
+def _json_exporter(directory: str):
+    from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+
+    class JSONLinesExporter(SpanExporter):
+        """Appends finished spans to <directory>/traces-<pid>.jsonl"""
+
+        def __init__(self):
+            os.makedirs(directory, exist_ok=True)
+            self.path = os.path.join(directory, f"traces-{os.getpid()}.jsonl")
+            self._lock = threading.Lock()
+
+        def export(self, spans) -> "SpanExportResult":
+            with self._lock, open(self.path, "a") as f:
+                for span in spans:
+                    f.write(span.to_json(indent=None) + "\n")
+            return SpanExportResult.SUCCESS
+
+        def shutdown(self):
+            pass
+
+    return JSONLinesExporter()
+
+
+def configure(service_name: str = "hydrogpt-api") -> bool:
+    """Install a tracer provider from the environment; returns whether tracing is on"""
+    global _tracer, _provider
+    exporter_name = os.getenv("TRACING_EXPORTER", "").lower()
+    if not exporter_name or _tracer is not None:
+        return _tracer is not None
+    if trace is None:
+        print("⚠️  TRACING_EXPORTER is set but opentelemetry-sdk is not installed; tracing disabled")
+        return False
+
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+
+    if exporter_name == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        exporter = OTLPSpanExporter()
+    elif exporter_name == "json":
+        exporter = _json_exporter(os.getenv("TRACING_JSON_DIR", "traces"))
+    else:
+        print(f"⚠️  Unknown TRACING_EXPORTER '{exporter_name}'; tracing disabled")
+        return False
+
+    _provider = TracerProvider(resource=Resource.create({"service.name": os.getenv("OTEL_SERVICE_NAME", service_name)}))
+    _provider.add_span_processor(BatchSpanProcessor(exporter))
+    _tracer = _provider.get_tracer("hydrogpt")
+    print(f"✅ Tracing enabled ({exporter_name})")
+    return True
+
+
+def shutdown():
+    """Flush pending spans"""
+    if _provider is not None:
+        _provider.shutdown()
+
+
+def _clean(attributes: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: value for key, value in attributes.items() if value is not None}
+
+
+@contextmanager
+def span(name: str, **attributes: Any):
+    """Child span of the current context; yields None when tracing is off"""
+    if _tracer is None:
+        yield None
+        return
+    with _tracer.start_as_current_span(name, attributes=_clean(attributes)) as current:
+        yield current
+
+
+@contextmanager
+def server_span(method: str, headers: Any):
+    """Root span for an incoming request, continuing a W3C traceparent when the caller sent one"""
+    if _tracer is None:
+        yield None
+        return
+    with _tracer.start_as_current_span(method, context=propagate.extract(headers),
+                                       kind=trace.SpanKind.SERVER,
+                                       attributes={"http.request.method": method}) as current:
+        yield current
+
+
+@contextmanager
+def detached_span(name: str, **attributes: Any):
+    """Span that is not made current, for work spread over an async generator's yields"""
+    if _tracer is None:
+        yield None
+        return
+    current = _tracer.start_span(name, attributes=_clean(attributes))
+    try:
+        yield current
+    except BaseException as e:
+        current.record_exception(e)
+        raise
+    finally:
+        current.end()
+
+
+def finish_request(current: Optional[Any], method: str, route: str, status: int):
+    """Name the request span after its route template once routing has happened"""
+    if current is not None:
+        current.update_name(f"{method} {route}")
+        set_attributes(current, **{"http.route": route, "http.response.status_code": status})
+
+
+def set_attributes(current: Optional[Any], **attributes: Any):
+    if current is not None:
+        current.set_attributes(_clean(attributes))
+
+
+def trace_id(current: Optional[Any]) -> Optional[str]:
+    """Hex trace id of a span, as shown by trace backends"""
+    if current is None:
+        return None
+    return trace.format_trace_id(current.get_span_context().trace_id)
+
+
+def record_usage(current: Optional[Any], model: str, usage: Any):
+    """GenAI semantic-convention attributes for an Anthropic response's token usage"""
+    if current is None or usage is None:
+        return
+    set_attributes(
+        current,
+        **{
+            "gen_ai.response.model": model,
+            "gen_ai.usage.input_tokens": usage.input_tokens,
+            "gen_ai.usage.output_tokens": usage.output_tokens,
+            "gen_ai.usage.cache_read_input_tokens": usage.cache_read_input_tokens or 0,
+            "gen_ai.usage.cache_creation_input_tokens": usage.cache_creation_input_tokens or 0,
+        }
+    )
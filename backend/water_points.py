@@ -0,0 +1,135 @@
+# water_points.py - Viewport-bounded water point queries (bbox, zoom, filters, paging, clustering)
+import math
+import os
+from dataclasses import dataclass, field
+from typing import Optional, List, Tuple, Any
+
+from regions import default_region
+
+# Below this zoom level points are aggregated into grid clusters (WATER_POINTS_CLUSTER_MAX_ZOOM)
+DEFAULT_CLUSTER_MAX_ZOOM = 11
+# Cluster cell size in screen pixels
+CLUSTER_CELL_PIXELS = 64
+MAX_LIMIT = 10000
+
+
+def cluster_max_zoom() -> int:
+    """Read at call time so a value from .env (loaded after import) is honoured"""
+    return int(os.getenv("WATER_POINTS_CLUSTER_MAX_ZOOM", str(DEFAULT_CLUSTER_MAX_ZOOM)))
+
+
+@dataclass
+class WaterPointQuery:
+    """Parsed /api/water-points parameters"""
+    region_id: str = field(default_factory=default_region)
+    bbox: Optional[Tuple[float, float, float, float]] = None
+    zoom: Optional[int] = None
+    capacity: List[int] = field(default_factory=list)
+    status: List[str] = field(default_factory=list)
+    limit: Optional[int] = None
+    cursor: Optional[int] = None
+
+    @property
+    def is_default(self) -> bool:
+        return (self.bbox is None and self.zoom is None and not self.capacity
+                and not self.status and self.limit is None and self.cursor is None)
+
+    @property
+    def key(self) -> Tuple:
+        """Canonical form: filter order and status case do not change the result"""
+        return (self.region_id, self.bbox, self.zoom, tuple(sorted(set(self.capacity))),
+                tuple(sorted({status.lower() for status in self.status})), self.limit, self.cursor)
+
+    @property
+    def clustered(self) -> bool:
+        return self.zoom is not None and self.zoom < cluster_max_zoom()
+
+
+def parse_bbox(bbox: Optional[str]) -> Optional[Tuple[float, float, float, float]]:
+    """Parse 'minLon,minLat,maxLon,maxLat' (WGS84); raises ValueError when malformed"""
+    if not bbox:
+        return None
+    parts = [float(part) for part in bbox.split(",")]
+    if len(parts) != 4:
+        raise ValueError("bbox must be minLon,minLat,maxLon,maxLat")
+    min_lon, min_lat, max_lon, max_lat = parts
+    if min_lon >= max_lon or min_lat >= max_lat:
+        raise ValueError("bbox minimums must be smaller than maximums")
+    return min_lon, min_lat, max_lon, max_lat
+
+
+def coordinate_precision(zoom: Optional[int]) -> int:
+    """Decimal places needed to stay within about one pixel at ``zoom``"""
+    if zoom is None:
+        return 9
+    degrees_per_pixel = 360.0 / (256 * 2 ** zoom)
+    return max(0, min(7, math.ceil(-math.log10(degrees_per_pixel))))
+
+
+def cluster_cell_size(zoom: int) -> float:
+    """Grid cell size in degrees used to cluster points at ``zoom``"""
+    return CLUSTER_CELL_PIXELS * 360.0 / (256 * 2 ** zoom)
+
+
+def build_query(params: WaterPointQuery, srid: int) -> Tuple[str, List[Any]]:
+    """SQL and arguments for a water point request.
+
+    The bbox filter is expressed in the table's own SRID so the GIST index
+    idx_waterpoints_region_geom (region_id, geom) can be used.
+    """
+    args: List[Any] = [params.region_id]
+    conditions = ["region_id = $1", "geom IS NOT NULL"]
+
+    if params.bbox:
+        args.extend(params.bbox)
+        args.append(srid)
+        conditions.append("geom && ST_Transform(ST_MakeEnvelope($2, $3, $4, $5, 4326), $6::integer)")
+    if params.capacity:
+        args.append(params.capacity)
+        conditions.append(f"capacitysc = ANY(${len(args)}::integer[])")
+    if params.status:
+        args.append([status.lower() for status in params.status])
+        conditions.append(f"LOWER(status) = ANY(${len(args)}::text[])")
+
+    precision = coordinate_precision(params.zoom)
+
+    if params.clustered:
+        args.append(cluster_cell_size(params.zoom))
+        cell = f"${len(args)}::float8"
+        where = " AND ".join(conditions)
+        sql = f"""
+            SELECT
+                COUNT(*) as point_count,
+                AVG(capacitysc) as avg_capacity,
+                MAX(capacitysc) as max_capacity,
+                ST_AsGeoJSON(ST_Centroid(ST_Collect(g)), {precision}) as geometry
+            FROM (
+                SELECT ST_Transform(geom, 4326) as g, capacitysc
+                FROM waterpoints
+                WHERE {where}
+            ) w
+            GROUP BY ST_SnapToGrid(g, {cell})
+        """
+        return sql, args
+
+    if params.cursor is not None:
+        args.append(params.cursor)
+        conditions.append(f"id > ${len(args)}")
+    where = " AND ".join(conditions)
+    sql = f"""
+        SELECT
+            id,
+            source as name,
+            water_sour as water_source,
+            capacitysc as capacity_score,
+            status,
+            ST_AsGeoJSON(ST_Transform(geom, 4326), {precision}) as geometry
+        FROM waterpoints
+        WHERE {where}
+        ORDER BY id
+    """
+    if params.limit is not None:
+        # One extra row tells us whether there is a next page
+        args.append(params.limit + 1)
+        sql += f" LIMIT ${len(args)}"
+    return sql, args
@@ -3,6 +3,21 @@
 
 -- Enable PostGIS extension
 CREATE EXTENSION IF NOT EXISTS postgis;
+-- Lets GIST indexes lead with region_id so spatial queries stay inside one region
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+
+-- Study areas served by the backend; every data row carries one of these ids
+CREATE TABLE IF NOT EXISTS regions (
+    region_id VARCHAR(64) PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- 'mbeere_south' is also the region_id column default below. It is fixed here: the backend's
+-- DEFAULT_REGION setting picks the region served when a request names none, and rows inserted
+-- without a region_id still land in 'mbeere_south' whatever that setting is.
+INSERT INTO regions (region_id, name) VALUES ('mbeere_south', 'Mbeere South Subcounty')
+ON CONFLICT DO NOTHING;
 
 -- Create tables (you'll need to import your actual data)
 -- This is a template - replace with your actual schema
@@ -11,6 +26,7 @@ CREATE EXTENSION IF NOT EXISTS postgis;
 -- (You'll need to export this from your Windows PostgreSQL)
 CREATE TABLE IF NOT EXISTS sublocation_statistics (
     id SERIAL PRIMARY KEY,
+    region_id VARCHAR(64) NOT NULL DEFAULT 'mbeere_south',
     sublocation_name VARCHAR(255) NOT NULL,
     avg_combined_accessibility FLOAT,
     total_population INTEGER,
@@ -24,6 +40,7 @@ CREATE TABLE IF NOT EXISTS sublocation_statistics (
 -- Example sublocations table structure
 CREATE TABLE IF NOT EXISTS sublocations (
     id SERIAL PRIMARY KEY,
+    region_id VARCHAR(64) NOT NULL DEFAULT 'mbeere_south',
     slname VARCHAR(255),
     locname VARCHAR(255),
     geom GEOMETRY(MULTIPOLYGON, 4326),
@@ -33,6 +50,7 @@ CREATE TABLE IF NOT EXISTS sublocations (
 -- Example waterpoints table structure  
 CREATE TABLE IF NOT EXISTS waterpoints (
     id SERIAL PRIMARY KEY,
+    region_id VARCHAR(64) NOT NULL DEFAULT 'mbeere_south',
     source VARCHAR(255),
     water_sour VARCHAR(255),
     capacitysc INTEGER,
@@ -41,11 +59,170 @@ CREATE TABLE IF NOT EXISTS waterpoints (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
--- Create indexes for better performance
-CREATE INDEX IF NOT EXISTS idx_sublocations_slname ON sublocations(slname);
-CREATE INDEX IF NOT EXISTS idx_sublocations_geom ON sublocations USING GIST(geom);
-CREATE INDEX IF NOT EXISTS idx_waterpoints_geom ON waterpoints USING GIST(geom);
-CREATE INDEX IF NOT EXISTS idx_stats_sublocation ON sublocation_statistics(sublocation_name);
+-- Population demand points for the in-process SCM-G2SFCA engine
+-- (optional: when empty the backend spreads sublocation populations over generated points)
+CREATE TABLE IF NOT EXISTS demand_points (
+    id SERIAL PRIMARY KEY,
+    region_id VARCHAR(64) NOT NULL DEFAULT 'mbeere_south',
+    sublocation_name VARCHAR(255) NOT NULL,
+    population FLOAT NOT NULL,
+    geom GEOMETRY(POINT, 4326),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Chat sessions when CONVERSATION_STORE=postgres (recent turns, rolling summary, sublocations in focus)
+CREATE TABLE IF NOT EXISTS conversations (
+    session_id VARCHAR(128) PRIMARY KEY,
+    state JSONB NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- Databases created before regions existed: existing rows become 'mbeere_south'
+ALTER TABLE sublocation_statistics ADD COLUMN IF NOT EXISTS region_id VARCHAR(64) NOT NULL DEFAULT 'mbeere_south';
+ALTER TABLE sublocations ADD COLUMN IF NOT EXISTS region_id VARCHAR(64) NOT NULL DEFAULT 'mbeere_south';
+ALTER TABLE waterpoints ADD COLUMN IF NOT EXISTS region_id VARCHAR(64) NOT NULL DEFAULT 'mbeere_south';
+ALTER TABLE demand_points ADD COLUMN IF NOT EXISTS region_id VARCHAR(64) NOT NULL DEFAULT 'mbeere_south';
+
+-- Create indexes for better performance. Every backend query filters on region_id first, so the
+-- indexes lead with it: one region's rows are read without touching any other region's.
+-- (For very large deployments the same tables can be LIST-partitioned on region_id instead.)
+CREATE INDEX IF NOT EXISTS idx_sublocations_region_slname ON sublocations(region_id, slname);
+CREATE INDEX IF NOT EXISTS idx_sublocations_region_geom ON sublocations USING GIST(region_id, geom);
+CREATE INDEX IF NOT EXISTS idx_waterpoints_region_id ON waterpoints(region_id, id);
+CREATE INDEX IF NOT EXISTS idx_waterpoints_region_geom ON waterpoints USING GIST(region_id, geom);
+CREATE INDEX IF NOT EXISTS idx_stats_region_sublocation ON sublocation_statistics(region_id, sublocation_name);
+CREATE INDEX IF NOT EXISTS idx_demand_points_region_geom ON demand_points USING GIST(region_id, geom);
+DROP INDEX IF EXISTS idx_sublocations_slname;
+DROP INDEX IF EXISTS idx_sublocations_geom;
+DROP INDEX IF EXISTS idx_waterpoints_geom;
+DROP INDEX IF EXISTS idx_stats_sublocation;
+DROP INDEX IF EXISTS idx_demand_points_geom;
+CREATE INDEX IF NOT EXISTS idx_conversations_updated_at ON conversations(updated_at);
+
+-- Notify the backend whenever data changes so it can rebuild its in-memory snapshot
+CREATE OR REPLACE FUNCTION notify_hydrogpt_data_changed() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('hydrogpt_data_changed', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS sublocation_statistics_changed ON sublocation_statistics;
+CREATE TRIGGER sublocation_statistics_changed
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON sublocation_statistics
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_hydrogpt_data_changed();
+
+DROP TRIGGER IF EXISTS sublocations_changed ON sublocations;
+CREATE TRIGGER sublocations_changed
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON sublocations
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_hydrogpt_data_changed();
+
+DROP TRIGGER IF EXISTS demand_points_changed ON demand_points;
+CREATE TRIGGER demand_points_changed
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON demand_points
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_hydrogpt_data_changed();
+
+DROP TRIGGER IF EXISTS regions_changed ON regions;
+CREATE TRIGGER regions_changed
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON regions
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_hydrogpt_data_changed();
+
+DROP TRIGGER IF EXISTS waterpoints_changed ON waterpoints;
+CREATE TRIGGER waterpoints_changed
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON waterpoints
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_hydrogpt_data_changed();
+
+-- Rollups created before regions existed are rebuilt with a region_id column
+DO $$
+BEGIN
+    IF to_regclass('sublocation_rollup') IS NOT NULL AND NOT EXISTS (
+        SELECT 1 FROM pg_attribute
+        WHERE attrelid = 'sublocation_rollup'::regclass AND attname = 'region_id' AND NOT attisdropped
+    ) THEN
+        DROP MATERIALIZED VIEW sublocation_rollup;
+    END IF;
+END $$;
+
+-- One row per sublocation for the map: unioned/simplified geometry, population-weighted
+-- accessibility and water point counts. Duplicate statistics rows are collapsed before weighting.
+CREATE MATERIALIZED VIEW IF NOT EXISTS sublocation_rollup AS
+WITH stats AS (
+    SELECT
+        region_id,
+        sublocation_name,
+        SUM(avg_combined_accessibility * total_population) / NULLIF(SUM(total_population), 0) as weighted_accessibility,
+        AVG(avg_combined_accessibility) as mean_accessibility,
+        SUM(total_population) as total_population
+    FROM (
+        SELECT DISTINCT region_id, sublocation_name, avg_combined_accessibility, total_population
+        FROM sublocation_statistics
+    ) distinct_stats
+    GROUP BY region_id, sublocation_name
+),
+shapes AS (
+    SELECT region_id, slname, ST_Multi(ST_Union(geom)) as geom
+    FROM sublocations
+    WHERE geom IS NOT NULL AND slname IS NOT NULL
+    GROUP BY region_id, slname
+),
+points AS (
+    SELECT
+        sh.region_id,
+        sh.slname,
+        COUNT(w.id) as water_points,
+        COUNT(w.id) FILTER (WHERE w.capacitysc = 3) as high_capacity_water_points,
+        COUNT(w.id) FILTER (WHERE w.capacitysc = 2) as medium_capacity_water_points,
+        COUNT(w.id) FILTER (WHERE w.capacitysc = 1) as low_capacity_water_points
+    FROM shapes sh
+    LEFT JOIN waterpoints w
+        ON w.region_id = sh.region_id AND ST_Intersects(sh.geom, ST_Transform(w.geom, ST_SRID(sh.geom)))
+    GROUP BY sh.region_id, sh.slname
+),
+rolled AS (
+    SELECT
+        sh.region_id,
+        sh.slname as sublocation_name,
+        COALESCE(st.weighted_accessibility, st.mean_accessibility) as accessibility,
+        COALESCE(st.total_population, 0)::integer as total_population,
+        p.water_points,
+        p.high_capacity_water_points,
+        p.medium_capacity_water_points,
+        p.low_capacity_water_points,
+        ST_Transform(sh.geom, 4326) as geom
+    FROM shapes sh
+    JOIN points p ON p.region_id = sh.region_id AND p.slname = sh.slname
+    LEFT JOIN stats st ON st.region_id = sh.region_id AND st.sublocation_name = sh.slname
+)
+SELECT
+    region_id,
+    sublocation_name,
+    COALESCE(accessibility, 0) as accessibility_score,
+    CASE
+        WHEN accessibility IS NULL THEN 'Unknown'
+        WHEN accessibility < 1.0 THEN 'Very Weak'
+        WHEN accessibility < 1.2 THEN 'Weak'
+        WHEN accessibility < 1.5 THEN 'Good'
+        ELSE 'Very Good'
+    END as accessibility_category,
+    total_population,
+    water_points,
+    high_capacity_water_points,
+    medium_capacity_water_points,
+    low_capacity_water_points,
+    geom,
+    ST_AsGeoJSON(ST_SimplifyPreserveTopology(geom, 0.0001)) as geojson
+FROM rolled;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_sublocation_rollup_region_name ON sublocation_rollup(region_id, sublocation_name);
+CREATE INDEX IF NOT EXISTS idx_sublocation_rollup_geom ON sublocation_rollup USING GIST(region_id, geom);
+
+-- The rollup is refreshed once per import, not by per-statement triggers (which would rebuild
+-- the whole rollup under an exclusive lock on every write). Importers end their transaction with
+--     REFRESH MATERIALIZED VIEW CONCURRENTLY sublocation_rollup;
+-- so the rollup changes at the same commit as the rows and their change notification, and the
+-- map keeps reading the previous rollup meanwhile (CONCURRENTLY needs the unique index above).
+-- Ad-hoc edits made outside an importer need the same statement, then POST /api/snapshot/refresh
+-- (or the next fingerprint poll, which tracks the rollup's xmin) before the map reflects them.
 
 -- Insert sample data for testing (replace with your actual data)
 INSERT INTO sublocation_statistics (sublocation_name, avg_combined_accessibility, total_population, water_points_count, high_capacity_water_points, medium_capacity_water_points, low_capacity_water_points) VALUES
@@ -54,6 +231,12 @@ INSERT INTO sublocation_statistics (sublocation_name, avg_combined_accessibility
 ('KIAMBERE', 1.34, 4120, 5, 2, 2, 1)
 ON CONFLICT DO NOTHING;
 
+-- Bring an existing rollup up to date with rows written since it was last refreshed
+REFRESH MATERIALIZED VIEW sublocation_rollup;
+
+COMMENT ON TABLE regions IS 'Study areas; data rows and backend caches are partitioned by region_id';
 COMMENT ON TABLE sublocation_statistics IS 'Pre-computed water accessibility statistics for each sublocation';
 COMMENT ON TABLE sublocations IS 'Geographic boundaries of sublocations with spatial data';
-COMMENT ON TABLE waterpoints IS 'Water infrastructure points with capacity ratings';
\ No newline at end of file
+COMMENT ON TABLE waterpoints IS 'Water infrastructure points with capacity ratings';
+COMMENT ON TABLE demand_points IS 'Population demand points used by the SCM-G2SFCA accessibility engine';
+COMMENT ON MATERIALIZED VIEW sublocation_rollup IS 'Per-sublocation map rollup; refresh it (CONCURRENTLY) once after each data import';
\ No newline at end of file
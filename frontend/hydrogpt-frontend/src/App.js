@@ -3,6 +3,13 @@ import axios from 'axios';
 import './App.css';
 
 const API_BASE_URL = process.env.REACT_APP_API_URL || 'http://localhost:8000';
+// Study area to show; unset uses the backend's DEFAULT_REGION
+const REGION = process.env.REACT_APP_REGION || undefined;
+
+// One conversation per page load; the backend keeps its history for follow-up questions
+const SESSION_ID = (window.crypto && window.crypto.randomUUID)
+  ? window.crypto.randomUUID()
+  : `${Date.now()}-${Math.random().toString(36).slice(2)}`;
 
 function App() {
   const [mapData, setMapData] = useState(null);
@@ -49,7 +56,7 @@ function App() {
 
   const loadMapData = async () => {
     try {
-      const response = await axios.get(`${API_BASE_URL}/api/default-map-data`);
+      const response = await axios.get(`${API_BASE_URL}/api/default-map-data`, { params: { region: REGION } });
       setMapData(response.data);
       console.log('✅ Map data loaded:', response.data.features?.length, 'sublocations');
     } catch (error) {
@@ -64,7 +71,7 @@ function App() {
 
   const loadWaterPoints = async () => {
     try {
-      const response = await axios.get(`${API_BASE_URL}/api/water-points`);
+      const response = await axios.get(`${API_BASE_URL}/api/water-points`, { params: { region: REGION } });
       setWaterPointsData(response.data);
       console.log('✅ Water points loaded:', response.data.features?.length, 'points');
     } catch (error) {
@@ -72,6 +79,129 @@ function App() {
     }
   };
 
+  // Apply a complete query result; instructions already applied while streaming are skipped
+  const applyQueryResult = (result, message, applied = {}) => {
+    // Handle AI-controlled map and chart instructions
+    if (result.map_instructions) {
+      if (!applied.map_instructions) {
+        console.log('🗺️ Received map instructions from backend:', result.map_instructions);
+        handleMapInstructions(result.map_instructions);
+      }
+    } else {
+      console.log('❌ No map instructions received from backend');
+    }
+    
+    if (result.chart_instructions && !applied.chart_instructions) {
+      handleChartInstructions(result.chart_instructions);
+    }
+
+    // Extract proactive suggestions from AI response
+    if (result.proactive_suggestions) {
+      setAiSuggestions(result.proactive_suggestions);
+    }
+
+    // Extract and display spatial context
+    if (result.spatial_context) {
+      setSpatialContext(result.spatial_context);
+    }
+
+    // Show confidence level in UI (for transparency)
+    if (result.confidence_level === 'low') {
+      console.log('AI has low confidence in this response');
+    }
+    
+    // Fallback: Generate chart for certain keywords if no explicit instructions
+    if (!result.chart_instructions && (
+        message.toLowerCase().includes('worst') || 
+        message.toLowerCase().includes('statistics') || 
+        message.toLowerCase().includes('ranking') ||
+        message.toLowerCase().includes('compare') ||
+        message.toLowerCase().includes('chart') ||
+        message.toLowerCase().includes('areas'))) {
+      generateChart();
+    }
+  };
+
+  // Stream the answer over Server-Sent Events so the map can react before the prose finishes
+  const streamQuery = async (message) => {
+    const response = await fetch(`${API_BASE_URL}/api/query/stream`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ query: message, user_id: 'hydrogpt_user', session_id: SESSION_ID, region: REGION })
+    });
+    if (!response.ok || !response.body) {
+      throw new Error(`Streaming request failed with status ${response.status}`);
+    }
+
+    const messageId = `stream-${Date.now()}`;
+    const applied = {};
+    let started = false;
+    let text = '';
+
+    const updateBotMessage = (fields) => {
+      if (!started) {
+        started = true;
+        setChatMessages(prev => [...prev, {
+          id: messageId,
+          type: 'bot',
+          message: '',
+          timestamp: new Date().toISOString(),
+          ...fields
+        }]);
+      } else {
+        setChatMessages(prev => prev.map(msg => msg.id === messageId ? { ...msg, ...fields } : msg));
+      }
+    };
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      let boundary;
+      while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+        const rawEvent = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+
+        let eventName = 'message';
+        let data = '';
+        rawEvent.split('\n').forEach(line => {
+          if (line.startsWith('event:')) eventName = line.slice(6).trim();
+          if (line.startsWith('data:')) data += line.slice(5).trim();
+        });
+        const payload = data ? JSON.parse(data) : null;
+
+        if (eventName === 'text') {
+          text += payload.delta;
+          updateBotMessage({ message: text });
+        } else if (eventName === 'map_instructions') {
+          console.log('🗺️ Streamed map instructions:', payload);
+          applied.map_instructions = true;
+          handleMapInstructions(payload);
+        } else if (eventName === 'chart_instructions') {
+          applied.chart_instructions = true;
+          handleChartInstructions(payload);
+        } else if (eventName === 'done') {
+          updateBotMessage({
+            message: payload.text_response,
+            timestamp: payload.timestamp || new Date().toISOString(),
+            confidence: payload.confidence_level || 'medium',
+            spatial_context: payload.spatial_context
+          });
+          applyQueryResult(payload, message, applied);
+          return;
+        } else if (eventName === 'error') {
+          throw new Error(payload.detail);
+        }
+      }
+    }
+    throw new Error('Stream ended before the response was complete');
+  };
+
   const handleSendMessage = async (message) => {
     if (!message.trim() || isLoading) return;
 
@@ -88,58 +218,28 @@ function App() {
     setTimeout(() => scrollToBottom(), 50);
 
     try {
-      const response = await axios.post(`${API_BASE_URL}/api/query`, {
-        query: message.trim(),
-        user_id: 'hydrogpt_user'
-      });
-
-      const result = response.data;
-
-      const botMessage = {
-        type: 'bot',
-        message: result.text_response,
-        timestamp: result.timestamp || new Date().toISOString(),
-        confidence: result.confidence_level || 'medium',
-        spatial_context: result.spatial_context
-      };
-      setChatMessages(prev => [...prev, botMessage]);
-
-      // Handle AI-controlled map and chart instructions
-      if (result.map_instructions) {
-        console.log('🗺️ Received map instructions from backend:', result.map_instructions);
-        handleMapInstructions(result.map_instructions);
+      if (window.ReadableStream && window.TextDecoder) {
+        await streamQuery(message.trim());
       } else {
-        console.log('❌ No map instructions received from backend');
-      }
-      
-      if (result.chart_instructions) {
-        handleChartInstructions(result.chart_instructions);
-      }
+        const response = await axios.post(`${API_BASE_URL}/api/query`, {
+          query: message.trim(),
+          user_id: 'hydrogpt_user',
+          session_id: SESSION_ID,
+          region: REGION
+        });
 
-      // Extract proactive suggestions from AI response
-      if (result.proactive_suggestions) {
-        setAiSuggestions(result.proactive_suggestions);
-      }
+        const result = response.data;
 
-      // Extract and display spatial context
-      if (result.spatial_context) {
-        setSpatialContext(result.spatial_context);
-      }
+        const botMessage = {
+          type: 'bot',
+          message: result.text_response,
+          timestamp: result.timestamp || new Date().toISOString(),
+          confidence: result.confidence_level || 'medium',
+          spatial_context: result.spatial_context
+        };
+        setChatMessages(prev => [...prev, botMessage]);
 
-      // Show confidence level in UI (for transparency)
-      if (result.confidence_level === 'low') {
-        console.log('AI has low confidence in this response');
-      }
-      
-      // Fallback: Generate chart for certain keywords if no explicit instructions
-      if (!result.chart_instructions && (
-          message.toLowerCase().includes('worst') || 
-          message.toLowerCase().includes('statistics') || 
-          message.toLowerCase().includes('ranking') ||
-          message.toLowerCase().includes('compare') ||
-          message.toLowerCase().includes('chart') ||
-          message.toLowerCase().includes('areas'))) {
-        generateChart();
+        applyQueryResult(result, message);
       }
 
     } catch (error) {